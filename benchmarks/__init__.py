@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Бенчмарки не обращаются к настоящему Telegram и не требуют заполненного .env.
+# SQLite в памяти использует одно соединение на все сессии, поэтому одновременные транзакции
+# воркеров и обработчиков мешали бы друг другу - база создается во временном файле
+os.environ.setdefault("BOT_TOKEN", "1234567890:benchmark")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/rebot_benchmarks.db")
@@ -0,0 +1,128 @@
+"""Разбор очереди update, накопившейся за время простоя бота.
+
+Перед запуском бота в локальную замену Bot API (benchmarks.fake_api) складывается очередь: каждый из users
+пользователей прислал updates_per_user вложений и нажал кнопку меню callbacks раз, а heavy_users из них прислали
+еще по heavy_updates вложений. Бот собирается через create_bot() и разбирает очередь через getUpdates, публикации
+отправляют воркеры очереди. Ограничения частоты запросов к Bot API сняты, чтобы упираться в разбор update.
+
+Печатает время разбора очереди и скорость в update/с, сколько update пропущено из-за лимита очереди пользователя
+(USER_QUEUE_LIMIT) и как устаревшие нажатия кнопок, сколько пользователей получили просьбу не торопиться,
+и наибольшее количество update в обработке и задач в цикле событий. Запуск с --unbounded снимает ограничения
+(MAX_PENDING_UPDATES и USER_QUEUE_LIMIT) для сравнения.
+
+Запуск: python -m benchmarks.catch_up --users 200 --heavy-users 5 --heavy-updates 300 --callbacks 5
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import time
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+
+from benchmarks import end_to_end
+from benchmarks.fake_api import FakeBotApi
+from src import backlog, bot, metrics, outbox, settings, update_processor
+from src.constants import callback_data
+from src.db import base
+
+
+def make_callbacks(users: int, callbacks: int, first_update_id: int) -> list[dict]:
+    """Нажатия кнопки главного меню каждым пользователем callbacks раз подряд."""
+    update_ids = itertools.count(first_update_id)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    updates = []
+    for _ in range(callbacks):
+        for account_id in range(1, users + 1):
+            update_id = next(update_ids)
+            user = User(account_id, f"user {account_id}", is_bot=False)
+            message = Message(message_id=1, date=now, chat=Chat(account_id, Chat.PRIVATE), from_user=user)
+            query = CallbackQuery(
+                str(update_id),
+                user,
+                str(account_id),
+                message=message,
+                data=callback_data.CALLBACK_USER_CHANNELS,
+            )
+            updates.append(Update(update_id, callback_query=query).to_dict())
+    return updates
+
+
+def make_backlog(args: argparse.Namespace) -> list[dict]:
+    updates = end_to_end.make_updates(args.users, args.updates_per_user, {"photo": 1}, args.seed)
+    heavy = end_to_end.make_updates(args.heavy_users, args.heavy_updates, {"photo": 1}, args.seed)
+    for payload in heavy:
+        # Номер сообщения совпадает с номером update, чтобы публикации можно было сопоставить с update
+        payload["update_id"] += len(updates)
+        payload["message"]["message_id"] = payload["update_id"]
+        payload["message"]["photo"][0]["file_id"] = str(payload["update_id"])
+    updates += heavy
+    return updates + make_callbacks(args.users, args.callbacks, len(updates) + 1)
+
+
+async def main(args: argparse.Namespace) -> None:
+    await end_to_end.populate(args.users, args.channels, True)
+    payloads = make_backlog(args)
+    api = FakeBotApi(args.latency, seed=args.seed)
+    config = settings.get_settings()
+    config.BOT_API_BASE_URL = api.start(args.api_port)
+    config.RATE_LIMIT_GLOBAL_PER_SECOND = 1000000
+    config.RATE_LIMIT_CHANNEL_PER_MINUTE = 1000000
+    if args.unbounded:
+        config.MAX_PENDING_UPDATES = config.USER_QUEUE_LIMIT = len(payloads)
+    for payload in payloads:
+        api.push_update(payload)
+    monitor = backlog.BacklogMonitor(args.check_interval, catch_up_threshold=1)
+    application = bot.create_bot()
+    peak_pending = peak_tasks = 0
+    async with application:
+        await application.start()
+        await outbox.start_workers(application)
+        monitor.start(application)
+        started = time.perf_counter()
+        await application.updater.start_polling(timeout=10)
+        deadline = started + args.timeout
+        while metrics.updates_processed.value() < len(payloads) and time.perf_counter() < deadline:
+            peak_pending = max(peak_pending, application.update_queue.pending)
+            peak_tasks = max(peak_tasks, len(asyncio.all_tasks()))
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        await monitor.check(application)
+        await monitor.stop()
+        await application.updater.stop()
+        await outbox.stop_workers(application)
+        await application.stop()
+    await api.stop()
+
+    processed = metrics.updates_processed.value()
+    slowed_down = {sent.chat_id for sent in api.sent if sent.arguments.get("text") == update_processor.SLOW_DOWN_TEXT}
+    print(
+        f"database={base.get_engine().dialect.name} users={args.users} heavy_users={args.heavy_users} "
+        f"updates={len(payloads)} max_pending={config.MAX_PENDING_UPDATES} "
+        f"user_queue_limit={config.USER_QUEUE_LIMIT}",
+    )
+    print(f"drained          {processed:.0f} of {len(payloads)} in {elapsed:.1f} s")
+    print(f"updates/s        {processed / elapsed:.0f}")
+    print(f"posts            {len(end_to_end.media_posts(api))}")
+    print(f"user queue full  {metrics.updates_shed.value(reason='user_queue_full'):.0f}")
+    print(f"stale callbacks  {metrics.updates_shed.value(reason='stale_callback'):.0f}")
+    print(f"slowed down      {len(slowed_down)} users")
+    print(f"peak pending     {peak_pending}")
+    print(f"peak tasks       {peak_tasks}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=2, help="каналов у каждого пользователя")
+    parser.add_argument("--updates-per-user", type=int, default=3)
+    parser.add_argument("--heavy-users", type=int, default=5)
+    parser.add_argument("--heavy-updates", type=int, default=300, help="дополнительных вложений от каждого")
+    parser.add_argument("--callbacks", type=int, default=5, help="нажатий кнопки меню от каждого пользователя")
+    parser.add_argument("--unbounded", action="store_true", help="без MAX_PENDING_UPDATES и USER_QUEUE_LIMIT")
+    parser.add_argument("--check-interval", type=float, default=1, help="как часто проверять очередь, секунды")
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка сети в одну сторону, секунды")
+    parser.add_argument("--timeout", type=float, default=300, help="сколько секунд ждать разбора очереди")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+"""Время от запуска процесса бота до первой публикации (холодный старт) и время его остановки.
+
+Бот запускается отдельным процессом через run_pulling.py с локальной заменой Bot API (benchmarks.fake_api),
+в которой его уже ждет update с вложением от пользователя с channels каналами. Замеряется время от запуска
+процесса до первого запроса getUpdates (импорт модулей, загрузка состояния, прогрев пула соединений с БД)
+и до первой публикации в канал. После этого процессу отправляется SIGTERM и замеряется, сколько заняла остановка.
+
+Замер повторяется runs раз для каждого значения DB_POOL_WARMUP из --warmup, печатаются медианы. Для SQLite
+открытие соединения стоит доли миллисекунды, разницу прогрев дает для Postgres: укажите DATABASE_URL
+пустой базы (postgresql+asyncpg://...), таблицы бота в ней пересоздаются.
+
+Запуск: python -m benchmarks.cold_start --warmup 0 5 --runs 5
+"""
+import argparse
+import asyncio
+import os
+import pathlib
+import signal
+import statistics
+import sys
+import time
+
+from benchmarks import end_to_end
+from benchmarks.fake_api import FakeBotApi
+from src.db import base
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+async def run_once(warmup: int, args: argparse.Namespace) -> tuple[float, float, float]:
+    """Возвращает время до первого getUpdates, до первой публикации и время остановки, секунды."""
+    await end_to_end.populate(1, args.channels, True)
+    await base.dispose()
+    api = FakeBotApi(args.latency)
+    environment = {**os.environ, "BOT_API_BASE_URL": api.start(args.api_port), "DB_POOL_WARMUP": str(warmup)}
+    for payload in end_to_end.make_updates(1, 1, {"photo": 1}, 1):
+        api.push_update(payload)
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(sys.executable, "run_pulling.py", cwd=ROOT, env=environment)
+    first_poll = first_post = None
+    deadline = started + args.timeout
+    while first_post is None and time.perf_counter() < deadline and process.returncode is None:
+        await asyncio.sleep(0.005)
+        if first_poll is None and api.requests["getUpdates"]:
+            first_poll = time.perf_counter() - started
+        if end_to_end.media_posts(api):
+            first_post = end_to_end.media_posts(api)[0][0].sent_at - started
+    if first_post is None:
+        raise SystemExit(f"Бот не опубликовал вложение за {args.timeout} с, код завершения {process.returncode}")
+    stopping = time.perf_counter()
+    process.send_signal(signal.SIGTERM)
+    await process.wait()
+    stopped = time.perf_counter() - stopping
+    await api.stop()
+    return first_poll, first_post, stopped
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"database={base.get_engine().dialect.name} channels={args.channels} runs={args.runs}")
+    print(f"{'warmup':>6} {'getUpdates, ms':>15} {'first post, ms':>15} {'shutdown, ms':>13}")
+    for warmup in args.warmup:
+        results = [await run_once(warmup, args) for _ in range(args.runs)]
+        poll, post, stop = (statistics.median(values) * 1000 for values in zip(*results))
+        print(f"{warmup:>6} {poll:>15.0f} {post:>15.0f} {stop:>13.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--warmup", type=int, nargs="+", default=[0, 5], help="значения DB_POOL_WARMUP")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка сети в одну сторону, секунды")
+    parser.add_argument("--timeout", type=float, default=60, help="сколько секунд ждать первую публикацию")
+    parser.add_argument("--api-port", type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,181 @@
+"""Сквозной нагрузочный тест: update с вложениями от пользователей до публикаций в каналах.
+
+Бот собирается через create_bot() и получает update через getUpdates от локальной замены Bot API
+(benchmarks.fake_api), публикации отправляют воркеры очереди. Каждый из users пользователей привязан
+к channels своим каналам и присылает updates_per_user вложений в пропорции media mix.
+
+Печатает количество публикаций в секунду и запросов к Bot API, которыми они отправлены, p50/p99 задержки
+от появления update до публикации в канале и количество запросов к БД на один update. Если какие-то публикации
+отправлены повторно, завершается с ошибкой.
+
+По умолчанию используется SQLite во временном файле. Для Postgres укажите DATABASE_URL пустой базы
+(postgresql+asyncpg://...): таблицы бота в ней пересоздаются.
+
+Запуск: python -m benchmarks.end_to_end --users 20 --channels 5 --updates-per-user 5 --mix photo=6 video=3 animation=1
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import random
+import time
+
+from sqlalchemy import event
+from telegram import Animation, Chat, Document, Message, PhotoSize, Update, User, Video
+
+from benchmarks.fake_api import FakeBotApi, SentMessage, message_ids
+from benchmarks.ingress import percentile
+from src import bot, outbox, settings
+from src.constants import constants
+from src.db import base, models
+
+
+def channel_id(account_id: int, number: int) -> int:
+    return -1000000000000 - account_id * 1000 - number
+
+
+async def populate(users: int, channels: int, description: bool) -> None:
+    async with base.get_engine().begin() as connection:
+        await connection.run_sync(models.Base.metadata.drop_all)
+        await connection.run_sync(models.Base.metadata.create_all)
+    async with base.async_session() as session, session.begin():
+        for account_id in range(1, users + 1):
+            user = models.User(account_id=account_id, first_name=f"user {account_id}")
+            user.channels = [
+                models.Bind(
+                    channel=models.Channel(channel_id=channel_id(account_id, number), title=f"channel {number}"),
+                    description=f"description {number}" if description else None,
+                )
+                for number in range(channels)
+            ]
+            session.add(user)
+
+
+def make_media(media_type: str, file_id: str) -> dict:
+    if media_type == constants.MEDIA_PHOTO:
+        return {"photo": [PhotoSize(file_id, file_id, 1280, 720)]}
+    if media_type == constants.MEDIA_VIDEO:
+        return {"video": Video(file_id, file_id, 1280, 720, 10)}
+    if media_type == constants.MEDIA_DOCUMENT:
+        return {"document": Document(file_id, file_id)}
+    return {"animation": Animation(file_id, file_id, 320, 240, 3)}
+
+
+def make_updates(users: int, updates_per_user: int, mix: dict[str, float], seed: int) -> list[dict]:
+    """Update с вложениями пользователей вперемешку. file_id вложения и номер сообщения совпадают с номером update."""
+    rng = random.Random(seed)
+    update_ids = itertools.count(1)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    updates = []
+    for _ in range(updates_per_user):
+        for account_id in range(1, users + 1):
+            update_id = next(update_ids)
+            media_type = rng.choices(list(mix), weights=list(mix.values()))[0]
+            message = Message(
+                message_id=update_id,
+                date=now,
+                chat=Chat(account_id, Chat.PRIVATE),
+                from_user=User(account_id, f"user {account_id}", is_bot=False),
+                **make_media(media_type, str(update_id)),
+            )
+            updates.append(Update(update_id, message=message).to_dict())
+    return updates
+
+
+def media_posts(api: FakeBotApi) -> list[tuple[SentMessage, int]]:
+    """Публикации в каналы парами (запрос, номер update). copyMessages публикует сразу несколько update."""
+    posts = []
+    for sent in api.sent:
+        if sent.method == "copyMessage":
+            posts.append((sent, int(sent.arguments["message_id"])))
+        elif sent.method == "copyMessages":
+            posts.extend((sent, message_id) for message_id in message_ids(sent.arguments))
+    return posts
+
+
+async def wait_posts(api: FakeBotApi, expected: int, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while len(media_posts(api)) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def main(args: argparse.Namespace) -> None:
+    await populate(args.users, args.channels, not args.without_description)
+    payloads = make_updates(args.users, args.updates_per_user, dict(args.mix), args.seed)
+    api = FakeBotApi(args.latency, args.error_rate, args.retry_after_rate, seed=args.seed)
+    config = settings.get_settings()
+    config.BOT_API_BASE_URL = api.start(args.api_port)
+    config.RATE_LIMIT_GLOBAL_PER_SECOND = args.global_per_second
+    config.RATE_LIMIT_CHANNEL_PER_MINUTE = args.channel_per_minute
+    application = bot.create_bot()
+    queries = 0
+
+    def count_query(*_) -> None:
+        nonlocal queries
+        queries += 1
+
+    pushed: dict[int, float] = {}
+    async with application:
+        await application.start()
+        await outbox.start_workers(application)
+        await application.updater.start_polling(timeout=10)
+        event.listen(base.get_engine().sync_engine, "before_cursor_execute", count_query)
+        started = time.perf_counter()
+        for payload in payloads:
+            pushed[payload["update_id"]] = time.perf_counter()
+            api.push_update(payload)
+            await asyncio.sleep(1 / args.rate)
+        await wait_posts(api, len(payloads) * args.channels, args.timeout)
+        event.remove(base.get_engine().sync_engine, "before_cursor_execute", count_query)
+        await application.updater.stop()
+        await outbox.stop_workers(application)
+        await application.stop()
+    await api.stop()
+
+    posts = media_posts(api)
+    duplicates = len(posts) - len({(sent.chat_id, update_id) for sent, update_id in posts})
+    delays = [sent.sent_at - pushed[update_id] for sent, update_id in posts]
+    elapsed = max(sent.sent_at for sent, _ in posts) - started
+    print(
+        f"database={base.get_engine().dialect.name} users={args.users} channels={args.channels} "
+        f"updates={len(payloads)} latency={args.latency * 1000:.0f} ms errors={args.error_rate:.0%} "
+        f"429={args.retry_after_rate:.0%}",
+    )
+    print(f"posts            {len(posts)} of {len(payloads) * args.channels}, duplicates {duplicates}")
+    print(f"posts/s          {len(posts) / elapsed:.1f}")
+    print(f"post requests    {len({id(sent) for sent, _ in posts})}")
+    print(f"p50 latency, ms  {percentile(delays, 50) * 1000:.0f}")
+    print(f"p99 latency, ms  {percentile(delays, 99) * 1000:.0f}")
+    print(f"queries/update   {queries / len(payloads):.1f}")
+    print(f"api errors       {dict(api.errors)}")
+    if duplicates:
+        raise SystemExit(f"Публикации отправлены повторно: {duplicates}")
+
+
+def media_weight(value: str) -> tuple[str, float]:
+    media_type, weight = value.split("=")
+    return media_type, float(weight)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--channels", type=int, default=5, help="каналов у каждого пользователя")
+    parser.add_argument("--updates-per-user", type=int, default=5)
+    parser.add_argument("--mix", type=media_weight, nargs="+", default=[("photo", 6), ("video", 3), ("animation", 1)])
+    parser.add_argument(
+        "--without-description",
+        action="store_true",
+        help="каналы без текста: публикации одного пользователя объединяются в copyMessages",
+    )
+    parser.add_argument("--rate", type=float, default=50, help="update в секунду")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка сети в одну сторону, секунды")
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--retry-after-rate", type=float, default=0.01)
+    config = settings.get_settings()
+    parser.add_argument("--global-per-second", type=float, default=config.RATE_LIMIT_GLOBAL_PER_SECOND)
+    parser.add_argument("--channel-per-minute", type=float, default=config.RATE_LIMIT_CHANNEL_PER_MINUTE)
+    parser.add_argument("--timeout", type=float, default=120, help="сколько секунд ждать все публикации")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,245 @@
+"""Локальная замена Bot API для запуска бота без обращения к Telegram.
+
+Отвечает на методы, которые вызывает бот: getMe, getUpdates, getWebhookInfo, setWebhook, sendMessage, copyMessage,
+copyMessages, sendMediaGroup, getChatAdministrators, getChatMember и т.д. Update для getUpdates добавляются
+через push_update. Каждый запрос и каждый ответ задерживаются на latency секунд - время передачи по сети в одну
+сторону. Методы отправки с вероятностью error_rate отвечают 502 Bad Gateway, с вероятностью retry_after_rate -
+429 Too Many Requests с retry_after секунд, в каналы из kicked - 403 Forbidden. Все успешные отправки
+запоминаются в sent.
+
+Запуск отдельно, например для проверки run_webhook.py или run_pulling.py с BOT_API_BASE_URL=http://127.0.0.1:8081/bot:
+python -m benchmarks.fake_api --port 8081
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+
+BOT_USER = {"id": 1234567890, "is_bot": True, "first_name": "ReBot", "username": "rebot_benchmark_bot"}
+SEND_METHODS = frozenset(
+    ("sendMessage", "sendPhoto", "sendVideo", "sendAnimation", "sendMediaGroup", "copyMessage", "copyMessages"),
+)
+ADMIN_RIGHTS = (
+    "can_manage_chat",
+    "can_delete_messages",
+    "can_manage_video_chats",
+    "can_restrict_members",
+    "can_promote_members",
+    "can_change_info",
+    "can_invite_users",
+    "can_post_messages",
+    "can_edit_messages",
+)
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, description: str, parameters: dict | None = None) -> None:
+        self.status = status
+        self.description = description
+        self.parameters = parameters
+        super().__init__(description)
+
+
+@dataclass(frozen=True)
+class SentMessage:
+    """Успешный вызов метода отправки."""
+
+    sent_at: float
+    method: str
+    chat_id: int
+    arguments: dict
+
+
+class _MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api: "FakeBotApi") -> None:
+        self.api = api
+
+    async def post(self, token: str, method: str) -> None:
+        arguments = {name: self.get_body_argument(name) for name in self.request.body_arguments}
+        if self.request.headers.get("Content-Type", "").startswith("application/json") and self.request.body:
+            arguments.update(json.loads(self.request.body))
+        self.set_header("Content-Type", "application/json")
+        try:
+            result = await self.api.call(method, arguments)
+        except ApiError as error:
+            self.set_status(error.status)
+            body = {"ok": False, "error_code": error.status, "description": error.description}
+            if error.parameters:
+                body["parameters"] = error.parameters
+            self.write(json.dumps(body))
+            return
+        self.write(json.dumps({"ok": True, "result": result}))
+
+    get = post
+
+
+class FakeBotApi:
+    """Bot API, который отвечает на методы бота и раздает update через long polling."""
+
+    def __init__(
+        self,
+        latency: float = 0,
+        error_rate: float = 0,
+        retry_after_rate: float = 0,
+        retry_after: int = 1,
+        seed: int | None = None,
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.requests: collections.Counter[str] = collections.Counter()
+        self.errors: collections.Counter[int] = collections.Counter()
+        self.sent: list[SentMessage] = []
+        # chat_id канала -> account_id администраторов для getChatAdministrators
+        self.admins: dict[int, list[int]] = {}
+        # Каналы, из которых удален бот: отправка в них отвечает 403 Forbidden
+        self.kicked: set[int] = set()
+        # Сообщения, которые пользователи удалили из чата с ботом: их копирование отвечает 400 Bad Request
+        self.deleted: set[int] = set()
+        self._random = random.Random(seed)
+        self._message_ids = itertools.count(1)
+        self._updates: list[dict] = []
+        self._new_updates = asyncio.Event()
+        self._calls: set[asyncio.Task] = set()
+        self._server: HTTPServer | None = None
+
+    def push_update(self, update: dict) -> None:
+        self._updates.append(update)
+        self._new_updates.set()
+
+    async def call(self, method: str, arguments: dict[str, Any]) -> Any:
+        self.requests[method] += 1
+        task = asyncio.current_task()
+        self._calls.add(task)
+        task.add_done_callback(self._calls.discard)
+        await asyncio.sleep(self.latency)
+        try:
+            return await self._call(method, arguments)
+        finally:
+            await asyncio.sleep(self.latency)
+
+    async def _call(self, method: str, arguments: dict[str, Any]) -> Any:
+        if method == "getMe":
+            return BOT_USER
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": len(self._updates)}
+        if method == "getUpdates":
+            return await self._get_updates(int(arguments.get("offset") or 0), float(arguments.get("timeout") or 0))
+        if method == "getChatAdministrators":
+            return [
+                {"status": "administrator" if number else "creator", "user": _user(account_id), "is_anonymous": False}
+                for number, account_id in enumerate(self.admins.get(int(arguments["chat_id"]), []))
+            ]
+        if method == "getChatMember":
+            return self._bot_member(int(arguments["chat_id"]))
+        if method in SEND_METHODS:
+            return self._send(method, arguments)
+        return True
+
+    def _bot_member(self, chat_id: int) -> dict:
+        if chat_id in self.kicked:
+            return {"status": "kicked", "user": BOT_USER, "until_date": 0}
+        rights = dict.fromkeys(ADMIN_RIGHTS, True)
+        return {"status": "administrator", "user": BOT_USER, "can_be_edited": False, "is_anonymous": False, **rights}
+
+    def _send(self, method: str, arguments: dict[str, Any]) -> Any:
+        draw = self._random.random()
+        if draw < self.retry_after_rate:
+            self.errors[429] += 1
+            raise ApiError(
+                429,
+                f"Too Many Requests: retry after {self.retry_after}",
+                {"retry_after": self.retry_after},
+            )
+        if draw < self.retry_after_rate + self.error_rate:
+            self.errors[502] += 1
+            raise ApiError(502, "Bad Gateway")
+        chat_id = int(arguments["chat_id"])
+        if chat_id in self.kicked:
+            self.errors[403] += 1
+            raise ApiError(403, "Forbidden: bot was kicked from the channel chat")
+        if self.deleted.intersection(_copied(method, arguments)):
+            self.errors[400] += 1
+            raise ApiError(400, "Bad Request: message to copy not found")
+        self.sent.append(SentMessage(time.perf_counter(), method, chat_id, arguments))
+        if method == "copyMessage":
+            return {"message_id": next(self._message_ids)}
+        if method == "copyMessages":
+            return [{"message_id": next(self._message_ids)} for _ in message_ids(arguments)]
+        if method == "sendMediaGroup":
+            return [self._message(chat_id) for _ in json.loads(arguments["media"])]
+        return self._message(chat_id)
+
+    def _message(self, chat_id: int) -> dict:
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "channel", "title": f"channel {chat_id}"}
+        return {"message_id": next(self._message_ids), "date": int(time.time()), "chat": chat}
+
+    async def _get_updates(self, offset: int, timeout: float) -> list[dict]:
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return list(self._updates)
+
+    def start(self, port: int, address: str = "127.0.0.1") -> str:
+        """Запускает сервер в текущем цикле событий и возвращает значение для BOT_API_BASE_URL."""
+        # Ответы 429 и 502 ожидаемы и не должны засорять вывод бенчмарков
+        logging.getLogger("tornado.access").setLevel(logging.ERROR)
+        application = tornado.web.Application([(r"/bot([^/]+)/(\w+)", _MethodHandler, {"api": self})])
+        self._server = application.listen(port, address)
+        return f"http://{address}:{port}/bot"
+
+    async def stop(self) -> None:
+        """Останавливает сервер, предварительно ответив на ожидающие getUpdates."""
+        if self._server is not None:
+            self._server.stop()
+            self._new_updates.set()
+            await asyncio.gather(*self._calls, return_exceptions=True)
+            await self._server.close_all_connections()
+
+
+def message_ids(arguments: dict) -> list[int]:
+    """Сообщения из аргументов copyMessages: в запросе-форме список передается строкой JSON."""
+    value = arguments["message_ids"]
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _copied(method: str, arguments: dict) -> list[int]:
+    if method == "copyMessage":
+        return [int(arguments["message_id"])]
+    if method == "copyMessages":
+        return message_ids(arguments)
+    return []
+
+
+def _user(account_id: int) -> dict:
+    return {"id": account_id, "is_bot": False, "first_name": f"user {account_id}"}
+
+
+async def main(args: argparse.Namespace) -> None:
+    api = FakeBotApi(args.latency, args.error_rate, args.retry_after_rate)
+    print(f"BOT_API_BASE_URL={api.start(args.port, args.address)}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0, help="задержка в одну сторону, секунды")
+    parser.add_argument("--error-rate", type=float, default=0, help="доля отправок, на которые ответ 502")
+    parser.add_argument("--retry-after-rate", type=float, default=0, help="доля отправок, на которые ответ 429")
+    asyncio.run(main(parser.parse_args()))
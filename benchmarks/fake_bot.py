@@ -0,0 +1,39 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+
+class FakeBot:
+    """Имитация telegram.Bot: каждый вызов отправки ждет latency секунд и запоминает канал."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.sent: list[int] = []
+        self._message_ids = itertools.count(1)
+
+    async def _send(self, chat_id: int, **kwargs) -> SimpleNamespace:
+        await asyncio.sleep(self.latency)
+        self.sent.append(chat_id)
+        return SimpleNamespace(chat_id=chat_id, message_id=next(self._message_ids))
+
+    async def copy_message(
+        self,
+        chat_id: int,
+        from_chat_id: int,
+        message_id: int,
+        caption: str | None = None,
+    ) -> SimpleNamespace:
+        return await self._send(chat_id)
+
+
+def fake_photo_message(file_id: str = "photo-file-id", message_id: int = 1) -> SimpleNamespace:
+    """Сообщение с фотографией в том виде, в котором его читает services.extract_media."""
+    return SimpleNamespace(
+        message_id=message_id,
+        animation=None,
+        photo=[SimpleNamespace(file_id=file_id, file_unique_id=file_id)],
+        video=None,
+        document=None,
+        audio=None,
+        video_note=None,
+    )
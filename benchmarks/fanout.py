@@ -0,0 +1,68 @@
+"""Сравнение последовательной публикации по каналам с параллельной.
+
+Запуск: python -m benchmarks.fanout --channels 40 --latency 0.05 --concurrency 10
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_bot import FakeBot, fake_photo_message
+from src import fanout, services
+from src.db import models
+
+
+def make_binds(count: int) -> list[models.Bind]:
+    binds = []
+    for number in range(count):
+        bind = models.Bind.new_bind(user_id=1, channel_id=number)
+        bind.channel = models.Channel(channel_id=-1000000000000 - number, title=f"channel {number}")
+        bind.description = "benchmark"
+        binds.append(bind)
+    return binds
+
+
+def make_send(telegram_bot: FakeBot):
+    media = services.extract_media(fake_photo_message())
+
+    async def send(bind: models.Bind) -> None:
+        await services.copy_media(telegram_bot, bind.channel.channel_id, 1, media.message_id, bind.description)
+
+    return send
+
+
+async def sequential(binds: list[models.Bind], telegram_bot: FakeBot) -> None:
+    """Прежний вариант forward_attachment_handler: один канал за другим."""
+    send = make_send(telegram_bot)
+    for bind in binds:
+        await send(bind)
+
+
+async def parallel(binds: list[models.Bind], telegram_bot: FakeBot, concurrency: int) -> None:
+    await fanout.fan_out(binds, make_send(telegram_bot), concurrency)
+
+
+async def measure(name: str, coroutine_factory, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        await coroutine_factory()
+    elapsed = (time.perf_counter() - started) / repeats
+    print(f"{name:<12} {elapsed * 1000:>10.1f} ms")
+    return elapsed
+
+
+async def main(args: argparse.Namespace) -> None:
+    binds = make_binds(args.channels)
+    telegram_bot = FakeBot(args.latency)
+    print(f"channels={args.channels} latency={args.latency * 1000:.0f} ms concurrency={args.concurrency}")
+    before = await measure("sequential", lambda: sequential(binds, telegram_bot), args.repeats)
+    after = await measure("fan_out", lambda: parallel(binds, telegram_bot, args.concurrency), args.repeats)
+    print(f"speedup      {before / after:>10.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--channels", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка одного вызова Bot API, секунды")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""Запросы к БД, время и пик памяти на одно пересланное сообщение: загрузка графа моделей против проекции.
+
+"before" повторяет прежнюю загрузку через lazy="selectin" на всех связях моделей (включая обратные связи),
+"after" - запрос BindRepository.get_targets, которым теперь пользуется services.get_bind_targets.
+Кэш каналов в замере не участвует.
+
+Запуск: python -m benchmarks.forwarding_queries --channels 20 --users-per-channel 5
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import selectinload
+
+from src.db import base, models
+
+
+async def populate(channels: int, users_per_channel: int) -> None:
+    """Пользователь 1 привязан ко всем каналам, к каждому каналу привязаны еще users_per_channel - 1 пользователей."""
+    async with base.get_engine().begin() as connection:
+        await connection.run_sync(models.Base.metadata.drop_all)
+        await connection.run_sync(models.Base.metadata.create_all)
+    async with base.async_session() as session, session.begin():
+        users = [
+            models.User(account_id=account_id, first_name=f"user {account_id}")
+            for account_id in range(1, users_per_channel + 1)
+        ]
+        session.add_all(users)
+        for number in range(channels):
+            channel = models.Channel(channel_id=-1000000000000 - number, title=f"channel {number}")
+            channel.users = [models.Bind(user=user, description="benchmark") for user in users]
+            session.add(channel)
+
+
+async def load_graph(account_id: int) -> list[tuple[int, str, str | None]]:
+    query = (
+        select(models.User)
+        .where(models.User.account_id == account_id)
+        .options(
+            selectinload(models.User.channels).options(
+                selectinload(models.Bind.user),
+                selectinload(models.Bind.channel).selectinload(models.Channel.users).selectinload(models.Bind.user),
+            ),
+        )
+    )
+    async with base.async_session() as session:
+        user = (await session.scalars(query)).one()
+        return [(bind.channel.channel_id, bind.channel.title, bind.description) for bind in user.channels]
+
+
+async def load_projection(account_id: int) -> list[tuple[int, str, str | None]]:
+    return [tuple(row) for row in await base.bind_repository.get_targets(account_id)]
+
+
+async def measure(name: str, load, repeats: int, counter: dict) -> None:
+    """Печатает среднее число запросов, время и пик выделенной памяти на один вызов load."""
+    await load(1)
+    counter["queries"] = 0
+    elapsed = 0.0
+    peaks = 0
+    tracemalloc.start()
+    for _ in range(repeats):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        await load(1)
+        elapsed += time.perf_counter() - started
+        peaks += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    queries = counter["queries"] / repeats
+    print(f"{name:<8} {queries:>8.1f} {elapsed / repeats * 1000:>10.2f} {peaks / repeats / 1024:>12.1f}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    await populate(args.channels, args.users_per_channel)
+    counter = {"queries": 0}
+
+    def count_query(*_) -> None:
+        counter["queries"] += 1
+
+    event.listen(base.get_engine().sync_engine, "before_cursor_execute", count_query)
+    print(f"channels={args.channels} users_per_channel={args.users_per_channel} repeats={args.repeats}")
+    print(f"{'':<8} {'queries':>8} {'ms':>10} {'peak KiB':>12}")
+    await measure("before", load_graph, args.repeats, counter)
+    await measure("after", load_projection, args.repeats, counter)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--users-per-channel", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,139 @@
+"""Задержка доставки update до обработчиков: long polling против webhook.
+
+Бот собирается через create_bot() и работает с локальной заменой Bot API (benchmarks.fake_api), у которой каждое
+сообщение идет по сети latency секунд. В режиме polling update добавляются в очередь getUpdates, в режиме webhook
+отправляются POST-запросом с секретным токеном, как это делает Telegram. Задержка считается от момента, когда
+update появился у Telegram, до вызова обработчика. Для webhook отдельно замеряется время ответа на POST.
+
+Запуск: python -m benchmarks.ingress --updates 500 --rate 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from benchmarks import updates as updates_benchmark
+from benchmarks.fake_api import FakeBotApi
+from src import bot, settings
+
+SECRET_TOKEN = "benchmark-secret"
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def create_application(api_url: str) -> tuple[Application, dict[int, float]]:
+    """Приложение бота, которое запоминает момент получения каждого update."""
+    settings.get_settings().BOT_API_BASE_URL = api_url
+    application = bot.create_bot()
+    received: dict[int, float] = {}
+
+    async def record(update: Update, _) -> None:
+        received[update.update_id] = time.perf_counter()
+
+    application.add_handler(TypeHandler(Update, record), group=-1)
+    return application, received
+
+
+async def wait_received(received: dict[int, float], count: int) -> None:
+    while len(received) < count:
+        await asyncio.sleep(0.01)
+
+
+async def run_polling(api: FakeBotApi, api_url: str, payloads: list[dict], rate: float) -> list[float]:
+    application, received = create_application(api_url)
+    sent: dict[int, float] = {}
+    async with application:
+        await application.start()
+        await application.updater.start_polling(timeout=10)
+        for payload in payloads:
+            sent[payload["update_id"]] = time.perf_counter()
+            api.push_update(payload)
+            await asyncio.sleep(1 / rate)
+        await wait_received(received, len(payloads))
+        await application.updater.stop()
+        await application.stop()
+    return [received[update_id] - sent[update_id] for update_id in sent]
+
+
+async def run_webhook(
+    api_url: str,
+    port: int,
+    payloads: list[dict],
+    rate: float,
+    latency: float,
+) -> tuple[list[float], list[float], int]:
+    application, received = create_application(api_url)
+    sent: dict[int, float] = {}
+    responses: list[float] = []
+    url = f"http://127.0.0.1:{port}/{settings.get_settings().WEBHOOK_PATH}"
+
+    async def post(client: httpx.AsyncClient, payload: dict) -> None:
+        sent[payload["update_id"]] = time.perf_counter()
+        await asyncio.sleep(latency)
+        started = time.perf_counter()
+        response = await client.post(url, json=payload, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN})
+        response.raise_for_status()
+        responses.append(time.perf_counter() - started)
+
+    async with application, httpx.AsyncClient() as client:
+        await application.start()
+        await application.updater.start_webhook(
+            listen="127.0.0.1",
+            port=port,
+            url_path=settings.get_settings().WEBHOOK_PATH,
+            webhook_url=url,
+            secret_token=SECRET_TOKEN,
+        )
+        forbidden = await client.post(url, json=payloads[0], headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        tasks = []
+        for payload in payloads:
+            tasks.append(asyncio.create_task(post(client, payload)))
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+        await wait_received(received, len(payloads))
+        await application.updater.stop()
+        await application.stop()
+    return [received[update_id] - sent[update_id] for update_id in sent], responses, forbidden.status_code
+
+
+def report(name: str, delays: list[float]) -> None:
+    print(
+        f"{name:<16} {statistics.mean(delays) * 1000:>8.1f} {percentile(delays, 50) * 1000:>8.1f} "
+        f"{percentile(delays, 99) * 1000:>8.1f} {max(delays) * 1000:>8.1f}",
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    payloads = [
+        update.to_dict()
+        for update in updates_benchmark.make_updates(args.users, -(-args.updates // args.users))[: args.updates]
+    ]
+    api = FakeBotApi(args.latency)
+    api_url = api.start(args.api_port)
+    polling = await run_polling(api, api_url, payloads, args.rate)
+    webhook, responses, forbidden = await run_webhook(api_url, args.webhook_port, payloads, args.rate, args.latency)
+    await api.stop()
+    print(f"updates={len(payloads)} rate={args.rate:.0f}/s latency={args.latency * 1000:.0f} ms")
+    print(f"{'ms':<16} {'mean':>8} {'p50':>8} {'p99':>8} {'max':>8}")
+    report("polling", polling)
+    report("webhook", webhook)
+    report("webhook answer", responses)
+    print(f"webhook with a wrong secret token: HTTP {forbidden}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=200, help="update в секунду")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка сети в одну сторону, секунды")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8443)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,150 @@
+"""Проверка планов частых запросов к БД: ни один из них не должен читать таблицу целиком.
+
+Запросы не пишутся вручную, а перехватываются при вызове методов репозиториев на заполненной базе
+и выполняются повторно с EXPLAIN. В SQLite ошибкой считается шаг плана "SCAN <таблица>", в Postgres -
+"Seq Scan" при выключенном enable_seqscan (на маленьких таблицах планировщик иначе всегда выбирает его).
+Завершается с кодом 1, если хотя бы один запрос читает таблицу целиком, поэтому подходит для CI.
+
+Запуск: python -m benchmarks.query_plans --users 2000 --channels-per-user 3
+"""
+import argparse
+import asyncio
+import datetime
+import re
+import sys
+from typing import Awaitable, Callable
+
+from sqlalchemy import event, text
+
+from src.constants import constants
+from src.db import base, models
+
+
+def channel_id(account_id: int, number: int) -> int:
+    return -1000000000000 - account_id * 1000 - number
+
+
+async def populate(users: int, channels_per_user: int) -> None:
+    async with base.get_engine().begin() as connection:
+        await connection.run_sync(models.Base.metadata.drop_all)
+        await connection.run_sync(models.Base.metadata.create_all)
+    now = base.utcnow()
+    async with base.async_session() as session, session.begin():
+        for account_id in range(1, users + 1):
+            user = models.User(account_id=account_id, first_name=f"user {account_id}")
+            user.channels = [
+                models.Bind(
+                    channel=models.Channel(channel_id=channel_id(account_id, number), title=f"channel {number}"),
+                )
+                for number in range(channels_per_user)
+            ]
+            session.add(user)
+            session.add(models.UserState(account_id=account_id, stop_forward=False))
+            session.add(
+                models.Outbox(
+                    account_id=account_id,
+                    chat_id=channel_id(account_id, 0),
+                    channel_title="channel 0",
+                    media_type=constants.MEDIA_PHOTO,
+                    file_id=str(account_id),
+                    # Почти вся очередь уже отправлена или отложена, как в работающем боте
+                    status=constants.OUTBOX_FAILED if account_id % 10 else constants.OUTBOX_PENDING,
+                    next_attempt_at=now + datetime.timedelta(seconds=account_id),
+                ),
+            )
+            session.add(
+                models.PostStats(account_id=account_id, day=now.date(), chat_id=channel_id(account_id, 0), posts=1),
+            )
+    async with base.get_engine().begin() as connection:
+        await connection.execute(text("ANALYZE"))
+
+
+def hot_queries(account_id: int) -> dict[str, Callable[[], Awaitable]]:
+    channel = channel_id(account_id, 0)
+    now = base.utcnow()
+    return {
+        "user get": lambda: base.user_repository.get(account_id),
+        "channel get": lambda: base.channel_repository.get(channel),
+        "channel get_due_for_probe": lambda: base.channel_repository.get_due_for_probe(50),
+        "bind get_targets": lambda: base.bind_repository.get_targets(account_id),
+        "bind update_description": lambda: base.bind_repository.update_description(account_id, channel, "new"),
+        "bind get_page": lambda: base.bind_repository.get_page(account_id, 11, after=0),
+        "bind get_account_ids": lambda: base.bind_repository.get_account_ids(channel),
+        "user_state get": lambda: base.user_state_repository.get(account_id),
+        "outbox claim": lambda: base.outbox_repository.claim(10, 60),
+        "outbox count_pending": base.outbox_repository.count_pending,
+        "outbox add_scheduled": lambda: base.outbox_repository.add_scheduled(
+            account_id,
+            [
+                {
+                    "account_id": account_id,
+                    "chat_id": channel,
+                    "channel_title": "channel 0",
+                    "media_type": constants.MEDIA_PHOTO,
+                    "file_id": "scheduled",
+                    "next_attempt_at": now,
+                },
+            ],
+        ),
+        "posted_media remove_older": lambda: base.posted_media_repository.remove_older(3600),
+        "post_stats get_summary": lambda: base.post_stats_repository.get_summary(account_id, now.date()),
+    }
+
+
+async def capture(call: Callable[[], Awaitable]) -> list[tuple[str, tuple | dict]]:
+    """Выполняет call и возвращает запросы SELECT, UPDATE и DELETE, которые он отправил в БД."""
+    statements = []
+
+    def remember(connection, cursor, statement, parameters, context, executemany) -> None:
+        if statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(base.get_engine().sync_engine, "before_cursor_execute", remember)
+    try:
+        await call()
+    finally:
+        event.remove(base.get_engine().sync_engine, "before_cursor_execute", remember)
+    return statements
+
+
+async def explain(statement: str, parameters: tuple | dict) -> list[str]:
+    async with base.get_engine().connect() as connection:
+        if base.get_engine().dialect.name == "sqlite":
+            rows = await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return [row[-1] for row in rows]
+        await connection.exec_driver_sql("SET enable_seqscan = off")
+        rows = await connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        return [row[0] for row in rows]
+
+
+def full_scans(plan: list[str]) -> list[str]:
+    if base.get_engine().dialect.name == "sqlite":
+        return [step for step in plan if re.match(r"SCAN \w+( |$)", step.strip()) and "USING" not in step]
+    return [step for step in plan if "Seq Scan" in step]
+
+
+async def main(args: argparse.Namespace) -> None:
+    await populate(args.users, args.channels_per_user)
+    failed = 0
+    print(f"database={base.get_engine().dialect.name} users={args.users} channels_per_user={args.channels_per_user}")
+    for name, call in hot_queries(args.users // 2).items():
+        for statement, parameters in await capture(call):
+            plan = await explain(statement, parameters)
+            scans = full_scans(plan)
+            failed += bool(scans)
+            print(f"{'FAIL' if scans else 'ok':<4} {name}")
+            if scans or args.verbose:
+                print("     " + " ".join(statement.split()))
+                for step in plan:
+                    print(f"       {step}")
+    await base.dispose()
+    if failed:
+        sys.exit(f"Запросов с чтением таблицы целиком: {failed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--channels-per-user", type=int, default=3)
+    parser.add_argument("--verbose", action="store_true", help="печатать планы всех запросов")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""Проверка очереди публикаций с большим количеством отложенных по расписанию публикаций.
+
+Очередь заполняется публикациями, время которых еще не наступило, и на каждом размере очереди замеряется,
+сколько времени и памяти занимает выборка готовых публикаций воркером (OutboxRepository.claim). Выборка идет
+по индексу (status, next_attempt_at), а в памяти процесса отложенные публикации не хранятся, поэтому время и память
+не должны расти вместе с очередью.
+
+Запуск: python -m benchmarks.scheduled_queue --sizes 1000 10000 100000 300000
+"""
+import argparse
+import asyncio
+import datetime
+import time
+import tracemalloc
+
+from src.constants import constants
+from src.db import base, models
+
+CHUNK_SIZE = 5000
+
+
+async def add_scheduled(count: int, start: int) -> None:
+    """Добавляет count публикаций, запланированных на ближайшие дни."""
+    now = base.utcnow()
+    for chunk_start in range(start, start + count, CHUNK_SIZE):
+        await base.outbox_repository.add_many(
+            [
+                {
+                    "account_id": number % 1000 + 1,
+                    "chat_id": -1000000000000 - number % 5000,
+                    "channel_title": "channel",
+                    "media_type": constants.MEDIA_PHOTO,
+                    "file_id": str(number),
+                    "message_id": number,
+                    "next_attempt_at": now + datetime.timedelta(minutes=1 + number % 10000),
+                    "created_at": now,
+                }
+                for number in range(chunk_start, min(chunk_start + CHUNK_SIZE, start + count))
+            ],
+        )
+
+
+async def add_due(count: int) -> None:
+    rows = [
+        {
+            "account_id": 1,
+            "chat_id": -1000000000000,
+            "channel_title": "channel",
+            "media_type": constants.MEDIA_PHOTO,
+            "file_id": "due",
+            "message_id": 0,
+            "next_attempt_at": base.utcnow() - datetime.timedelta(seconds=1),
+        }
+        for _ in range(count)
+    ]
+    await base.outbox_repository.add_many(rows)
+
+
+async def measure_claim(repeats: int, batch_size: int) -> tuple[float, int]:
+    """Возвращает среднее время claim и пик памяти, выделенной за claim. Перед каждым claim в очередь
+    добавляются batch_size готовых публикаций.
+    """
+    elapsed = 0.0
+    peak = 0
+    for _ in range(repeats):
+        await add_due(batch_size)
+        tracemalloc.start()
+        started = time.perf_counter()
+        rows = await base.outbox_repository.claim(batch_size, 60)
+        elapsed += time.perf_counter() - started
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        await base.outbox_repository.complete([row.id for row in rows])
+    return elapsed / repeats, peak
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with base.get_engine().begin() as connection:
+        await connection.run_sync(models.Base.metadata.drop_all)
+        await connection.run_sync(models.Base.metadata.create_all)
+    print(f"database={base.get_engine().dialect.name} batch_size={args.batch_size}")
+    print(f"{'scheduled':>10} {'claim, ms':>10} {'peak, KiB':>10}")
+    size = 0
+    for target in sorted(args.sizes):
+        await add_scheduled(target - size, size)
+        size = target
+        elapsed, peak = await measure_claim(args.repeats, args.batch_size)
+        print(f"{size:>10} {elapsed * 1000:>10.2f} {peak / 1024:>10.0f}")
+    await base.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
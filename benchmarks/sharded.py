@@ -0,0 +1,68 @@
+"""Масштабирование публикаций по процессам: бот, запущенный через sharding.Supervisor с 1, 2, ... N шардами.
+
+Для каждого количества шардов база пересоздается, в локальную замену Bot API (benchmarks.fake_api) заранее
+складываются все update, после чего запускаются процесс приема update и шарды. Замеряется количество публикаций
+в секунду от первой до последней публикации. Ограничения частоты запросов к Bot API сняты, чтобы упираться
+в процессор, а не в лимиты.
+
+Прирост близок к линейному, пока шардов не больше свободных ядер процессора (одно ядро занимает замена Bot API)
+и БД успевает за ними. SQLite пропускает одну запись за раз, поэтому для больших N укажите DATABASE_URL
+пустой базы Postgres.
+
+Запуск: python -m benchmarks.sharded --shards 1 2 4 --users 200 --channels 5 --updates-per-user 5
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks import end_to_end
+from benchmarks.fake_api import FakeBotApi
+from src import sharding
+
+
+async def measure(shards: int, args: argparse.Namespace) -> float:
+    await end_to_end.populate(args.users, args.channels, True)
+    api = FakeBotApi(args.latency)
+    # Шарды - отдельные процессы, настройки они читают из переменных окружения
+    os.environ["BOT_API_BASE_URL"] = api.start(args.api_port)
+    for payload in end_to_end.make_updates(args.users, args.updates_per_user, {"photo": 1}, args.seed):
+        api.push_update(payload)
+    expected = args.users * args.updates_per_user * args.channels
+    supervisor = sharding.Supervisor(shards, queue_size=1000)
+    supervisor.start()
+    deadline = time.perf_counter() + args.timeout
+    while len(end_to_end.media_posts(api)) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    await asyncio.get_running_loop().run_in_executor(None, supervisor.stop)
+    await api.stop()
+    posts = end_to_end.media_posts(api)
+    times = [sent.sent_at for sent, _ in posts]
+    rate = len(posts) / (max(times) - min(times)) if len(posts) > 1 else 0
+    print(f"{shards:>6} {len(posts):>7} {rate:>8.1f}")
+    return rate
+
+
+async def main(args: argparse.Namespace) -> None:
+    os.environ["RATE_LIMIT_GLOBAL_PER_SECOND"] = "1000000"
+    os.environ["RATE_LIMIT_CHANNEL_PER_MINUTE"] = "1000000"
+    updates = args.users * args.updates_per_user
+    print(f"users={args.users} channels={args.channels} updates={updates} cpus={os.cpu_count()}")
+    print(f"{'shards':>6} {'posts':>7} {'posts/s':>8}")
+    rates = {shards: await measure(shards, args) for shards in args.shards}
+    baseline = rates[min(rates)]
+    for shards, rate in rates.items():
+        print(f"{shards} шард(ов): ускорение {rate / baseline if baseline else 0:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=5, help="каналов у каждого пользователя")
+    parser.add_argument("--updates-per-user", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка сети в одну сторону, секунды")
+    parser.add_argument("--timeout", type=float, default=300, help="сколько секунд ждать все публикации")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,73 @@
+"""Нагрузочный тест обработки update: пропускная способность в зависимости от числа одновременных пользователей.
+
+Каждый update обрабатывается latency секунд (имитация запросов к БД и Bot API). Update отправляются в процессор
+в том же порядке и так же, как это делает Application: по задаче на update. Для каждого пользователя проверяется,
+что его update обработаны строго в порядке получения.
+
+Запуск: python -m benchmarks.updates --updates-per-user 20 --latency 0.02 --max-concurrent 64
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import time
+
+from telegram import Chat, Message, Update, User
+
+from src.update_processor import UserOrderedUpdateProcessor
+
+
+def make_updates(users: int, updates_per_user: int) -> list[Update]:
+    """Update пользователей вперемешку, как они приходят из getUpdates."""
+    update_ids = itertools.count(1)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    updates = []
+    for _ in range(updates_per_user):
+        for user_id in range(1, users + 1):
+            update_id = next(update_ids)
+            message = Message(
+                message_id=update_id,
+                date=now,
+                chat=Chat(user_id, Chat.PRIVATE),
+                from_user=User(user_id, f"user {user_id}", is_bot=False),
+            )
+            updates.append(Update(update_id, message=message))
+    return updates
+
+
+async def run(processor: UserOrderedUpdateProcessor, updates: list[Update], latency: float) -> tuple[float, bool]:
+    handled: dict[int, list[int]] = {}
+
+    async def handle(update: Update) -> None:
+        await asyncio.sleep(latency)
+        handled.setdefault(update.effective_user.id, []).append(update.update_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(asyncio.create_task(processor.process_update(update, handle(update))) for update in updates))
+    elapsed = time.perf_counter() - started
+    ordered = all(update_ids == sorted(update_ids) for update_ids in handled.values())
+    return elapsed, ordered and processor.active_users == 0
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"latency={args.latency * 1000:.0f} ms updates_per_user={args.updates_per_user}")
+    print(f"{'users':>6} {'sequential':>14} {'concurrent':>14} {'speedup':>8} {'ordered':>8}")
+    for users in args.users:
+        updates = make_updates(users, args.updates_per_user)
+        # Лимит очереди пользователя не меньше его update, чтобы ни один update не был пропущен
+        limit = args.updates_per_user
+        sequential, _ = await run(UserOrderedUpdateProcessor(1, limit), updates, args.latency)
+        concurrent, ordered = await run(UserOrderedUpdateProcessor(args.max_concurrent, limit), updates, args.latency)
+        print(
+            f"{users:>6} {len(updates) / sequential:>10.0f} u/s {len(updates) / concurrent:>10.0f} u/s "
+            f"{sequential / concurrent:>7.1f}x {str(ordered):>8}",
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--updates-per-user", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="время обработки одного update, секунды")
+    parser.add_argument("--max-concurrent", type=int, default=64)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""Память, которую занимает user_data пользователей: ORM-модели против идентификаторов.
+
+"before" - прежнее содержимое user_data пользователя в меню: User со связями и каналами (CURRENT_USER),
+Channel (CURRENT_CHANNEL) и STOP_FORWARD. "after" - то, что хранится теперь: STOP_FORWARD и channel_id.
+Для "before" модели загружаются из БД для sample пользователей, результат пересчитывается на users пользователей.
+
+Запуск: python -m benchmarks.user_state_memory --users 100000 --channels-per-user 3
+"""
+import argparse
+import asyncio
+import tracemalloc
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from benchmarks import forwarding_queries
+from src.constants import constants
+from src.db import base, models
+
+# Удаленные из constants ключи, под которыми раньше хранились модели
+CURRENT_USER = "current_user"
+
+
+async def get_with_channels(account_id: int) -> models.User:
+    """Прежняя загрузка пользователя для меню: User вместе с его связями Bind и каналами."""
+    query = (
+        select(models.User)
+        .where(models.User.account_id == account_id)
+        .options(selectinload(models.User.channels).joinedload(models.Bind.channel))
+    )
+    async with base.async_session() as session:
+        return (await session.scalars(query)).one()
+
+
+async def load_before(account_ids: range) -> dict[int, dict]:
+    user_data = {}
+    for account_id in account_ids:
+        user = await get_with_channels(account_id)
+        channel = await base.channel_repository.get(user.channels[0].channel.channel_id)
+        user_data[account_id] = {constants.STOP_FORWARD: False, CURRENT_USER: user, constants.CURRENT_CHANNEL: channel}
+    return user_data
+
+
+def build_after(account_ids: range) -> dict[int, dict]:
+    return {
+        account_id: {constants.STOP_FORWARD: False, constants.CURRENT_CHANNEL: -1000000000000 - account_id}
+        for account_id in account_ids
+    }
+
+
+async def measure(build) -> int:
+    """Возвращает количество байт, выделенных при построении и оставшихся занятыми после него."""
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    user_data = await build()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del user_data
+    return allocated - baseline
+
+
+async def main(args: argparse.Namespace) -> None:
+    await forwarding_queries.populate(args.channels_per_user, args.sample)
+    sample = range(1, args.sample + 1)
+    # Компиляция запросов и кэши SQLAlchemy не относятся к user_data
+    await load_before(range(1, 2))
+    before = await measure(lambda: load_before(sample)) / args.sample
+
+    async def after_all() -> dict[int, dict]:
+        return build_after(range(1, args.users + 1))
+
+    after = await measure(after_all) / args.users
+    print(f"users={args.users} channels_per_user={args.channels_per_user} (before measured on {args.sample} users)")
+    print(f"{'':<8} {'B/user':>10} {'MiB total':>12}")
+    for name, per_user in (("before", before), ("after", after)):
+        print(f"{name:<8} {per_user:>10.0f} {per_user * args.users / 2 ** 20:>12.1f}")
+    print(f"saved    {before - after:>10.0f} {(before - after) * args.users / 2 ** 20:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--channels-per-user", type=int, default=3)
+    parser.add_argument("--sample", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
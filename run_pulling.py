@@ -1,4 +1,7 @@
+from telegram import Update
+
 from src import bot
 
 if __name__ == "__main__":
-    bot.create_bot().run_polling()
+    # Update chat_member не присылаются без явного запроса, а нужны для кэша администраторов каналов
+    bot.create_bot().run_polling(allowed_updates=Update.ALL_TYPES)
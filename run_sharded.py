@@ -0,0 +1,11 @@
+import signal
+
+from src import settings, sharding
+
+if __name__ == "__main__":
+    # Один процесс принимает update через getUpdates и раздает их SHARD_COUNT процессам-шардам по id пользователя
+    config = settings.get_settings()
+    supervisor = sharding.Supervisor(config.SHARD_COUNT, config.SHARD_QUEUE_SIZE)
+    # SIGTERM останавливает бота так же, как Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    supervisor.run()
@@ -0,0 +1,18 @@
+from telegram import Update
+
+from src import bot, settings
+
+if __name__ == "__main__":
+    config = settings.get_settings()
+    if not config.WEBHOOK_SECRET_TOKEN:
+        raise SystemExit("Для приема update через webhook задайте WEBHOOK_SECRET_TOKEN")
+    # Запросы без заголовка X-Telegram-Bot-Api-Secret-Token с этим токеном отклоняются с кодом 403.
+    # Update попадает в ограниченную очередь приложения, и ответ 200 отправляется сразу после этого
+    bot.create_bot().run_webhook(
+        listen=config.WEBHOOK_LISTEN,
+        port=config.WEBHOOK_PORT,
+        url_path=config.WEBHOOK_PATH,
+        webhook_url=config.WEBHOOK_URL or None,
+        secret_token=config.WEBHOOK_SECRET_TOKEN,
+        allowed_updates=Update.ALL_TYPES,
+    )
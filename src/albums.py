@@ -0,0 +1,110 @@
+import asyncio
+import functools
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import telegram
+
+from src import dedup, outbox, services, settings
+
+logger = logging.getLogger(__name__)
+
+# Telegram не позволяет собрать в альбом больше 10 вложений
+MAX_ALBUM_SIZE = 10
+
+
+@dataclass
+class _Album:
+    telegram_bot: telegram.Bot
+    account_id: int
+    last_seen: float
+    items: list[services.Media] = field(default_factory=list)
+    task: asyncio.Task | None = None
+
+
+class AlbumAggregator:
+    """Собирает вложения одного альбома, которые приходят отдельными update.
+
+    Альбом считается полученным, если в течение window секунд не пришло новых вложений с тем же
+    media_group_id. После этого вложения передаются в on_album одним списком в порядке отправки.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        on_album: Callable[[telegram.Bot, int, str, list[services.Media]], Awaitable[None]],
+    ) -> None:
+        self._window = window
+        self._on_album = on_album
+        self._albums: dict[str, _Album] = {}
+        # Публикации альбомов, собранных до конца окна ожидания
+        self._flushes: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """Количество собираемых альбомов."""
+        return len(self._albums)
+
+    def add(self, message: telegram.Message, account_id: int) -> None:
+        loop = asyncio.get_running_loop()
+        album = self._albums.get(message.media_group_id)
+        if album is None:
+            album = self._albums[message.media_group_id] = _Album(message.get_bot(), account_id, loop.time())
+            album.task = asyncio.create_task(self._flush_later(message.media_group_id))
+        album.items.append(services.extract_media(message))
+        album.last_seen = loop.time()
+        if len(album.items) >= MAX_ALBUM_SIZE:
+            album.task.cancel()
+            task = asyncio.create_task(self._flush(message.media_group_id))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush_later(self, media_group_id: str) -> None:
+        loop = asyncio.get_running_loop()
+        album = self._albums[media_group_id]
+        while (delay := album.last_seen + self._window - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        await self._flush(media_group_id)
+
+    async def _flush(self, media_group_id: str) -> None:
+        album = self._albums.pop(media_group_id, None)
+        if album is None:
+            return
+        media = sorted(album.items, key=lambda item: item.message_id)
+        try:
+            await self._on_album(album.telegram_bot, album.account_id, media_group_id, media)
+        except Exception:
+            logger.exception("Не удалось поставить в очередь альбом %s", media_group_id)
+
+    async def flush(self) -> None:
+        """Немедленно передает в on_album все собираемые альбомы и дожидается уже начатых передач,
+        например перед остановкой бота.
+        """
+        for album in self._albums.values():
+            album.task.cancel()
+        await asyncio.gather(*self._flushes, *(self._flush(media_group_id) for media_group_id in list(self._albums)))
+
+
+async def enqueue_album(
+    telegram_bot: telegram.Bot,
+    account_id: int,
+    media_group_id: str,
+    media: list[services.Media],
+) -> None:
+    """Ставит собранный альбом в очередь публикации во все каналы пользователя, в которые он еще не публиковался."""
+    targets = await services.get_bind_targets(account_id)
+    async with dedup.get_posted_media().reserve(targets, services.album_key(media)) as (targets, duplicates):
+        queued = await services.enqueue_album(targets, media_group_id, media, account_id)
+    if queued:
+        outbox.get_worker_pool().wake()
+    if duplicates:
+        try:
+            await telegram_bot.send_message(chat_id=account_id, text=dedup.duplicates_summary(duplicates))
+        except telegram.error.TelegramError:
+            logger.warning("Не удалось сообщить пользователю %s о повторно присланном альбоме", account_id)
+
+
+@functools.cache
+def get_aggregator() -> AlbumAggregator:
+    return AlbumAggregator(settings.get_settings().ALBUM_WINDOW, enqueue_album)
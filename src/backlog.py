@@ -0,0 +1,97 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+
+from telegram import error
+from telegram.ext import Application
+
+from src import metrics, settings
+
+logger = logging.getLogger(__name__)
+
+
+class BacklogMonitor:
+    """Следит за очередью update: сколько их ждет бота в Telegram и с какой скоростью бот их разбирает.
+
+    Раз в check_interval секунд запрашивает getWebhookInfo, количество ожидающих update в котором одинаково для
+    getUpdates и webhook. Когда вместе с update в обработке их не меньше catch_up_threshold (например, после простоя
+    бота), бот догоняет очередь: пока она не разобрана, в лог пишется ее размер, скорость разбора и оценка
+    оставшегося времени.
+    """
+
+    def __init__(self, check_interval: float, catch_up_threshold: int) -> None:
+        self._check_interval = check_interval
+        self._catch_up_threshold = catch_up_threshold
+        # Update, ожидающие бота в Telegram, по последней проверке
+        self.backlog = 0
+        # Обработанных update в секунду между двумя последними проверками
+        self.drain_rate = 0.0
+        self._processed = 0.0
+        self._checked_at = 0.0
+        # time.monotonic(), количество обработанных и пропущенных update в начале разбора очереди
+        self._catch_up_started: tuple[float, float, float] | None = None
+        self._task: asyncio.Task | None = None
+
+    async def check(self, application: Application) -> None:
+        try:
+            info = await application.bot.get_webhook_info()
+        except error.TelegramError as e:
+            logger.warning("Не удалось узнать количество ожидающих update: %s", e)
+            return
+        now = time.monotonic()
+        processed = metrics.updates_processed.value()
+        if self._checked_at:
+            self.drain_rate = (processed - self._processed) / (now - self._checked_at)
+        self._processed, self._checked_at = processed, now
+        self.backlog = info.pending_update_count
+        received = application.update_queue.pending
+        remaining = self.backlog + received
+        if self._catch_up_started is None:
+            if remaining >= self._catch_up_threshold:
+                self._catch_up_started = now, processed, metrics.updates_shed.total()
+                logger.warning("Бот догоняет очередь update: %s ждут в Telegram, %s в боте", self.backlog, received)
+            return
+        started, processed_before, shed_before = self._catch_up_started
+        if not remaining:
+            self._catch_up_started = None
+            logger.info(
+                "Очередь update разобрана за %.0f с: обработано %.0f update, пропущено %.0f",
+                now - started,
+                processed - processed_before,
+                metrics.updates_shed.total() - shed_before,
+            )
+            return
+        logger.info(
+            "Разбор очереди update: %s ждут в Telegram, %s в боте, %.1f update/с, осталось %s",
+            self.backlog,
+            received,
+            self.drain_rate,
+            f"~{remaining / self.drain_rate:.0f} с" if self.drain_rate else "неизвестно сколько",
+        )
+
+    async def _run(self, application: Application) -> None:
+        while True:
+            try:
+                await self.check(application)
+            except Exception:
+                logger.exception("Ошибка при проверке очереди update")
+            await asyncio.sleep(self._check_interval)
+
+    def start(self, application: Application) -> None:
+        if self._check_interval:
+            self._task = asyncio.create_task(self._run(application))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+@functools.cache
+def get_backlog_monitor() -> BacklogMonitor:
+    config = settings.get_settings()
+    return BacklogMonitor(config.BACKLOG_CHECK_INTERVAL, config.CATCH_UP_THRESHOLD)
@@ -1,7 +1,11 @@
+import functools
+import itertools
+from typing import Callable
 from warnings import filterwarnings
 
 from telegram.ext import (
     Application,
+    BaseHandler,
     CallbackQueryHandler,
     ChatMemberHandler,
     CommandHandler,
@@ -11,19 +15,180 @@ from telegram.ext import (
 )
 from telegram.warnings import PTBUserWarning
 
-from src import handlers, menu_commands, settings
+from src import (
+    albums,
+    backlog,
+    cache,
+    channel_admins,
+    channel_health,
+    dedup,
+    handlers,
+    menu_commands,
+    metrics,
+    outbox,
+    persistence,
+    rate_limiter,
+    services,
+    settings,
+    stats,
+    tracing,
+    update_processor,
+)
 from src.constants import callback_data, states
+from src.db import base
 
 filterwarnings(action="ignore", message=r".*CallbackQueryHandler", category=PTBUserWarning)
 
+# Сообщения с вложениями, которые бот публикует в каналы
+ATTACHMENTS = (
+    filters.ANIMATION | filters.PHOTO | filters.VIDEO | filters.Document.ALL | filters.AUDIO | filters.VIDEO_NOTE
+)
+
+
+@functools.cache
+def get_metrics_server() -> metrics.MetricsServer:
+    config = settings.get_settings()
+    return metrics.MetricsServer(config.METRICS_LISTEN, config.METRICS_PORT)
+
+
+def register_cache_gauges(name: str, description: str, stats: Callable[[], cache.CacheStats]) -> None:
+    """Регистрирует попадания, промахи и размер кэша."""
+    metrics.registry.gauge(f"rebot_{name}_cache_hits", f"Попадания в кэш {description}", lambda: stats().hits)
+    metrics.registry.gauge(f"rebot_{name}_cache_misses", f"Промахи кэша {description}", lambda: stats().misses)
+    metrics.registry.gauge(f"rebot_{name}_cache_size", f"Записи в кэше {description}", lambda: stats().size)
+
+
+def register_gauges(application: Application) -> None:
+    """Регистрирует показатели очередей приложения и кэшей."""
+    processor = application.update_processor
+    limiter = application.bot.rate_limiter
+    metrics.registry.gauge("rebot_update_queue_size", "Update, ожидающие обработки", application.update_queue.qsize)
+    metrics.registry.gauge(
+        "rebot_active_users",
+        "Пользователи, чьи update обрабатываются",
+        lambda: processor.active_users,
+    )
+    metrics.registry.gauge(
+        "rebot_bot_api_queue_depth",
+        "Запросы к Bot API в очереди планировщика",
+        lambda: limiter.stats().queue_depth,
+    )
+    metrics.registry.gauge(
+        "rebot_bot_api_parked_chats",
+        "Чаты, запаркованные после RetryAfter",
+        lambda: limiter.stats().parked_chats,
+    )
+    metrics.registry.gauge(
+        "rebot_updates_pending",
+        "Полученные update в очереди и в обработке",
+        lambda: application.update_queue.pending,
+    )
+    metrics.registry.gauge(
+        "rebot_update_backlog",
+        "Update, ожидающие бота в Telegram, по последней проверке",
+        lambda: backlog.get_backlog_monitor().backlog,
+    )
+    metrics.registry.gauge(
+        "rebot_update_drain_rate",
+        "Обработанных update в секунду",
+        lambda: backlog.get_backlog_monitor().drain_rate,
+    )
+    metrics.registry.gauge("rebot_albums_pending", "Собираемые альбомы", lambda: albums.get_aggregator().pending)
+    metrics.registry.gauge(
+        "rebot_outbox_pending",
+        "Публикации в очереди, ожидающие отправки",
+        base.outbox_repository.count_pending,
+    )
+    register_cache_gauges("bind", "каналов пользователей", services.get_bind_cache().stats)
+    register_cache_gauges("channel_menu", "страниц меню каналов", services.get_channel_menu_cache().stats)
+    register_cache_gauges("admin", "администраторов каналов", channel_admins.get_channel_admins().stats)
+
+
+async def post_init(application: Application) -> None:
+    """Открывает соединения с БД, включает трассировку и профилирование, запускает воркеров очереди публикаций,
+    проверку каналов, запись статистики, проверку очереди update и, если задан METRICS_PORT, сервер метрик.
+    Вызывается до начала приема update.
+    """
+    config = settings.get_settings()
+    tracing.tracer.start(config.TRACE_FILE, config.TRACE_FILE_MAX_BYTES, config.TRACE_FILE_BACKUPS)
+    tracing.profiler.start(
+        config.PROFILE_EVERY,
+        config.PROFILE_SLOWER_THAN,
+        config.PROFILE_DIR,
+        config.PROFILE_INTERVAL,
+    )
+    await base.warm_up(config.DB_POOL_WARMUP)
+    await outbox.start_workers(application)
+    channel_health.get_channel_health().start(application.bot)
+    dedup.get_posted_media().start()
+    stats.get_posting_stats().start()
+    backlog.get_backlog_monitor().start(application)
+    if config.METRICS_PORT:
+        register_gauges(application)
+        get_metrics_server().start()
+
+
+async def post_stop(application: Application) -> None:
+    """Ставит в очередь недособранные альбомы, дожидается отправки уже забранных публикаций, останавливает воркеров,
+    проверку каналов и проверку очереди update.
+
+    Вызывается после остановки приема update и обработки уже полученных update, но до Application.shutdown():
+    после него клиент Bot API закрыт, и ответы на уже отправленные публикации не дошли бы до бота.
+    """
+    await albums.get_aggregator().flush()
+    await outbox.stop_workers(application)
+    await channel_health.get_channel_health().stop()
+    await backlog.get_backlog_monitor().stop()
+
+
+async def post_shutdown(application: Application) -> None:
+    """Останавливает сервер метрик, записывает накопленную статистику и закрывает соединения с БД."""
+    await dedup.get_posted_media().stop()
+    await stats.get_posting_stats().stop()
+    await get_metrics_server().stop()
+    await base.dispose()
+    tracing.tracer.stop()
+
+
+def instrument(handler: BaseHandler) -> None:
+    """Оборачивает callback обработчика для учета времени выполнения в метриках.
+
+    Метка обработчика - имя функции, для CallbackQueryHandler к нему добавляется шаблон callback_data.
+    Обработчики внутри ConversationHandler оборачиваются по отдельности.
+    """
+    if isinstance(handler, ConversationHandler):
+        for nested in itertools.chain(handler.entry_points, *handler.states.values(), handler.fallbacks):
+            instrument(nested)
+        return
+    name = handler.callback.__name__
+    if isinstance(handler, CallbackQueryHandler) and handler.pattern is not None:
+        name = f"{name}[{getattr(handler.pattern, 'pattern', handler.pattern)}]"
+    handler.callback = tracing.traced(f"handler {name}")(metrics.timed(handler.callback, name))
+
 
 def create_bot():
+    config = settings.get_settings()
     application = (
         Application.builder()
-        .token(settings.BOT_TOKEN)
-        .concurrent_updates(False)
+        .token(config.BOT_TOKEN)
+        .base_url(config.BOT_API_BASE_URL)
+        .update_queue(update_processor.UpdateQueue(config.UPDATE_QUEUE_SIZE, config.MAX_PENDING_UPDATES))
+        .concurrent_updates(
+            update_processor.UserOrderedUpdateProcessor(config.MAX_CONCURRENT_UPDATES, config.USER_QUEUE_LIMIT),
+        )
+        .persistence(persistence.DatabasePersistence(config.PERSISTENCE_FLUSH_INTERVAL))
+        .rate_limiter(
+            rate_limiter.PriorityRateLimiter(
+                global_per_second=config.RATE_LIMIT_GLOBAL_PER_SECOND,
+                chat_per_minute=config.RATE_LIMIT_CHANNEL_PER_MINUTE,
+                max_retries=config.RATE_LIMIT_MAX_RETRIES,
+            ),
+        )
         .read_timeout(30)
         .write_timeout(30)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
         .build()
     )
     menu_handler = ConversationHandler(
@@ -36,10 +201,12 @@ def create_bot():
             ],
             states.USER_CHANNELS_STATE: [
                 CallbackQueryHandler(menu_commands.channel_menu, pattern=callback_data.CALLBACK_CHANNEL_MENU),
+                CallbackQueryHandler(menu_commands.user_channels, pattern=callback_data.CALLBACK_CHANNELS_PAGE),
                 CallbackQueryHandler(menu_commands.main_menu, pattern=callback_data.CALLBACK_BACK_TO_MAIN),
             ],
             states.CHANNEL_MENU_STATE: [
                 CallbackQueryHandler(menu_commands.edit_description, pattern=callback_data.CALLBACK_EDIT_DESCRIPTION),
+                CallbackQueryHandler(menu_commands.edit_schedule, pattern=callback_data.CALLBACK_EDIT_SCHEDULE),
                 CallbackQueryHandler(menu_commands.remove_binding, pattern=callback_data.CALLBACK_REMOVE_BINDING),
                 CallbackQueryHandler(menu_commands.user_channels, pattern=callback_data.CALLBACK_BACK_TO_CHANNELS),
             ],
@@ -49,16 +216,25 @@ def create_bot():
             states.TYPING_DESCRIPTION: [
                 MessageHandler(filters.TEXT, menu_commands.input_description),
             ],
+            states.TYPING_SCHEDULE: [
+                MessageHandler(filters.TEXT, menu_commands.input_schedule),
+            ],
         },
         fallbacks=[CommandHandler("menu", menu_commands.main_menu)],
+        name="menu",
+        persistent=True,
     )
     application.add_handler(CommandHandler("start", handlers.start_message_handler, filters.ChatType.PRIVATE))
+    application.add_handler(CommandHandler("stats", handlers.stats_handler, filters.ChatType.PRIVATE))
     application.add_handler(ChatMemberHandler(handlers.channel_register_handler, ChatMemberHandler.MY_CHAT_MEMBER))
+    application.add_handler(ChatMemberHandler(handlers.channel_member_handler, ChatMemberHandler.CHAT_MEMBER))
     application.add_handler(menu_handler)
     application.add_handler(
         MessageHandler(
-            filters.ChatType.PRIVATE & (filters.VIDEO | filters.PHOTO | filters.ANIMATION),
+            filters.ChatType.PRIVATE & ATTACHMENTS,
             handlers.forward_attachment_handler,
         ),
     )
+    for handler in itertools.chain.from_iterable(application.handlers.values()):
+        instrument(handler)
     return application
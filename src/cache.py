@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    size: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+
+class TTLCache(Generic[K, V]):
+    """LRU-кэш с ограниченным временем жизни записей.
+
+    Хранит не более maxsize записей, при переполнении вытесняет давно не использованные.
+    Запись старше ttl секунд считается отсутствующей.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """Счетчик инвалидаций. Позволяет не сохранять в кэш значение, прочитанное до инвалидации."""
+        return self._generation
+
+    def get(self, key: K) -> V | None:
+        """Возвращает значение из кэша или None, если записи нет или она устарела."""
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self._misses += 1
+            return None
+        self._data.move_to_end(key)
+        self._hits += 1
+        return entry[1]
+
+    def peek(self, key: K) -> V | None:
+        """Как get, но не учитывается в статистике и не меняет порядок вытеснения."""
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        self._data[key] = (time.monotonic() + self._ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        self._generation += 1
+        self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[V], bool]) -> None:
+        """Удаляет все записи, значения которых удовлетворяют predicate."""
+        self._generation += 1
+        for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._data.clear()
+
+    def stats(self) -> CacheStats:
+        return CacheStats(hits=self._hits, misses=self._misses, size=len(self._data))
@@ -0,0 +1,62 @@
+import asyncio
+import functools
+
+import telegram
+
+from src import cache, settings
+
+
+class ChannelAdmins:
+    """Кэш множеств администраторов каналов.
+
+    Множество загружается через get_chat_administrators один раз на ttl секунд, одновременные запросы по одному
+    каналу объединяются в один вызов Bot API. Между загрузками множество поддерживается в актуальном состоянии
+    по update chat_member.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._cache: cache.TTLCache[int, set[int]] = cache.TTLCache(maxsize, ttl)
+        self._in_flight: dict[int, asyncio.Task] = {}
+
+    async def get(self, telegram_bot: telegram.Bot, channel_id: int) -> set[int]:
+        """Возвращает account_id администраторов канала."""
+        admins = self._cache.get(channel_id)
+        if admins is not None:
+            return admins
+        task = self._in_flight.get(channel_id)
+        if task is None:
+            task = self._in_flight[channel_id] = asyncio.create_task(self._load(telegram_bot, channel_id))
+            task.add_done_callback(lambda _: self._in_flight.pop(channel_id, None))
+        # Отмена одного из ожидающих не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    async def _load(self, telegram_bot: telegram.Bot, channel_id: int) -> set[int]:
+        generation = self._cache.generation
+        administrators = await telegram_bot.get_chat_administrators(chat_id=channel_id)
+        admins = {administrator.user.id for administrator in administrators}
+        if self._cache.generation == generation:
+            self._cache.set(channel_id, admins)
+        return admins
+
+    def update_member(self, channel_id: int, account_id: int, is_admin: bool) -> None:
+        """Учитывает назначение или снятие администратора, если множество администраторов канала уже загружено."""
+        admins = self._cache.peek(channel_id)
+        if admins is None:
+            return
+        if is_admin:
+            admins.add(account_id)
+        else:
+            admins.discard(account_id)
+
+    def forget(self, channel_id: int) -> None:
+        """Удаляет множество администраторов канала, например после удаления бота из канала."""
+        self._cache.invalidate(channel_id)
+
+    def stats(self) -> cache.CacheStats:
+        return self._cache.stats()
+
+
+@functools.cache
+def get_channel_admins() -> ChannelAdmins:
+    config = settings.get_settings()
+    return ChannelAdmins(config.ADMIN_CACHE_SIZE, config.ADMIN_CACHE_TTL)
@@ -0,0 +1,137 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+
+import telegram
+from telegram import ChatMember, error
+
+from src import fanout, services, settings
+from src.constants import constants
+from src.db import base
+
+logger = logging.getLogger(__name__)
+
+# Сколько каналов проверять за один проход
+PROBE_BATCH_SIZE = 50
+# Фрагменты ответов BadRequest, которые говорят о проблеме с каналом, а не с отправляемым сообщением
+CHANNEL_NOT_FOUND_ERRORS = ("chat not found",)
+NO_RIGHTS_ERRORS = ("not enough rights", "need administrator rights", "have no rights", "chat_write_forbidden")
+
+
+class ChannelHealth:
+    """Состояние каналов для публикации: активен, приостановлен или мертв.
+
+    Канал приостанавливается, когда у бота не хватает прав на публикацию, и становится мертвым, когда бота удаляют
+    из канала. Такие каналы не попадают в каналы пользователя для публикации, а уже поставленные в очередь публикации
+    в них не отправляются. Когда пауза заканчивается, бот один раз проверяет канал запросом getChatMember: если бот
+    снова может публиковать, канал становится активным, иначе пауза удваивается. Update my_chat_member меняет
+    состояние канала сразу, не дожидаясь конца паузы.
+    """
+
+    def __init__(self, base_delay: float, max_delay: float, dead_delay: float, probe_interval: float) -> None:
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._dead_delay = dead_delay
+        self._probe_interval = probe_interval
+        # channel_id -> time.monotonic(), до которого публикации в канал не отправляются этим процессом
+        self._paused: dict[int, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def is_available(self, channel_id: int) -> bool:
+        """Можно ли отправлять в канал уже поставленные в очередь публикации."""
+        until = self._paused.get(channel_id)
+        if until is None:
+            return True
+        if until <= time.monotonic():
+            del self._paused[channel_id]
+            return True
+        return False
+
+    async def record_failure(self, channel_id: int, status: fanout.PostStatus, message: str | None) -> None:
+        """Учитывает неудачную публикацию. Ошибки, не связанные с каналом (например, неверный file_id), пропускаются."""
+        message = (message or "").lower()
+        if status is fanout.PostStatus.FORBIDDEN:
+            await self.mark_dead(channel_id)
+        elif status is fanout.PostStatus.BAD_REQUEST:
+            if any(text in message for text in CHANNEL_NOT_FOUND_ERRORS):
+                await self.mark_dead(channel_id)
+            elif any(text in message for text in NO_RIGHTS_ERRORS):
+                await self.suspend(channel_id)
+
+    async def update_from_member(self, channel_id: int, member: ChatMember) -> None:
+        """Переводит канал в состояние по статусу бота в канале из getChatMember или update my_chat_member."""
+        if member.status in [ChatMember.LEFT, ChatMember.BANNED]:
+            await self.mark_dead(channel_id)
+        elif member.status == ChatMember.ADMINISTRATOR and member.can_post_messages is not False:
+            await self.mark_active(channel_id)
+        else:
+            await self.suspend(channel_id)
+
+    async def suspend(self, channel_id: int) -> None:
+        await self._pause(channel_id, constants.CHANNEL_SUSPENDED, self._base_delay, self._max_delay)
+
+    async def mark_dead(self, channel_id: int) -> None:
+        await self._pause(channel_id, constants.CHANNEL_DEAD, self._dead_delay, self._dead_delay)
+
+    async def _pause(self, channel_id: int, status: str, base_delay: float, max_delay: float) -> None:
+        delay = await base.channel_repository.suspend(channel_id, status, base_delay, max_delay)
+        self._paused[channel_id] = time.monotonic() + (delay or base_delay)
+        services.invalidate_channel_targets(channel_id)
+        logger.info("Публикации в канал %s приостановлены (%s) на %s с", channel_id, status, delay)
+
+    async def mark_active(self, channel_id: int) -> None:
+        self._paused.pop(channel_id, None)
+        if await base.channel_repository.activate(channel_id):
+            await services.invalidate_channel_users(channel_id)
+            logger.info("Публикации в канал %s возобновлены", channel_id)
+
+    async def probe(self, telegram_bot: telegram.Bot, channel_id: int) -> None:
+        """Проверяет, может ли бот снова публиковать в канал."""
+        try:
+            member = await telegram_bot.get_chat_member(chat_id=channel_id, user_id=telegram_bot.id)
+        except (error.Forbidden, error.BadRequest):
+            await self.mark_dead(channel_id)
+            return
+        except error.TelegramError as e:
+            # Канал останется в списке на проверку и будет проверен в следующий проход
+            logger.warning("Не удалось проверить канал %s: %s", channel_id, e)
+            return
+        await self.update_from_member(channel_id, member)
+
+    async def probe_due(self, telegram_bot: telegram.Bot) -> int:
+        """Проверяет каналы, пауза которых закончилась, и возвращает их количество."""
+        channel_ids = await base.channel_repository.get_due_for_probe(PROBE_BATCH_SIZE)
+        for channel_id in channel_ids:
+            await self.probe(telegram_bot, channel_id)
+        return len(channel_ids)
+
+    async def _run(self, telegram_bot: telegram.Bot) -> None:
+        while True:
+            await asyncio.sleep(self._probe_interval)
+            try:
+                await self.probe_due(telegram_bot)
+            except Exception:
+                logger.exception("Ошибка при проверке приостановленных каналов")
+
+    def start(self, telegram_bot: telegram.Bot) -> None:
+        self._task = asyncio.create_task(self._run(telegram_bot))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+@functools.cache
+def get_channel_health() -> ChannelHealth:
+    config = settings.get_settings()
+    return ChannelHealth(
+        base_delay=config.CHANNEL_SUSPEND_BASE_DELAY,
+        max_delay=config.CHANNEL_SUSPEND_MAX_DELAY,
+        dead_delay=config.CHANNEL_DEAD_PROBE_DELAY,
+        probe_interval=config.CHANNEL_PROBE_INTERVAL,
+    )
@@ -4,5 +4,9 @@ CALLBACK_CLOSE_MENU = "close_menu"
 CALLBACK_CHANNEL_MENU = "^-100"
 CALLBACK_BACK_TO_MAIN = "back_to_main"
 CALLBACK_EDIT_DESCRIPTION = "edit_description"
+CALLBACK_EDIT_SCHEDULE = "edit_schedule"
 CALLBACK_BACK_TO_CHANNELS = "back_to_channels"
 CALLBACK_REMOVE_BINDING = "remove_binding"
+CALLBACK_CHANNELS_AFTER = "channels_after_"
+CALLBACK_CHANNELS_BEFORE = "channels_before_"
+CALLBACK_CHANNELS_PAGE = "^channels_(after|before)_"
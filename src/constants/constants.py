@@ -1,3 +1,15 @@
 STOP_FORWARD = "stop_forward"
 CURRENT_CHANNEL = "current_channel"
-CURRENT_USER = "current_user"
+MEDIA_ANIMATION = "animation"
+MEDIA_PHOTO = "photo"
+MEDIA_VIDEO = "video"
+MEDIA_DOCUMENT = "document"
+MEDIA_AUDIO = "audio"
+MEDIA_VIDEO_NOTE = "video_note"
+OUTBOX_PENDING = "pending"
+OUTBOX_PROCESSING = "processing"
+OUTBOX_FAILED = "failed"
+MEDIA_GROUP = "media_group"
+CHANNEL_ACTIVE = "active"
+CHANNEL_SUSPENDED = "suspended"
+CHANNEL_DEAD = "dead"
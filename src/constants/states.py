@@ -3,3 +3,4 @@ BINDING = "binding"
 USER_CHANNELS_STATE = "user_channels"
 CHANNEL_MENU_STATE = "channel_menu"
 TYPING_DESCRIPTION = "change_description"
+TYPING_SCHEDULE = "change_schedule"
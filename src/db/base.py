@@ -1,99 +1,651 @@
-from typing import Generic, TypeVar
+import asyncio
+import contextlib
+import datetime
+import inspect
+import time
+from typing import AsyncIterator, Generic, Sequence, TypeVar
 
-from sqlalchemy import delete, exc, select, update
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import Row, delete, event, exc, func, insert, make_url, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
-from src import exceptions
-from src.db.models import Bind, Channel, User
-from src.settings import DATABASE_URL
+from src import exceptions, metrics, schedule, settings, tracing
+from src.constants import constants
+from src.db.models import Bind, Channel, ConversationState, Outbox, PostedMedia, PostStats, User, UserState
+
+
+def _engine_options(database_url: str) -> dict:
+    """Параметры пула соединений из настроек. SQLite использует собственный пул без этих параметров."""
+    config = settings.get_settings()
+    options = {"pool_pre_ping": config.DB_POOL_PRE_PING, "pool_recycle": config.DB_POOL_RECYCLE}
+    if make_url(database_url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+        )
+    return options
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    connection.info.setdefault("statement_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    """Учитывает длительность запроса в метриках с меткой вида запроса: SELECT, INSERT, UPDATE, DELETE."""
+    started = connection.info["statement_started"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper()
+    metrics.db_statement_duration.observe(time.perf_counter() - started, operation=operation)
+
+
+def _handle_error(context) -> None:
+    if context.connection is not None and context.connection.info.get("statement_started"):
+        context.connection.info["statement_started"].pop()
+    metrics.db_errors.inc(error=type(context.original_exception).__name__)
+
+
+# Сессии привязываются к движку при его создании
+async_session = async_sessionmaker(expire_on_commit=False)
+_engine: AsyncEngine | None = None
+
+
+def get_engine() -> AsyncEngine:
+    """Возвращает движок БД, при первом обращении создает его по DATABASE_URL.
+
+    Импорт модуля не читает настройки и не создает пул соединений: это происходит при первом запросе к БД
+    или при прогреве пула в warm_up.
+    """
+    global _engine
+    if _engine is None:
+        database_url = settings.get_settings().DATABASE_URL
+        _engine = create_async_engine(database_url, echo=False, **_engine_options(database_url))
+        event.listen(_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(_engine.sync_engine, "handle_error", _handle_error)
+        async_session.configure(bind=_engine)
+    return _engine
+
+
+async def warm_up(connections: int) -> None:
+    """Открывает до connections соединений пула заранее, чтобы первые update не ждали подключения к БД.
+
+    Соединения открываются одновременно и сразу возвращаются в пул. Больше размера пула не открывается:
+    лишние соединения пул закрыл бы при возврате.
+    """
+    engine = get_engine()
+    size = getattr(engine.pool, "size", None)
+    connections = min(connections, size()) if size is not None else min(connections, 1)
+    async with contextlib.AsyncExitStack() as stack:
+        await asyncio.gather(*(stack.enter_async_context(engine.connect()) for _ in range(connections)))
+
+
+async def dispose() -> None:
+    """Закрывает соединения пула. Следующий запрос к БД снова создаст движок."""
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
 
-engine = create_async_engine(DATABASE_URL, echo=False)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
 
 T = TypeVar("T")
 
+# Сколько строк вставлять одним INSERT ... ON CONFLICT: SQLite ограничивает количество параметров запроса
+UPSERT_CHUNK_SIZE = 500
+
+
+def utcnow() -> datetime.datetime:
+    """Текущее время в UTC без часового пояса - в таком виде время хранится в БД."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
 
 class BaseRepository(Generic[T]):
-    """Базовый репозиторий. Позволяет создавать объект в БД."""
+    """Базовый репозиторий. Позволяет создавать объект в БД.
+
+    Репозиторий не хранит сессию: каждая операция открывает свою сессию из пула и закрывает ее по завершении,
+    поэтому один и тот же репозиторий можно использовать из одновременно выполняющихся обработчиков.
+    """
 
-    def __init__(self, model: T, session: AsyncSession) -> None:
+    def __init__(self, model: T, session_factory: async_sessionmaker[AsyncSession]) -> None:
         self._model = model
-        self._session = session
+        self._session_factory = session_factory
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """Оборачивает публичные методы репозитория, в том числе унаследованные, в span трассировки update."""
+        super().__init_subclass__(**kwargs)
+        for name in dir(cls):
+            method = getattr(cls, name)
+            if not name.startswith("_") and inspect.iscoroutinefunction(method) and not hasattr(method, "span_name"):
+                setattr(cls, name, tracing.traced(f"db {cls.__name__}.{name}")(method))
+
+    @contextlib.asynccontextmanager
+    async def _unit_of_work(self) -> AsyncIterator[AsyncSession]:
+        """Открывает сессию на одну операцию. Транзакция фиксируется при выходе и откатывается при ошибке."""
+        # Сессии получают движок, только когда он создан
+        get_engine()
+        async with self._session_factory() as session, session.begin():
+            yield session
 
     async def create(self, new_data: T) -> T:
         """Создает объект текущей модели и возвращает его, иначе возвращает ошибку ObjectAlreadyExistsError."""
         try:
-            self._session.add(new_data)
-            await self._session.commit()
+            async with self._unit_of_work() as session:
+                session.add(new_data)
+                await session.flush()
+                await session.refresh(new_data)
         except exc.IntegrityError as e:
-            await self._session.rollback()
             raise exceptions.ObjectAlreadyExistsError(new_data) from e
-        else:
-            await self._session.refresh(new_data)
-            return new_data
-        finally:
-            await self._session.close()
+        return new_data
+
+    def _insert(self):
+        """INSERT с поддержкой ON CONFLICT для диалекта текущей БД: Postgres или SQLite."""
+        return (postgresql.insert if get_engine().dialect.name == "postgresql" else sqlite.insert)(self._model)
+
+    def _upsert(self, rows: list[dict], conflict_column: str, update_columns: tuple[str, ...]):
+        """INSERT ... ON CONFLICT (conflict_column) DO UPDATE для Postgres и SQLite.
+
+        При конфликте обновляются только update_columns и updated_at, остальные столбцы остаются прежними.
+        """
+        statement = self._insert().values(rows)
+        return statement.on_conflict_do_update(
+            index_elements=[conflict_column],
+            set_={**{column: statement.excluded[column] for column in update_columns}, "updated_at": func.now()},
+        )
+
+    async def _upsert_one(self, values: dict, conflict_column: str, update_columns: tuple[str, ...]) -> T:
+        statement = self._upsert([values], conflict_column, update_columns).returning(self._model)
+        async with self._unit_of_work() as session:
+            return await session.scalar(statement, execution_options={"populate_existing": True})
+
+    async def _upsert_many(self, rows: list[dict], conflict_column: str, update_columns: tuple[str, ...]) -> None:
+        async with self._unit_of_work() as session:
+            for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                chunk = rows[start : start + UPSERT_CHUNK_SIZE]
+                await session.execute(self._upsert(chunk, conflict_column, update_columns))
 
 
 class UserRepository(BaseRepository[User]):
     """Репозиторий для работы с моделью User в БД."""
 
-    def __init__(self) -> None:
-        super().__init__(User, async_session())
+    # Данные профиля Telegram, которые обновляются при повторной регистрации
+    PROFILE_COLUMNS = ("first_name", "last_name", "username")
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        super().__init__(User, session_factory)
+
+    async def upsert(self, values: dict) -> User:
+        """Создает пользователя или обновляет данные профиля, если пользователь с таким account_id уже есть."""
+        return await self._upsert_one(values, "account_id", self.PROFILE_COLUMNS)
+
+    async def upsert_many(self, rows: list[dict]) -> None:
+        """Как upsert, но для многих пользователей сразу, например для загрузки существующей базы пользователей."""
+        await self._upsert_many(rows, "account_id", self.PROFILE_COLUMNS)
 
     async def get(self, account_id: int) -> User:
         """Возвращает объект User из БД по его account_id, иначе возвращает ошибку UserNotFoundError."""
         try:
-            user = await self._session.scalars(select(self._model).where(self._model.account_id == account_id))
-            return user.one()
+            async with self._unit_of_work() as session:
+                user = await session.scalars(select(self._model).where(self._model.account_id == account_id))
+                return user.one()
         except exc.NoResultFound as e:
             raise exceptions.UserNotFoundError(account_id) from e
-        finally:
-            await self._session.close()
 
 
 class ChannelRepository(BaseRepository[Channel]):
     """Репозиторий для работы с моделью Channel в БД."""
 
-    def __init__(self) -> None:
-        super().__init__(Channel, async_session())
+    PROFILE_COLUMNS = ("title", "username")
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        super().__init__(Channel, session_factory)
+
+    async def upsert(self, values: dict) -> Channel:
+        """Создает канал или обновляет его название и username, если канал с таким channel_id уже есть."""
+        return await self._upsert_one(values, "channel_id", self.PROFILE_COLUMNS)
+
+    async def upsert_many(self, rows: list[dict]) -> None:
+        """Как upsert, но для многих каналов сразу."""
+        await self._upsert_many(rows, "channel_id", self.PROFILE_COLUMNS)
 
     async def get(self, channel_id: int) -> Channel:
         """Возвращает объект Channel из БД по его channel_id, иначе возвращает ошибку ChannelNotFoundError."""
         try:
-            channel = await self._session.scalars(select(self._model).where(self._model.channel_id == channel_id))
-            return channel.one()
+            async with self._unit_of_work() as session:
+                channel = await session.scalars(select(self._model).where(self._model.channel_id == channel_id))
+                return channel.one()
         except exc.NoResultFound as e:
             raise exceptions.ChannelNotFoundError(channel_id) from e
-        finally:
-            await self._session.close()
+
+    async def suspend(self, channel_id: int, status: str, base_delay: float, max_delay: float) -> float | None:
+        """Приостанавливает публикации в канал и возвращает длительность паузы в секундах.
+
+        Каждая следующая неудача подряд удваивает паузу, но не дольше max_delay. Если канала нет в БД, возвращает None.
+        """
+        async with self._unit_of_work() as session:
+            channel = await session.scalar(select(self._model).where(self._model.channel_id == channel_id))
+            if channel is None:
+                return None
+            channel.failures += 1
+            delay = min(base_delay * 2 ** min(channel.failures - 1, 32), max_delay)
+            channel.status = status
+            channel.suspended_until = utcnow() + datetime.timedelta(seconds=delay)
+            return delay
+
+    async def activate(self, channel_id: int) -> bool:
+        """Возобновляет публикации в канал. Возвращает False, если канал и так был активен."""
+        async with self._unit_of_work() as session:
+            result = await session.execute(
+                update(self._model)
+                .where(self._model.channel_id == channel_id, self._model.status != constants.CHANNEL_ACTIVE)
+                .values(status=constants.CHANNEL_ACTIVE, suspended_until=None, failures=0),
+            )
+            return result.rowcount > 0
+
+    async def get_due_for_probe(self, limit: int) -> list[int]:
+        """Возвращает channel_id до limit каналов, пауза публикаций в которые уже закончилась."""
+        query = (
+            select(self._model.channel_id)
+            .where(
+                self._model.status.in_([constants.CHANNEL_SUSPENDED, constants.CHANNEL_DEAD]),
+                self._model.suspended_until <= utcnow(),
+            )
+            .order_by(self._model.suspended_until)
+            .limit(limit)
+        )
+        async with self._unit_of_work() as session:
+            return list(await session.scalars(query))
 
 
 class BindRepository(BaseRepository[Bind]):
     """Репозиторий для работы с моделью Bind в БД."""
 
-    def __init__(self) -> None:
-        super().__init__(Bind, async_session())
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        super().__init__(Bind, session_factory)
+
+    async def get_targets(self, account_id: int) -> Sequence[Row[tuple[int, str, str | None, bool]]]:
+        """Возвращает каналы пользователя одним запросом без загрузки моделей.
+
+        Строки вида (channel_id, title, description, has_schedule), has_schedule - задано ли у привязки расписание
+        публикаций. Каналы, публикации в которые приостановлены, не возвращаются.
+        """
+        query = (
+            select(Channel.channel_id, Channel.title, self._model.description, self._has_schedule())
+            .join(self._model.channel)
+            .join(self._model.user)
+            .where(User.account_id == account_id, Channel.status == constants.CHANNEL_ACTIVE)
+        )
+        async with self._unit_of_work() as session:
+            rows = await session.execute(query)
+            return rows.all()
+
+    async def get_page(
+        self,
+        account_id: int,
+        limit: int,
+        after: int | None = None,
+        before: int | None = None,
+    ) -> Sequence[Row[tuple[int, int, str]]]:
+        """Возвращает (id, channel_id, title) до limit каналов пользователя по возрастанию id канала.
+
+        Если задан after - каналы с id больше after, если before - ближайшие каналы с id меньше before.
+        Выборка идет по первичному ключу Bind без OFFSET, поэтому время не зависит от номера страницы.
+        """
+        user_id = select(User.id).where(User.account_id == account_id).scalar_subquery()
+        query = (
+            select(Channel.id, Channel.channel_id, Channel.title)
+            .join(self._model.channel)
+            .where(self._model.user_id == user_id)
+        )
+        if before is not None:
+            query = query.where(self._model.channel_id < before).order_by(self._model.channel_id.desc())
+        else:
+            if after is not None:
+                query = query.where(self._model.channel_id > after)
+            query = query.order_by(self._model.channel_id)
+        async with self._unit_of_work() as session:
+            rows = (await session.execute(query.limit(limit))).all()
+        return rows[::-1] if before is not None else rows
+
+    async def get_account_ids(self, channel_id: int) -> list[int]:
+        """Возвращает account_id пользователей, к которым привязан канал с channel_id."""
+        query = (
+            select(User.account_id)
+            .join(self._model.user)
+            .join(self._model.channel)
+            .where(Channel.channel_id == channel_id)
+        )
+        async with self._unit_of_work() as session:
+            return list(await session.scalars(query))
+
+    def _has_schedule(self):
+        return or_(self._model.post_interval.is_not(None), self._model.post_slots.is_not(None))
+
+    def _by_ids(self, account_id: int, channel_id: int) -> tuple:
+        """Условие выборки Bind по account_id пользователя и channel_id канала без загрузки их моделей."""
+        return (
+            self._model.user_id == select(User.id).where(User.account_id == account_id).scalar_subquery(),
+            self._model.channel_id == select(Channel.id).where(Channel.channel_id == channel_id).scalar_subquery(),
+        )
+
+    async def update_description(self, account_id: int, channel_id: int, new_description: str) -> None:
+        """Обновляет описание у Bind пользователя с account_id и канала с channel_id."""
+        async with self._unit_of_work() as session:
+            await session.execute(
+                update(self._model).where(*self._by_ids(account_id, channel_id)).values(description=new_description),
+            )
+
+    async def get_schedule(self, account_id: int, channel_id: int) -> Row[tuple[int | None, str | None]] | None:
+        """Возвращает (post_interval, post_slots) Bind пользователя с account_id и канала с channel_id."""
+        query = select(self._model.post_interval, self._model.post_slots).where(*self._by_ids(account_id, channel_id))
+        async with self._unit_of_work() as session:
+            return (await session.execute(query)).first()
+
+    async def update_schedule(
+        self,
+        account_id: int,
+        channel_id: int,
+        post_interval: int | None,
+        post_slots: str | None,
+    ) -> None:
+        """Обновляет расписание публикаций Bind. Новое расписание отсчитывается от следующей публикации."""
+        async with self._unit_of_work() as session:
+            await session.execute(
+                update(self._model)
+                .where(*self._by_ids(account_id, channel_id))
+                .values(post_interval=post_interval, post_slots=post_slots, next_post_at=None),
+            )
+
+    async def remove(self, account_id: int, channel_id: int) -> None:
+        """Удаляет связь канала и пользователя.
+
+        В той же транзакции из очереди удаляются неотправленные публикации пользователя в этот канал, в том числе
+        отложенные по расписанию, чтобы они не попали в отключенный канал.
+        """
+        async with self._unit_of_work() as session:
+            await session.execute(delete(self._model).where(*self._by_ids(account_id, channel_id)))
+            await session.execute(
+                delete(Outbox).where(
+                    Outbox.account_id == account_id,
+                    Outbox.chat_id == channel_id,
+                    Outbox.status.in_([constants.OUTBOX_PENDING, constants.OUTBOX_PROCESSING]),
+                ),
+            )
+
+
+class OutboxRepository(BaseRepository[Outbox]):
+    """Репозиторий для работы с очередью публикаций Outbox в БД."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        super().__init__(Outbox, session_factory)
+        self._schedule_lock = asyncio.Lock()
+
+    @property
+    def _skip_locked(self) -> bool:
+        # В Postgres воркеры разбирают строки через SELECT ... FOR UPDATE SKIP LOCKED. SQLite такого не поддерживает,
+        # поэтому строки выбираются и помечаются одним запросом UPDATE ... RETURNING, который SQLite выполняет
+        # атомарно, в том числе когда очередь разбирают несколько процессов
+        return get_engine().dialect.name == "postgresql"
 
-    async def update_description(self, user_id: int, channel_id: int, new_description: str) -> None:
-        """Обновляет описание у Bind с полученными user_id и channel_id."""
-        await self._session.execute(
+    async def add_many(self, rows: list[dict]) -> None:
+        """Добавляет публикации в очередь одним запросом."""
+        async with self._unit_of_work() as session:
+            await session.execute(insert(self._model), rows)
+
+    async def add_scheduled(self, account_id: int, rows: list[dict]) -> None:
+        """Добавляет публикации пользователя в очередь с учетом расписаний его каналов.
+
+        Публикация в канал с расписанием получает next_attempt_at - ближайшее свободное время по расписанию,
+        и воркеры заберут ее из очереди не раньше этого времени. Расписания занимаются и публикации добавляются
+        в одной транзакции. В Postgres привязки блокируются через SELECT ... FOR UPDATE, в SQLite - блокировкой
+        внутри процесса.
+        """
+        query = (
+            select(Bind, Channel.channel_id)
+            .join(Bind.channel)
+            .join(Bind.user)
+            .where(
+                User.account_id == account_id,
+                Channel.channel_id.in_({row["chat_id"] for row in rows}),
+                or_(Bind.post_interval.is_not(None), Bind.post_slots.is_not(None)),
+            )
+        )
+        if self._skip_locked:
+            query = query.with_for_update(of=Bind)
+        now = utcnow()
+        lock = contextlib.nullcontext() if self._skip_locked else self._schedule_lock
+        async with lock, self._unit_of_work() as session:
+            binds = {chat_id: bind for bind, chat_id in await session.execute(query)}
+            for row in rows:
+                bind = binds.get(row["chat_id"])
+                if bind is not None:
+                    row["next_attempt_at"] = schedule.take_slot(bind, now)
+            await session.execute(insert(self._model), rows)
+
+    async def claim(self, limit: int, lock_timeout: float) -> list[Outbox]:
+        """Забирает из очереди до limit готовых к отправке публикаций.
+
+        Забранные строки получают статус processing и становятся снова доступны через lock_timeout секунд,
+        если воркер не успел их обработать (например, процесс был остановлен). Пока воркер отправляет публикации,
+        он продлевает блокировку через extend.
+        """
+        now = utcnow()
+        query = (
+            select(self._model)
+            .where(
+                self._model.status.in_([constants.OUTBOX_PENDING, constants.OUTBOX_PROCESSING]),
+                self._model.next_attempt_at <= now,
+            )
+            .order_by(self._model.next_attempt_at)
+            .limit(limit)
+        )
+        if self._skip_locked:
+            async with self._unit_of_work() as session:
+                rows = list(await session.scalars(query.with_for_update(skip_locked=True)))
+                for row in rows:
+                    row.status = constants.OUTBOX_PROCESSING
+                    row.attempts += 1
+                    row.next_attempt_at = now + datetime.timedelta(seconds=lock_timeout)
+            return rows
+        statement = (
             update(self._model)
-            .where(self._model.user_id == user_id and self._model.channel_id == channel_id)
-            .values(description=new_description),
+            .where(self._model.id.in_(query.with_only_columns(self._model.id)))
+            .values(
+                status=constants.OUTBOX_PROCESSING,
+                attempts=self._model.attempts + 1,
+                next_attempt_at=now + datetime.timedelta(seconds=lock_timeout),
+            )
+            .returning(self._model)
         )
-        await self._session.commit()
-        await self._session.close()
+        async with self._unit_of_work() as session:
+            return list(await session.scalars(statement, execution_options={"synchronize_session": False}))
+
+    async def extend(self, ids: list[int], lock_timeout: float) -> None:
+        """Продлевает блокировку забранных публикаций еще на lock_timeout секунд от текущего времени."""
+        async with self._unit_of_work() as session:
+            await session.execute(
+                update(self._model)
+                .where(self._model.id.in_(ids), self._model.status == constants.OUTBOX_PROCESSING)
+                .values(next_attempt_at=utcnow() + datetime.timedelta(seconds=lock_timeout)),
+            )
+
+    async def count_pending(self) -> int:
+        """Возвращает количество публикаций, которые еще не отправлены и не помечены как неотправляемые."""
+        query = (
+            select(func.count())
+            .select_from(self._model)
+            .where(self._model.status.in_([constants.OUTBOX_PENDING, constants.OUTBOX_PROCESSING]))
+        )
+        async with self._unit_of_work() as session:
+            return await session.scalar(query)
+
+    async def complete(self, ids: list[int]) -> None:
+        """Удаляет отправленные публикации из очереди."""
+        async with self._unit_of_work() as session:
+            await session.execute(delete(self._model).where(self._model.id.in_(ids)))
+
+    async def retry(self, row_id: int, delay: float, error: str) -> None:
+        """Возвращает публикацию в очередь, отправка повторится через delay секунд."""
+        async with self._unit_of_work() as session:
+            await session.execute(
+                update(self._model)
+                .where(self._model.id == row_id)
+                .values(
+                    status=constants.OUTBOX_PENDING,
+                    next_attempt_at=utcnow() + datetime.timedelta(seconds=delay),
+                    last_error=error,
+                ),
+            )
+
+    async def fail(self, ids: list[int], error: str) -> None:
+        """Помечает публикации как неотправляемые. Такие строки больше не забираются воркерами."""
+        async with self._unit_of_work() as session:
+            await session.execute(
+                update(self._model)
+                .where(self._model.id.in_(ids))
+                .values(status=constants.OUTBOX_FAILED, last_error=error),
+            )
+
+    async def release(self, ids: list[int]) -> None:
+        """Возвращает забранные публикации в очередь сразу, не дожидаясь lock_timeout. Попытка не засчитывается."""
+        async with self._unit_of_work() as session:
+            await session.execute(
+                update(self._model)
+                .where(self._model.id.in_(ids), self._model.status == constants.OUTBOX_PROCESSING)
+                .values(status=constants.OUTBOX_PENDING, attempts=self._model.attempts - 1, next_attempt_at=utcnow()),
+            )
+
+
+class UserStateRepository(BaseRepository[UserState]):
+    """Репозиторий для работы с состоянием пользователей UserState в БД."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        super().__init__(UserState, session_factory)
+
+    async def get(self, account_id: int) -> UserState | None:
+        """Возвращает состояние пользователя или None, если оно еще не сохранялось."""
+        async with self._unit_of_work() as session:
+            return await session.get(self._model, account_id)
+
+    async def save_many(self, rows: list[dict]) -> None:
+        """Сохраняет состояния пользователей одним INSERT ... ON CONFLICT на пачку строк."""
+        await self._upsert_many(rows, "account_id", ("stop_forward", "current_channel_id"))
+
+    async def remove(self, account_id: int) -> None:
+        async with self._unit_of_work() as session:
+            await session.execute(delete(self._model).where(self._model.account_id == account_id))
+
+
+class ConversationStateRepository(BaseRepository[ConversationState]):
+    """Репозиторий для работы с состояниями диалогов ConversationState в БД."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        super().__init__(ConversationState, session_factory)
+
+    async def get_all(self, name: str) -> Sequence[Row[tuple[str, str]]]:
+        """Возвращает (key, state) всех незавершенных диалогов с этим name."""
+        async with self._unit_of_work() as session:
+            rows = await session.execute(
+                select(self._model.key, self._model.state).where(self._model.name == name),
+            )
+            return rows.all()
+
+    async def save_many(self, rows: list[dict], finished: list[tuple[str, str]]) -> None:
+        """Сохраняет состояния диалогов и удаляет завершенные диалоги, заданные парами (name, key)."""
+        async with self._unit_of_work() as session:
+            keys = [*finished, *((row["name"], row["key"]) for row in rows)]
+            await session.execute(delete(self._model).where(tuple_(self._model.name, self._model.key).in_(keys)))
+            if rows:
+                await session.execute(insert(self._model), rows)
+
+
+class PostedMediaRepository(BaseRepository[PostedMedia]):
+    """Репозиторий для работы с индексом опубликованных вложений PostedMedia в БД."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        super().__init__(PostedMedia, session_factory)
+
+    async def add_new(self, media_key: str, channel_ids: list[int], retention: float) -> set[int]:
+        """Записывает вложение с media_key в каналы channel_ids и возвращает каналы, в которых оно новое.
+
+        Вложение новое, если в канал оно не публиковалось или публиковалось раньше, чем retention секунд назад.
+        Проверка и запись выполняются одним INSERT ... ON CONFLICT DO UPDATE ... WHERE: строка повтора
+        не обновляется и не возвращается.
+        """
+        now = utcnow()
+        statement = self._insert().values(
+            [{"channel_id": channel_id, "media_key": media_key, "posted_at": now} for channel_id in channel_ids],
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["channel_id", "media_key"],
+            set_={"posted_at": statement.excluded.posted_at, "updated_at": func.now()},
+            where=self._model.posted_at < now - datetime.timedelta(seconds=retention),
+        )
+        async with self._unit_of_work() as session:
+            return set(await session.scalars(statement.returning(self._model.channel_id)))
+
+    async def remove(self, keys: list[tuple[int, str]]) -> None:
+        """Удаляет вложения по парам (channel_id, media_key)."""
+        async with self._unit_of_work() as session:
+            await session.execute(
+                delete(self._model).where(tuple_(self._model.channel_id, self._model.media_key).in_(keys)),
+            )
+
+    async def remove_older(self, retention: float) -> None:
+        """Удаляет вложения, опубликованные раньше, чем retention секунд назад."""
+        cutoff = utcnow() - datetime.timedelta(seconds=retention)
+        async with self._unit_of_work() as session:
+            await session.execute(delete(self._model).where(self._model.posted_at < cutoff))
+
+
+class PostStatsRepository(BaseRepository[PostStats]):
+    """Репозиторий для работы с дневной статистикой публикаций PostStats в БД."""
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        super().__init__(PostStats, session_factory)
+
+    async def add_many(self, rows: list[dict]) -> None:
+        """Прибавляет счетчики к статистике за день одним INSERT ... ON CONFLICT на каждые UPSERT_CHUNK_SIZE строк."""
+        async with self._unit_of_work() as session:
+            for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                statement = self._insert().values(rows[start : start + UPSERT_CHUNK_SIZE])
+                statement = statement.on_conflict_do_update(
+                    index_elements=["account_id", "day", "chat_id"],
+                    set_={
+                        **{
+                            column: getattr(self._model, column) + statement.excluded[column]
+                            for column in ("posts", "failures", "latency_total")
+                        },
+                        "updated_at": func.now(),
+                    },
+                )
+                await session.execute(statement)
+
+    async def get_summary(self, account_id: int, since: datetime.date) -> Sequence[Row]:
+        """Возвращает статистику пользователя с дня since по каналам: (chat_id, title, posts, failures, latency_total).
 
-    async def remove(self, user_id: int, channel_id: int) -> None:
-        """Удаляет связь канала и пользователя."""
-        await self._session.execute(
-            delete(self._model).where(self._model.user_id == user_id and self._model.channel_id == channel_id),
+        Название канала пустое, если канал удален из БД.
+        """
+        query = (
+            select(
+                self._model.chat_id,
+                Channel.title,
+                func.sum(self._model.posts),
+                func.sum(self._model.failures),
+                func.sum(self._model.latency_total),
+            )
+            .outerjoin(Channel, Channel.channel_id == self._model.chat_id)
+            .where(self._model.account_id == account_id, self._model.day >= since)
+            .group_by(self._model.chat_id, Channel.title)
+            .order_by(Channel.title)
         )
-        await self._session.commit()
-        await self._session.close()
+        async with self._unit_of_work() as session:
+            return (await session.execute(query)).all()
 
 
-user_repository = UserRepository()
-channel_repository = ChannelRepository()
-bind_repository = BindRepository()
+user_repository = UserRepository(async_session)
+channel_repository = ChannelRepository(async_session)
+bind_repository = BindRepository(async_session)
+outbox_repository = OutboxRepository(async_session)
+user_state_repository = UserStateRepository(async_session)
+conversation_state_repository = ConversationStateRepository(async_session)
+posted_media_repository = PostedMediaRepository(async_session)
+post_stats_repository = PostStatsRepository(async_session)
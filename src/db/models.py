@@ -1,9 +1,11 @@
 import datetime
 from typing import List, Optional
 
-from sqlalchemy import BigInteger, ForeignKey, func
+from sqlalchemy import JSON, BigInteger, ForeignKey, Index, String, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
+from src.constants import constants
+
 
 class Base(DeclarativeBase):
     """Базовая модель."""
@@ -17,10 +19,17 @@ class Bind(Base):
 
     __tablename__ = "bind"
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), primary_key=True)
-    channel_id: Mapped[int] = mapped_column(ForeignKey("channel.id"), primary_key=True)
+    # Индекс нужен для выборки привязок канала: первичный ключ начинается с user_id
+    channel_id: Mapped[int] = mapped_column(ForeignKey("channel.id"), primary_key=True, index=True)
     description: Mapped[Optional[str]]
-    user: Mapped["User"] = relationship(back_populates="channels", lazy="selectin")
-    channel: Mapped["Channel"] = relationship(back_populates="users", lazy="selectin")
+    # Расписание публикаций в канал: не чаще одной в post_interval минут или по одной во время из post_slots
+    # вида "09:00,18:30" (UTC). Без расписания публикации отправляются сразу
+    post_interval: Mapped[Optional[int]]
+    post_slots: Mapped[Optional[str]]
+    # Не раньше этого времени по расписанию можно отправить следующую публикацию
+    next_post_at: Mapped[Optional[datetime.datetime]]
+    user: Mapped["User"] = relationship(back_populates="channels")
+    channel: Mapped["Channel"] = relationship(back_populates="users")
 
     @classmethod
     def new_bind(cls, user_id: int, channel_id: int) -> "Bind":
@@ -43,25 +52,30 @@ class User(Base):
 
     __tablename__ = "user"
     id: Mapped[int] = mapped_column(primary_key=True)
-    account_id: Mapped[int] = mapped_column(unique=True)
+    # Идентификаторы пользователей Telegram не помещаются в 32 бита
+    account_id: Mapped[int] = mapped_column(BigInteger, unique=True)
     first_name: Mapped[str]
     last_name: Mapped[Optional[str]]
     username: Mapped[Optional[str]]
     channels: Mapped[List["Bind"]] = relationship(
         back_populates="user",
-        lazy="selectin",
         cascade="all, delete-orphan",
     )
 
     @classmethod
     def from_parse(cls, user_data: dict) -> "User":
         """Парсит данные из data в модель User."""
-        return cls(
-            account_id=user_data["id"],
-            first_name=user_data["first_name"],
-            last_name=user_data.get("last_name", None),
-            username=user_data.get("username", None),
-        )
+        return cls(**cls.parse_values(user_data))
+
+    @staticmethod
+    def parse_values(user_data: dict) -> dict:
+        """Парсит данные из data в значения столбцов User."""
+        return {
+            "account_id": user_data["id"],
+            "first_name": user_data["first_name"],
+            "last_name": user_data.get("last_name", None),
+            "username": user_data.get("username", None),
+        }
 
     def __repr__(self) -> str:
         return (
@@ -78,24 +92,35 @@ class Channel(Base):
     """Модель канала."""
 
     __tablename__ = "channel"
+    __table_args__ = (Index("ix_channel_status_suspended_until", "status", "suspended_until"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     channel_id: Mapped[int] = mapped_column(BigInteger, unique=True)
     title: Mapped[str]
     username: Mapped[Optional[str]]
+    # Можно ли публиковать в канал: active, suspended (у бота не хватает прав) или dead (бот удален из канала)
+    status: Mapped[str] = mapped_column(default=constants.CHANNEL_ACTIVE, server_default=constants.CHANNEL_ACTIVE)
+    # Когда закончится пауза публикаций и канал нужно проверить
+    suspended_until: Mapped[Optional[datetime.datetime]]
+    # Неудачи подряд, от них зависит длительность паузы
+    failures: Mapped[int] = mapped_column(default=0, server_default="0")
     users: Mapped[List["Bind"]] = relationship(
         back_populates="channel",
-        lazy="selectin",
         cascade="all, delete-orphan",
     )
 
     @classmethod
     def from_parse(cls, channel_data: dict) -> "Channel":
-        """Парсит данные из data в модель User."""
-        return cls(
-            channel_id=channel_data["id"],
-            title=channel_data["title"],
-            username=channel_data.get("username", None),
-        )
+        """Парсит данные из data в модель Channel."""
+        return cls(**cls.parse_values(channel_data))
+
+    @staticmethod
+    def parse_values(channel_data: dict) -> dict:
+        """Парсит данные из data в значения столбцов Channel."""
+        return {
+            "channel_id": channel_data["id"],
+            "title": channel_data["title"],
+            "username": channel_data.get("username", None),
+        }
 
     def __repr__(self) -> str:
         return (
@@ -103,5 +128,113 @@ class Channel(Base):
             f"id={self.id!r}, "
             f"channel_id={self.channel_id!r}, "
             f"title={self.title!r}, "
-            f"username={self.username})"
+            f"username={self.username!r}, "
+            f"status={self.status!r})"
+        )
+
+
+class Outbox(Base):
+    """Модель очереди публикаций: одна строка на одно вложение для одного канала пользователя."""
+
+    __tablename__ = "outbox"
+    __table_args__ = (Index("ix_outbox_status_next_attempt_at", "status", "next_attempt_at"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    account_id: Mapped[int] = mapped_column(BigInteger)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    channel_title: Mapped[str]
+    media_type: Mapped[str]
+    file_id: Mapped[str]
+    # Сообщение пользователя в чате с ботом (chat_id = account_id), которое копируется в канал.
+    # Пусто у публикаций, поставленных в очередь до перехода на копирование: они отправляются по file_id
+    message_id: Mapped[Optional[int]] = mapped_column(BigInteger)
+    caption: Mapped[Optional[str]]
+    # Для альбома (media_type = media_group): список вложений вида {"type": ..., "file_id": ..., "message_id": ...}
+    media: Mapped[Optional[list]] = mapped_column(JSON)
+    status: Mapped[str] = mapped_column(default=constants.OUTBOX_PENDING)
+    attempts: Mapped[int] = mapped_column(default=0)
+    next_attempt_at: Mapped[datetime.datetime]
+    last_error: Mapped[Optional[str]]
+    # Ключ вложения в индексе опубликованных вложений: если публикация не удалась, вложение можно прислать снова
+    media_key: Mapped[Optional[str]] = mapped_column(String(64))
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__qualname__}("
+            f"id={self.id!r}, "
+            f"chat_id={self.chat_id!r}, "
+            f"media_type={self.media_type!r}, "
+            f"status={self.status!r}, "
+            f"attempts={self.attempts!r})"
+        )
+
+
+class UserState(Base):
+    """Модель состояния пользователя в боте: только флаги и идентификаторы, которые хранятся в user_data."""
+
+    __tablename__ = "user_state"
+    account_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    stop_forward: Mapped[bool] = mapped_column(default=False)
+    # channel_id канала, открытого в меню
+    current_channel_id: Mapped[Optional[int]] = mapped_column(BigInteger)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__qualname__}("
+            f"account_id={self.account_id!r}, "
+            f"stop_forward={self.stop_forward!r}, "
+            f"current_channel_id={self.current_channel_id!r})"
+        )
+
+
+class ConversationState(Base):
+    """Модель состояния диалога ConversationHandler. Ключ диалога хранится в виде JSON списка идентификаторов."""
+
+    __tablename__ = "conversation_state"
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    state: Mapped[str]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__qualname__}(name={self.name!r}, key={self.key!r}, state={self.state!r})"
+
+
+class PostedMedia(Base):
+    """Модель опубликованных вложений: повторно присланное вложение не публикуется в тот же канал."""
+
+    __tablename__ = "posted_media"
+    channel_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # file_unique_id вложения или хэш file_unique_id вложений альбома
+    media_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    posted_at: Mapped[datetime.datetime] = mapped_column(index=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__qualname__}("
+            f"channel_id={self.channel_id!r}, "
+            f"media_key={self.media_key!r}, "
+            f"posted_at={self.posted_at!r})"
+        )
+
+
+class PostStats(Base):
+    """Модель статистики публикаций: одна строка на пользователя, канал и день (UTC)."""
+
+    __tablename__ = "post_stats"
+    # Порядок столбцов ключа повторяет выборку /stats: публикации пользователя за последние дни
+    account_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    day: Mapped[datetime.date] = mapped_column(primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    posts: Mapped[int] = mapped_column(default=0)
+    failures: Mapped[int] = mapped_column(default=0)
+    # Сумма задержек от постановки в очередь до публикации, секунды
+    latency_total: Mapped[float] = mapped_column(default=0)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__qualname__}("
+            f"account_id={self.account_id!r}, "
+            f"day={self.day!r}, "
+            f"chat_id={self.chat_id!r}, "
+            f"posts={self.posts!r}, "
+            f"failures={self.failures!r})"
         )
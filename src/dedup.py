@@ -0,0 +1,123 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+from typing import AsyncIterator, Iterable
+
+from src import services, settings
+from src.db import base
+
+logger = logging.getLogger(__name__)
+
+# На сколько корзин по времени делится множество недавно записанных вложений
+BUCKETS = 8
+# Как часто удалять из БД вложения старше срока хранения, секунды
+PRUNE_INTERVAL = 3600
+
+
+class PostedMediaIndex:
+    """Индекс вложений, опубликованных в каналы за последние retention секунд.
+
+    Перед таблицей posted_media в памяти лежит множество хэшей (channel_id, ключ вложения), которые записал этот
+    процесс. Оно разбито на BUCKETS корзин по времени, устаревшие корзины отбрасываются целиком. Повтор, который
+    есть в памяти, находится без запроса к БД. Вложения, которых в памяти нет, записываются одним
+    INSERT ... ON CONFLICT, который заодно находит повторы, записанные другими процессами или до перезапуска.
+    """
+
+    def __init__(self, retention: float) -> None:
+        self._retention = retention
+        self._bucket_length = retention / BUCKETS
+        self._buckets: dict[int, set[int]] = {}
+        self._task: asyncio.Task | None = None
+
+    def _bucket(self) -> int:
+        return int(time.monotonic() / self._bucket_length)
+
+    def _seen(self, channel_id: int, media_key: str) -> bool:
+        current = self._bucket()
+        for bucket in [bucket for bucket in self._buckets if bucket <= current - BUCKETS]:
+            del self._buckets[bucket]
+        key = hash((channel_id, media_key))
+        return any(key in keys for keys in self._buckets.values())
+
+    async def split_new(
+        self,
+        targets: Iterable[services.BindTarget],
+        media_key: str,
+    ) -> tuple[list[services.BindTarget], list[services.BindTarget]]:
+        """Делит каналы на те, в которые вложение еще не публиковалось, и повторы. Новые каналы запоминаются."""
+        if not self._retention:
+            return list(targets), []
+        new = []
+        duplicates = []
+        for target in targets:
+            (duplicates if self._seen(target.channel_id, media_key) else new).append(target)
+        if not new:
+            return new, duplicates
+        added = await base.posted_media_repository.add_new(
+            media_key,
+            [target.channel_id for target in new],
+            self._retention,
+        )
+        keys = self._buckets.setdefault(self._bucket(), set())
+        keys.update(hash((channel_id, media_key)) for channel_id in added)
+        duplicates.extend(target for target in new if target.channel_id not in added)
+        return [target for target in new if target.channel_id in added], duplicates
+
+    @contextlib.asynccontextmanager
+    async def reserve(
+        self,
+        targets: Iterable[services.BindTarget],
+        media_key: str,
+    ) -> AsyncIterator[tuple[list[services.BindTarget], list[services.BindTarget]]]:
+        """Как split_new, но новые каналы забываются, если блок завершился ошибкой.
+
+        Вложение запоминается раньше, чем публикации ставятся в очередь, отдельной транзакцией. Если поставить их
+        в очередь не удалось, вложение не должно считаться повтором весь срок хранения.
+        """
+        new, duplicates = await self.split_new(targets, media_key)
+        try:
+            yield new, duplicates
+        except Exception:
+            await self.forget([(target.channel_id, media_key) for target in new])
+            raise
+
+    async def forget(self, keys: list[tuple[int, str]]) -> None:
+        """Удаляет вложения по парам (channel_id, ключ вложения), например если публикация не удалась."""
+        if not self._retention or not keys:
+            return
+        hashes = {hash(key) for key in keys}
+        for bucket_keys in self._buckets.values():
+            bucket_keys -= hashes
+        await base.posted_media_repository.remove(keys)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await base.posted_media_repository.remove_older(self._retention)
+            except Exception:
+                logger.exception("Не удалось удалить устаревшие записи об опубликованных вложениях")
+            await asyncio.sleep(PRUNE_INTERVAL)
+
+    def start(self) -> None:
+        if self._retention:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+def duplicates_summary(duplicates: Iterable[services.BindTarget]) -> str:
+    """Текст для пользователя о каналах, в которые вложение не опубликовано как повтор."""
+    titles = "\n".join(f"'{target.title}'" for target in duplicates)
+    return f"Это вложение уже публиковалось, повторно оно не отправлено в каналы:\n{titles}"
+
+
+@functools.cache
+def get_posted_media() -> PostedMediaIndex:
+    return PostedMediaIndex(settings.get_settings().DEDUP_RETENTION)
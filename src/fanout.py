@@ -0,0 +1,86 @@
+import asyncio
+import enum
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, Iterable, TypeVar
+
+from telegram import error
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class PostStatus(str, enum.Enum):
+    """Результат публикации вложения в канал."""
+
+    OK = "ok"
+    FORBIDDEN = "forbidden"
+    BAD_REQUEST = "bad_request"
+    RETRY_AFTER = "retry_after"
+    NETWORK_ERROR = "network_error"
+    ERROR = "error"
+
+
+FAILURE_REASONS = {
+    PostStatus.FORBIDDEN: "Бот удален из канала, публикации в канал приостановлены до его возвращения",
+    PostStatus.BAD_REQUEST: "У бота недостаточно прав",
+    PostStatus.RETRY_AFTER: "Превышен лимит отправки сообщений, попробуйте позже",
+    PostStatus.NETWORK_ERROR: "Ошибка соединения с Telegram",
+    PostStatus.ERROR: "Непредвиденная ошибка при отправке",
+}
+
+
+@dataclass(frozen=True)
+class PostResult(Generic[T]):
+    item: T
+    status: PostStatus
+    # Для RETRY_AFTER - через сколько секунд Telegram разрешает повторить запрос
+    retry_after: int | None = None
+    error: str | None = None
+
+
+async def _post(item: T, send: Callable[[T], Awaitable[None]], semaphore: asyncio.Semaphore) -> PostResult[T]:
+    """Публикует одно вложение и возвращает статус публикации вместо исключения.
+
+    Непредвиденные ошибки пишутся в лог и возвращаются как ERROR, чтобы результат был у каждого вложения.
+    """
+    async with semaphore:
+        try:
+            await send(item)
+        except error.Forbidden as e:
+            return PostResult(item, PostStatus.FORBIDDEN, error=e.message)
+        except error.BadRequest as e:
+            return PostResult(item, PostStatus.BAD_REQUEST, error=e.message)
+        except error.RetryAfter as e:
+            return PostResult(item, PostStatus.RETRY_AFTER, retry_after=e.retry_after, error=e.message)
+        except error.NetworkError as e:
+            return PostResult(item, PostStatus.NETWORK_ERROR, error=e.message)
+        except error.TelegramError as e:
+            logger.warning("Ошибка Bot API при публикации: %s", e)
+            return PostResult(item, PostStatus.ERROR, error=e.message)
+        except Exception as e:
+            logger.exception("Ошибка при публикации")
+            return PostResult(item, PostStatus.ERROR, error=repr(e))
+    return PostResult(item, PostStatus.OK)
+
+
+async def fan_out(
+    items: Iterable[T],
+    send: Callable[[T], Awaitable[None]],
+    concurrency: int,
+) -> list[PostResult[T]]:
+    """Публикует все вложения одновременно, но не более concurrency за раз."""
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(_post(item, send, semaphore) for item in items))
+
+
+def failures_summary(failures: Iterable[tuple[str, PostStatus]]) -> str | None:
+    """Собирает один текст об ошибках публикации по парам (название канала, статус).
+
+    Если ошибок нет - возвращает None.
+    """
+    lines = [f"'{title}': {FAILURE_REASONS[status]}" for title, status in failures if status is not PostStatus.OK]
+    if not lines:
+        return None
+    return "Не удалось отправить сообщение в каналы:\n" + "\n".join(lines)
@@ -1,9 +1,12 @@
+import logging
+
 from telegram import Chat, ChatMember, Update, error
 from telegram.ext import CallbackContext, ContextTypes
 
-from src import services
+from src import albums, channel_admins, channel_health, dedup, outbox, services, stats
 from src.constants import constants
-from src.db import base
+
+logger = logging.getLogger(__name__)
 
 
 async def start_message_handler(update: Update, context: CallbackContext) -> None:
@@ -11,7 +14,7 @@ async def start_message_handler(update: Update, context: CallbackContext) -> Non
     start_text = (
         "Привет. Я — Мем бот и буду помогать вам постить мемы в ваши каналы.\n"
         "Перед началом работы с ботом, вам необходимо добавить бота в ваши каналы и через меню привязать каналы "
-        "к вашему аккаунту. Вызвать меню бота можно командой /menu"
+        "к вашему аккаунту. Вызвать меню бота можно командой /menu, статистику публикаций - командой /stats"
     )
     await services.create_user(update.effective_user)
     # Разрешает пересылать пользователю сообщения в каналы
@@ -19,26 +22,56 @@ async def start_message_handler(update: Update, context: CallbackContext) -> Non
     await update.message.reply_text(text=start_text)
 
 
+async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Выводит статистику публикаций пользователя по каналам при вызове команды /stats."""
+    await update.message.reply_text(text=await stats.get_summary(update.effective_user.id))
+
+
 async def channel_register_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """При добавлении бота в канал сохраняет его в БД. Если такой канал уже есть в БД - обрабатывается исключение."""
     my_chat = update.my_chat_member
-    if my_chat.chat.type in Chat.CHANNEL and my_chat.old_chat_member.status in [ChatMember.BANNED, ChatMember.LEFT]:
+    if my_chat.chat.type != Chat.CHANNEL:
+        return
+    if my_chat.old_chat_member.status in [ChatMember.BANNED, ChatMember.LEFT]:
         await services.create_channel(update.my_chat_member.chat)
+    if my_chat.new_chat_member.status in [ChatMember.BANNED, ChatMember.LEFT]:
+        channel_admins.get_channel_admins().forget(my_chat.chat.id)
+    # Бот добавлен в канал, удален из него или у него изменились права - публикации в канал возобновляются
+    # или приостанавливаются сразу, не дожидаясь ошибки отправки
+    await channel_health.get_channel_health().update_from_member(my_chat.chat.id, my_chat.new_chat_member)
+
+
+async def channel_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обновляет кэш администраторов канала при назначении или снятии администратора."""
+    member = update.chat_member
+    if member.chat.type != Chat.CHANNEL:
+        return
+    is_admin = member.new_chat_member.status in [ChatMember.ADMINISTRATOR, ChatMember.OWNER]
+    channel_admins.get_channel_admins().update_member(member.chat.id, member.new_chat_member.user.id, is_admin)
 
 
 async def forward_attachment_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Перебирает каналы пользователя и вызывает функцию публикации вложений в эти каналы."""
+    """Ставит вложение в очередь публикации во все каналы пользователя. Отправкой занимаются воркеры очереди.
+
+    В каналы, в которые это вложение уже публиковалось, оно не отправляется, пользователь получает список таких каналов.
+    """
     if context.user_data.get(constants.STOP_FORWARD, False):
         return
-    user = await base.user_repository.get(update.effective_user.id)
-    for bind in user.channels:
+    if update.message.media_group_id:
+        # Вложения альбома приходят отдельными update и публикуются одним сообщением после сборки альбома
+        albums.get_aggregator().add(update.message, update.effective_user.id)
+        return
+    media = services.extract_media(update.message)
+    targets = await services.get_bind_targets(update.effective_user.id)
+    async with dedup.get_posted_media().reserve(targets, media.file_unique_id) as (targets, duplicates):
+        queued = await services.enqueue_posts(targets, media, update.effective_user.id)
+    if queued:
+        outbox.get_worker_pool().wake()
+    if duplicates:
         try:
-            await services.posting_message(bind, update.message, context.bot)
-        except error.Forbidden:
-            await update.message.reply_text(
-                text=f"Невозможно отправить сообщение в канал '{bind.channel.title}'. Бот удален из канала",
-            )
-        except error.BadRequest:
-            await update.message.reply_text(
-                text=f"Невозможно отправить сообщение в канал '{bind.channel.title}'. У бота недостаточно прав",
+            await update.message.reply_text(dedup.duplicates_summary(duplicates))
+        except error.TelegramError:
+            logger.warning(
+                "Не удалось сообщить пользователю %s о повторно присланном вложении",
+                update.effective_user.id,
             )
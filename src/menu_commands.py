@@ -1,10 +1,13 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes, ConversationHandler
 
-from src import exceptions, services
+from src import exceptions, schedule, services
 from src.constants import callback_data, constants, states
 from src.db import base
 
+# Сколько каналов показывать на одной странице меню
+CHANNELS_PAGE_SIZE = 10
+
 
 async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str | None:
     """Выводит главное меню при вызове команды /menu."""
@@ -44,7 +47,7 @@ async def binding_user_with_channel(update: Update, context: ContextTypes.DEFAUL
         channel = await base.channel_repository.get(update.message.forward_from_chat.id)
         user = await base.user_repository.get(update.effective_user.id)
         await services.user_is_admin_in_channel(update, context.bot)
-        await services.create_bind(user.id, channel.id)
+        await services.create_bind(user, channel)
     except AttributeError:
         text = "Сообщение не является репостом из другого канала"
     except exceptions.ChannelNotFoundError:
@@ -62,18 +65,58 @@ async def binding_user_with_channel(update: Update, context: ContextTypes.DEFAUL
         return await main_menu(update, context)
 
 
-async def user_channels(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
-    """Выводит меню с каналами, привязанными к аккаунту пользователя."""
-    user = await base.user_repository.get(update.effective_user.id)
-    context.user_data[constants.CURRENT_USER] = user
-    channels_buttons = []
-    for bind in user.channels:
-        channels_buttons.append(
-            [InlineKeyboardButton(bind.channel.title, callback_data=str(bind.channel.channel_id))],
+async def channels_page(account_id: int, page: str) -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру страницы меню каналов. page - callback_data кнопки страницы, "" - первая страница.
+
+    Страницы выбираются по ключу (id канала соседней страницы) и хранятся в кэше, пока у пользователя
+    не изменятся привязки каналов.
+    """
+    pages = services.get_channel_menu_cache().get(account_id)
+    if pages is None:
+        pages = {}
+        services.get_channel_menu_cache().set(account_id, pages)
+    keyboard = pages.get(page)
+    if keyboard is None:
+        keyboard = pages[page] = await _render_channels_page(account_id, page)
+    return keyboard
+
+
+async def _render_channels_page(account_id: int, page: str) -> InlineKeyboardMarkup:
+    after = before = None
+    if page.startswith(callback_data.CALLBACK_CHANNELS_AFTER):
+        after = int(page.removeprefix(callback_data.CALLBACK_CHANNELS_AFTER))
+    elif page.startswith(callback_data.CALLBACK_CHANNELS_BEFORE):
+        before = int(page.removeprefix(callback_data.CALLBACK_CHANNELS_BEFORE))
+    # Лишний канал показывает, есть ли еще страница в ту же сторону
+    rows = await base.bind_repository.get_page(account_id, CHANNELS_PAGE_SIZE + 1, after, before)
+    has_more = len(rows) > CHANNELS_PAGE_SIZE
+    if before is not None:
+        rows = rows[-CHANNELS_PAGE_SIZE:]
+        has_previous, has_next = has_more, True
+    else:
+        rows = rows[:CHANNELS_PAGE_SIZE]
+        has_previous, has_next = after is not None, has_more
+    buttons = [[InlineKeyboardButton(title, callback_data=str(channel_id))] for _, channel_id, title in rows]
+    navigation = []
+    if has_previous and rows:
+        navigation.append(
+            InlineKeyboardButton("<", callback_data=f"{callback_data.CALLBACK_CHANNELS_BEFORE}{rows[0].id}"),
         )
-    back_button = [[InlineKeyboardButton("Назад", callback_data=callback_data.CALLBACK_BACK_TO_MAIN)]]
-    buttons = channels_buttons + back_button
-    keyboard = InlineKeyboardMarkup(buttons)
+    if has_next and rows:
+        navigation.append(
+            InlineKeyboardButton(">", callback_data=f"{callback_data.CALLBACK_CHANNELS_AFTER}{rows[-1].id}"),
+        )
+    if navigation:
+        buttons.append(navigation)
+    buttons.append([InlineKeyboardButton("Назад", callback_data=callback_data.CALLBACK_BACK_TO_MAIN)])
+    return InlineKeyboardMarkup(buttons)
+
+
+async def user_channels(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Выводит страницу меню с каналами, привязанными к аккаунту пользователя."""
+    data = update.callback_query.data
+    is_page = data.startswith((callback_data.CALLBACK_CHANNELS_AFTER, callback_data.CALLBACK_CHANNELS_BEFORE))
+    keyboard = await channels_page(update.effective_user.id, data if is_page else "")
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(text="Список подключенных каналы", reply_markup=keyboard)
     return states.USER_CHANNELS_STATE
@@ -83,6 +126,7 @@ async def channel_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> st
     """Выводит меню выбранного канала."""
     buttons = [
         [InlineKeyboardButton("Изменить описание", callback_data=callback_data.CALLBACK_EDIT_DESCRIPTION)],
+        [InlineKeyboardButton("Расписание публикаций", callback_data=callback_data.CALLBACK_EDIT_SCHEDULE)],
         [InlineKeyboardButton("Отвязать канал", callback_data=callback_data.CALLBACK_REMOVE_BINDING)],
         [InlineKeyboardButton("Назад", callback_data=callback_data.CALLBACK_BACK_TO_CHANNELS)],
     ]
@@ -92,9 +136,8 @@ async def channel_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> st
         await update.callback_query.answer()
         await update.callback_query.edit_message_reply_markup(reply_markup=keyboard)
         if update.callback_query.data:
-            channel_id = int(update.callback_query.data)
-            channel = await base.channel_repository.get(channel_id)
-            context.user_data[constants.CURRENT_CHANNEL] = channel
+            # В user_data хранится только channel_id, чтобы его можно было сохранить в БД между перезапусками
+            context.user_data[constants.CURRENT_CHANNEL] = int(update.callback_query.data)
     else:
         await update.message.reply_text(text="Меню канала", reply_markup=keyboard)
     return states.CHANNEL_MENU_STATE
@@ -112,14 +155,53 @@ async def edit_description(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 async def input_description(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     """Обрабатывает введенный пользователем текст сообщения для канала."""
     new_description = update.message.text
-    await services.change_bind_description(new_description, context.user_data)
+    await services.change_bind_description(
+        new_description,
+        update.effective_user.id,
+        context.user_data[constants.CURRENT_CHANNEL],
+    )
     await update.message.reply_text(text=f"Описание изменено. Новое описание '{new_description}'")
     return await channel_menu(update, context)
 
 
+async def edit_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Кнопка для изменения расписания публикаций в выбранном канале."""
+    current = await base.bind_repository.get_schedule(
+        update.effective_user.id,
+        context.user_data[constants.CURRENT_CHANNEL],
+    )
+    text = (
+        f"Сейчас вложения публикуются {schedule.describe(*current) if current else 'сразу'}.\n"
+        "Введите интервал между публикациями в минутах (например 30), время публикаций через запятую "
+        "(например 9:00, 13:00, 18:30 по UTC) или 0, чтобы публиковать сразу"
+    )
+    await update.callback_query.answer()
+    await update.callback_query.edit_message_text(text=text)
+    return states.TYPING_SCHEDULE
+
+
+async def input_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Обрабатывает введенное пользователем расписание публикаций в канал."""
+    try:
+        post_interval, post_slots = schedule.parse(update.message.text)
+    except ValueError:
+        await update.message.reply_text(text="Не удалось разобрать расписание, попробуйте еще раз")
+        return states.TYPING_SCHEDULE
+    await services.change_bind_schedule(
+        update.effective_user.id,
+        context.user_data[constants.CURRENT_CHANNEL],
+        post_interval,
+        post_slots,
+    )
+    await update.message.reply_text(
+        text=f"Расписание изменено. Вложения публикуются {schedule.describe(post_interval, post_slots)}",
+    )
+    return await channel_menu(update, context)
+
+
 async def remove_binding(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     """Удаляет привязку канала к аккаунту пользователя."""
-    await services.remove_bind(context.user_data)
+    await services.remove_bind(update.effective_user.id, context.user_data[constants.CURRENT_CHANNEL])
     return await user_channels(update, context)
 
 
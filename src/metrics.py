@@ -0,0 +1,214 @@
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм длительности, секунды
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format(name: str, labels: Labels, value: float) -> str:
+    if not labels:
+        return f"{name} {value}"
+    rendered = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+    return f"{name}{{{rendered}}} {value}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    """Счетчик, который только увеличивается. Значения хранятся отдельно для каждого набора меток."""
+
+    type = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = _labels(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(_labels(labels), 0)
+
+    def total(self) -> float:
+        """Сумма значений по всем наборам меток."""
+        return sum(self._values.values())
+
+    async def samples(self) -> Iterable[str]:
+        return [_format(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class Histogram:
+    """Гистограмма наблюдаемых значений с фиксированными границами корзин."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DURATION_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self._buckets = buckets
+        # метки -> (количество в каждой корзине, сумма, количество)
+        self._values: dict[Labels, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        counts, total, count = self._values.get(key) or ([0] * len(self._buckets), 0.0, 0)
+        index = bisect.bisect_left(self._buckets, value)
+        if index < len(counts):
+            counts[index] += 1
+        self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, **labels: Any) -> int:
+        value = self._values.get(_labels(labels))
+        return value[2] if value else 0
+
+    async def samples(self) -> Iterable[str]:
+        lines = []
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self._buckets, counts):
+                cumulative += bucket_count
+                lines.append(_format(f"{self.name}_bucket", (*labels, ("le", str(bound))), cumulative))
+            lines.append(_format(f"{self.name}_bucket", (*labels, ("le", "+Inf")), count))
+            lines.append(_format(f"{self.name}_sum", labels, total))
+            lines.append(_format(f"{self.name}_count", labels, count))
+        return lines
+
+
+class Gauge:
+    """Текущее значение, которое вычисляется функцией в момент чтения метрик. Функция может быть асинхронной."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, description: str, read: Callable[[], float | Awaitable[float]]) -> None:
+        self.name = name
+        self.description = description
+        self._read = read
+
+    async def samples(self) -> Iterable[str]:
+        value = self._read()
+        if inspect.isawaitable(value):
+            value = await value
+        return [_format(self.name, (), value)]
+
+
+class Registry:
+    """Набор метрик, который отдается в текстовом формате Prometheus."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._add(Counter(name, description))
+
+    def histogram(self, name: str, description: str, buckets: tuple[float, ...] = DURATION_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, description, buckets))
+
+    def gauge(self, name: str, description: str, read: Callable[[], float | Awaitable[float]]) -> Gauge:
+        """Регистрирует показатель. Повторная регистрация с тем же именем заменяет функцию чтения."""
+        gauge = Gauge(name, description, read)
+        self._metrics[name] = gauge
+        return gauge
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    async def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = await metric.samples()
+            except Exception:
+                logger.exception("Не удалось прочитать метрику %s", metric.name)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_duration = registry.histogram("rebot_handler_duration_seconds", "Время выполнения обработчиков update")
+handler_errors = registry.counter("rebot_handler_errors_total", "Исключения в обработчиках update")
+db_statement_duration = registry.histogram("rebot_db_statement_duration_seconds", "Время выполнения запросов к БД")
+db_errors = registry.counter("rebot_db_errors_total", "Ошибки запросов к БД")
+updates_processed = registry.counter("rebot_updates_processed_total", "Разобранные update, включая пропущенные")
+updates_shed = registry.counter(
+    "rebot_updates_shed_total",
+    "Update, пропущенные без обработки: переполнена очередь пользователя или нажатие кнопки устарело",
+)
+bot_api_duration = registry.histogram("rebot_bot_api_duration_seconds", "Время выполнения запросов к Bot API")
+bot_api_requests = registry.counter(
+    "rebot_bot_api_requests_total",
+    "Запросы к Bot API по методам и результатам (ok или класс исключения)",
+)
+bot_api_wait = registry.histogram(
+    "rebot_bot_api_wait_seconds",
+    "Время ожидания запроса к Bot API в планировщике до отправки",
+)
+
+
+def timed(callback: Callable[..., Awaitable[Any]], name: str) -> Callable[..., Awaitable[Any]]:
+    """Оборачивает обработчик update: время выполнения и исключения учитываются с меткой handler=name."""
+
+    @functools.wraps(callback)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception as e:
+            handler_errors.inc(handler=name, error=type(e).__name__)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, handler=name)
+
+    return wrapper
+
+
+class _MetricsHandler(tornado.web.RequestHandler):
+    async def get(self) -> None:
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(await registry.render())
+
+
+class MetricsServer:
+    """HTTP-сервер, который отдает метрики по адресу /metrics."""
+
+    def __init__(self, listen: str, port: int) -> None:
+        self._listen = listen
+        self._port = port
+        self._server: HTTPServer | None = None
+
+    def start(self) -> None:
+        application = tornado.web.Application([("/metrics", _MetricsHandler)])
+        self._server = application.listen(self._port, self._listen)
+        logger.info("Метрики доступны на http://%s:%s/metrics", self._listen, self._port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop()
+            await asyncio.wait_for(self._server.close_all_connections(), timeout=5)
+            self._server = None
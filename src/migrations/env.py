@@ -11,7 +11,7 @@ from src.db.models import Base
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
-config.set_main_option("sqlalchemy.url", settings.DATABASE_URL)
+config.set_main_option("sqlalchemy.url", settings.get_settings().DATABASE_URL)
 
 
 # Interpret the config file for Python logging.
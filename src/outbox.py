@@ -0,0 +1,272 @@
+import asyncio
+import contextlib
+import dataclasses
+import functools
+import logging
+from itertools import groupby
+
+import telegram
+from telegram.ext import Application
+
+from src import channel_health, dedup, fanout, services, settings, stats, tracing
+from src.constants import constants
+from src.db import base, models
+
+logger = logging.getLogger(__name__)
+
+# После таких ошибок повторять отправку бессмысленно
+PERMANENT_FAILURES = frozenset((fanout.PostStatus.FORBIDDEN, fanout.PostStatus.BAD_REQUEST))
+# Ответ Bot API на копирование сообщения, которое удалено из чата
+MESSAGE_NOT_FOUND = "message to copy not found"
+
+
+def _message_ids(row: models.Outbox) -> list[int]:
+    """Сообщения пользователя, копией которых является публикация. Пусто, если публикация отправляется по file_id."""
+    if row.media_type != constants.MEDIA_GROUP:
+        return [] if row.message_id is None else [row.message_id]
+    message_ids = [item.get("message_id") for item in row.media]
+    return [] if None in message_ids else message_ids
+
+
+def _deliveries(rows: list[models.Outbox]) -> list[tuple[models.Outbox, ...]]:
+    """Делит публикации на запросы к Bot API.
+
+    Публикации без текста одного пользователя в один канал объединяются в запросы copyMessages
+    не больше чем по services.MAX_COPY_MESSAGES сообщений. Остальные публикации отправляются по одной.
+    """
+    result = []
+    batches: dict[tuple[int, int], list[list[models.Outbox]]] = {}
+    for row in rows:
+        message_ids = _message_ids(row)
+        if row.caption or not message_ids:
+            result.append((row,))
+            continue
+        chunks = batches.setdefault((row.chat_id, row.account_id), [[]])
+        size = sum(len(_message_ids(chunk_row)) for chunk_row in chunks[-1])
+        if size + len(message_ids) > services.MAX_COPY_MESSAGES:
+            chunks.append([])
+        chunks[-1].append(row)
+    result.extend(tuple(chunk) for chunks in batches.values() for chunk in chunks)
+    return result
+
+
+def _failed_batch(result: fanout.PostResult[tuple[models.Outbox, ...]]) -> bool:
+    """Запрос copyMessages, который Bot API отклонил целиком из-за одного плохого сообщения, например удаленного."""
+    return result.status is fanout.PostStatus.BAD_REQUEST and len(result.item) > 1
+
+
+class OutboxWorkerPool:
+    """Пул воркеров, которые разбирают очередь публикаций и отправляют вложения в каналы."""
+
+    def __init__(
+        self,
+        workers: int,
+        batch_size: int,
+        concurrency: int,
+        poll_interval: float,
+        lock_timeout: float,
+        max_attempts: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+    ) -> None:
+        self._workers = workers
+        self._batch_size = batch_size
+        self._concurrency = concurrency
+        self._poll_interval = poll_interval
+        self._lock_timeout = lock_timeout
+        self._max_attempts = max_attempts
+        self._retry_base_delay = retry_base_delay
+        self._retry_max_delay = retry_max_delay
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        # Публикации, которые воркеры забрали из очереди и еще не обработали
+        self._claimed: set[int] = set()
+        self._tasks: list[asyncio.Task] = []
+        self._bot: telegram.Bot | None = None
+
+    async def start(self, telegram_bot: telegram.Bot) -> None:
+        self._bot = telegram_bot
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self._workers)]
+
+    async def stop(self, timeout: float = 0) -> None:
+        """Останавливает воркеров.
+
+        Новые публикации из очереди не забираются, уже забранные воркеры отправляют не дольше timeout секунд.
+        Публикации, которые не успели отправить, возвращаются в очередь и будут отправлены после перезапуска.
+        Если отправка была прервана после ответа Bot API, публикация после перезапуска повторится.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._claimed:
+            logger.warning("Не отправлено при остановке, возвращено в очередь: %s", len(self._claimed))
+            await base.outbox_repository.release(list(self._claimed))
+            self._claimed.clear()
+
+    def wake(self) -> None:
+        """Будит воркеров, не дожидаясь очередного опроса очереди."""
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                processed = await self.process_batch()
+            except Exception:
+                logger.exception("Ошибка при обработке очереди публикаций")
+                processed = 0
+            # Событие могли сбросить другие воркеры, поэтому при остановке ожидание пропускается
+            if not processed and not self._stopping:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+                self._wakeup.clear()
+
+    async def _send(self, rows: tuple[models.Outbox, ...]) -> None:
+        try:
+            await self._copy_or_send(rows)
+        except telegram.error.BadRequest as e:
+            # Пользователь удалил свое сообщение, пока публикация ждала очереди: она отправляется по file_id
+            if len(rows) > 1 or not _message_ids(rows[0]) or MESSAGE_NOT_FOUND not in e.message.lower():
+                raise
+            await self._send_by_file_id(rows[0])
+
+    async def _copy_or_send(self, rows: tuple[models.Outbox, ...]) -> None:
+        row = rows[0]
+        if not row.caption and _message_ids(row):
+            message_ids = [message_id for batch_row in rows for message_id in _message_ids(batch_row)]
+            await services.copy_media_batch(self._bot, row.chat_id, row.account_id, message_ids)
+        elif row.media_type != constants.MEDIA_GROUP and row.message_id is not None:
+            await services.copy_media(self._bot, row.chat_id, row.account_id, row.message_id, row.caption)
+        else:
+            # copyMessages не умеет заменять текст, поэтому альбом с текстом собирается заново по file_id
+            await self._send_by_file_id(row)
+
+    async def _send_by_file_id(self, row: models.Outbox) -> None:
+        if row.media_type == constants.MEDIA_GROUP:
+            await services.send_media_group(self._bot, row.chat_id, row.media, row.caption)
+        else:
+            await services.send_media(self._bot, row.chat_id, row.media_type, row.file_id, row.caption)
+
+    def _retry_delay(self, result: fanout.PostResult[models.Outbox]) -> float:
+        if result.retry_after is not None:
+            return result.retry_after
+        return min(self._retry_base_delay * 2 ** (result.item.attempts - 1), self._retry_max_delay)
+
+    async def process_batch(self) -> int:
+        """Отправляет одну пачку публикаций из очереди и возвращает ее размер."""
+        rows = await base.outbox_repository.claim(self._batch_size, self._lock_timeout)
+        if not rows:
+            return 0
+        ids = {row.id for row in rows}
+        self._claimed |= ids
+        # Публикации в канал могут ждать своей очереди в ограничителе частоты дольше lock_timeout.
+        # Чтобы их не забрал и не отправил повторно другой воркер, блокировка продлевается до конца обработки
+        keep_claimed = asyncio.create_task(self._keep_claimed(list(ids)))
+        try:
+            with tracing.trace("outbox", rows=len(rows)):
+                return await self._process(rows)
+        except asyncio.CancelledError:
+            # Воркер остановлен во время отправки: неотправленные публикации вернет в очередь stop()
+            ids = set()
+            raise
+        finally:
+            keep_claimed.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await keep_claimed
+            self._claimed -= ids
+
+    async def _keep_claimed(self, ids: list[int]) -> None:
+        """Продлевает блокировку забранных публикаций, пока воркер их обрабатывает."""
+        while True:
+            await asyncio.sleep(self._lock_timeout / 3)
+            try:
+                await base.outbox_repository.extend(ids, self._lock_timeout)
+            except Exception:
+                logger.exception("Не удалось продлить блокировку публикаций")
+
+    async def _process(self, rows: list[models.Outbox]) -> int:
+        # Пользователь уже получил сообщение об ошибке публикации в приостановленный канал, повторно оно не нужно
+        unavailable = [row.id for row in rows if not channel_health.get_channel_health().is_available(row.chat_id)]
+        if unavailable:
+            for row in rows:
+                if row.id in unavailable:
+                    stats.get_posting_stats().record(row.account_id, row.chat_id, ok=False)
+            await base.outbox_repository.fail(unavailable, "channel is unavailable")
+            await self._forget([row for row in rows if row.id in unavailable])
+            rows = [row for row in rows if channel_health.get_channel_health().is_available(row.chat_id)]
+        results = await fanout.fan_out(_deliveries(rows), self._send, self._concurrency)
+        # Публикации из отклоненного запроса copyMessages отправляются по одной, прежде чем считать их неудачными
+        singles = [(row,) for result in results if _failed_batch(result) for row in result.item]
+        if singles:
+            results = [result for result in results if not _failed_batch(result)]
+            results += await fanout.fan_out(singles, self._send, self._concurrency)
+        # Результат запроса copyMessages относится ко всем объединенным в него публикациям
+        results = [dataclasses.replace(result, item=row) for result in results for row in result.item]
+        sent = []
+        failed = []
+        now = base.utcnow()
+        for result in results:
+            row = result.item
+            if result.status is fanout.PostStatus.OK:
+                sent.append(row.id)
+                delay = (now - row.created_at).total_seconds()
+                stats.get_posting_stats().record(row.account_id, row.chat_id, ok=True, latency=delay)
+            elif result.status in PERMANENT_FAILURES or row.attempts >= self._max_attempts:
+                failed.append(result)
+                stats.get_posting_stats().record(row.account_id, row.chat_id, ok=False)
+            else:
+                await base.outbox_repository.retry(result.item.id, self._retry_delay(result), result.error)
+        if sent:
+            await base.outbox_repository.complete(sent)
+        if failed:
+            errors = "; ".join(sorted({result.error or result.status.value for result in failed}))
+            await base.outbox_repository.fail([result.item.id for result in failed], errors)
+            await self._forget([result.item for result in failed])
+            channels = {result.item.chat_id: result for result in failed if result.status in PERMANENT_FAILURES}
+            for chat_id, result in channels.items():
+                await channel_health.get_channel_health().record_failure(chat_id, result.status, result.error)
+            await self._notify(failed)
+        return len(rows) + len(unavailable)
+
+    async def _forget(self, rows: list[models.Outbox]) -> None:
+        """Убирает неопубликованные вложения из индекса опубликованных, чтобы их можно было прислать снова."""
+        keys = [(row.chat_id, row.media_key) for row in rows if row.media_key is not None]
+        await dedup.get_posted_media().forget(keys)
+
+    async def _notify(self, failed: list[fanout.PostResult[models.Outbox]]) -> None:
+        """Отправляет каждому пользователю одно сообщение обо всех его неудавшихся публикациях."""
+        failed = sorted(failed, key=lambda result: result.item.account_id)
+        for account_id, results in groupby(failed, key=lambda result: result.item.account_id):
+            summary = fanout.failures_summary((result.item.channel_title, result.status) for result in results)
+            try:
+                await self._bot.send_message(chat_id=account_id, text=summary)
+            except telegram.error.TelegramError:
+                logger.warning("Не удалось сообщить пользователю %s об ошибках публикации", account_id)
+
+
+@functools.cache
+def get_worker_pool() -> OutboxWorkerPool:
+    config = settings.get_settings()
+    return OutboxWorkerPool(
+        workers=config.OUTBOX_WORKERS,
+        batch_size=config.OUTBOX_BATCH_SIZE,
+        concurrency=config.POSTING_CONCURRENCY,
+        poll_interval=config.OUTBOX_POLL_INTERVAL,
+        lock_timeout=config.OUTBOX_LOCK_TIMEOUT,
+        max_attempts=config.OUTBOX_MAX_ATTEMPTS,
+        retry_base_delay=config.OUTBOX_RETRY_BASE_DELAY,
+        retry_max_delay=config.OUTBOX_RETRY_MAX_DELAY,
+    )
+
+
+async def start_workers(application: Application) -> None:
+    await get_worker_pool().start(application.bot)
+
+
+async def stop_workers(application: Application) -> None:
+    await get_worker_pool().stop(settings.get_settings().OUTBOX_DRAIN_TIMEOUT)
@@ -0,0 +1,136 @@
+import asyncio
+import contextlib
+import json
+import logging
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from src.constants import constants
+from src.db import base
+
+logger = logging.getLogger(__name__)
+
+
+class DatabasePersistence(BasePersistence[dict, dict, dict]):
+    """Хранит user_data и состояния диалогов в БД.
+
+    В БД попадают только флаги и идентификаторы из user_data (STOP_FORWARD и CURRENT_CHANNEL). user_data
+    пользователя загружается при первом его update, а не при запуске бота. Изменения копятся в памяти
+    и записываются в БД пачкой не реже раза в flush_interval секунд и при остановке бота.
+    """
+
+    def __init__(self, flush_interval: float) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=flush_interval,
+        )
+        self._flush_interval = flush_interval
+        self._user_states: dict[int, dict] = {}
+        self._conversations: dict[tuple[str, str], object | None] = {}
+        self._flush_task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+
+    async def get_user_data(self) -> dict[int, dict]:
+        # user_data загружается по одному пользователю в refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        """Загружает сохраненное состояние пользователя при первом обращении к его user_data."""
+        if constants.STOP_FORWARD in user_data:
+            return
+        state = await base.user_state_repository.get(user_id)
+        user_data[constants.STOP_FORWARD] = state.stop_forward if state is not None else False
+        if state is not None and state.current_channel_id is not None:
+            user_data[constants.CURRENT_CHANNEL] = state.current_channel_id
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._user_states[user_id] = {
+            "account_id": user_id,
+            "stop_forward": data.get(constants.STOP_FORWARD, False),
+            "current_channel_id": data.get(constants.CURRENT_CHANNEL),
+        }
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._user_states.pop(user_id, None)
+        await base.user_state_repository.remove(user_id)
+
+    async def get_conversations(self, name: str) -> dict[tuple, object]:
+        """Возвращает незавершенные диалоги. Завершенные диалоги в БД не хранятся."""
+        return {tuple(json.loads(key)): state for key, state in await base.conversation_state_repository.get_all(name)}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        self._conversations[(name, json.dumps(key))] = new_state
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._flush_interval)
+        try:
+            await self._write()
+        except Exception:
+            logger.exception("Не удалось сохранить состояние пользователей")
+
+    async def flush(self) -> None:
+        """Записывает накопленные изменения. Вызывается при остановке бота."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flush_task
+        await self._write()
+
+    async def _write(self) -> None:
+        async with self._flush_lock:
+            user_states, self._user_states = self._user_states, {}
+            conversations, self._conversations = self._conversations, {}
+            try:
+                await self._save(user_states, conversations)
+            except BaseException:
+                # Не записанные изменения сохранятся вместе со следующими, если их не успели перезаписать
+                self._user_states = {**user_states, **self._user_states}
+                self._conversations = {**conversations, **self._conversations}
+                raise
+
+    async def _save(self, user_states: dict[int, dict], conversations: dict[tuple[str, str], object | None]) -> None:
+        if user_states:
+            await base.user_state_repository.save_many(list(user_states.values()))
+        if conversations:
+            await base.conversation_state_repository.save_many(
+                [
+                    {"name": name, "key": key, "state": state}
+                    for (name, key), state in conversations.items()
+                    if state is not None
+                ],
+                [name_key for name_key, state in conversations.items() if state is None],
+            )
+
+    # Данные чатов, бота и callback_data не сохраняются
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: object) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
@@ -0,0 +1,231 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from telegram import error
+from telegram.ext import BaseRateLimiter
+
+from src import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# Чем меньше число, тем раньше запрос покидает очередь
+INTERACTIVE_PRIORITY = 0
+BULK_PRIORITY = 1
+
+# Массовые публикации в каналы. Остальные запросы (ответы, редактирование меню) считаются интерактивными
+BULK_ENDPOINTS = frozenset(
+    (
+        "sendPhoto",
+        "sendVideo",
+        "sendAnimation",
+        "sendMediaGroup",
+        "copyMessage",
+        "copyMessages",
+    ),
+)
+
+# Через сколько запросов удалять из памяти заполненные (неиспользуемые) корзины чатов
+PRUNE_EVERY = 1000
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не более capacity токенов про запас."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Возвращает количество секунд до появления свободного токена."""
+        self._refill()
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self._rate
+
+    def consume(self) -> None:
+        self._tokens -= 1
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self._tokens >= self._capacity
+
+
+@dataclass
+class SchedulerStats:
+    """Наблюдаемое состояние планировщика запросов к Bot API."""
+
+    queue_depth: int
+    parked_chats: int
+    requests: int
+    retry_after: int
+    total_wait: float
+    max_wait: float
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.requests if self.requests else 0
+
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    """Планировщик запросов к Bot API с глобальным и поканальным ограничением частоты.
+
+    Запросы сначала ждут токен корзины своего чата, затем попадают в общую очередь с приоритетом,
+    из которой выходят по мере появления токенов в глобальной корзине. Чат, для которого Telegram вернул
+    RetryAfter, паркуется на указанное время, после чего запрос повторяется.
+    Приоритет можно передать явно через rate_limit_args, иначе он определяется по методу Bot API.
+    """
+
+    def __init__(self, global_per_second: float, chat_per_minute: float, max_retries: int) -> None:
+        self._global_bucket = TokenBucket(global_per_second, global_per_second)
+        self._chat_rate = chat_per_minute / 60
+        self._chat_capacity = chat_per_minute
+        self._chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+        self._parked_until: Dict[Union[int, str, None], float] = {}
+        self._max_retries = max_retries
+        self._queue: List[tuple] = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._requests = 0
+        self._retry_after = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def initialize(self) -> None:
+        # ExtBot вызывает initialize при каждой инициализации бота, а бот инициализируют и Application, и Updater
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._dispatcher
+            self._dispatcher = None
+
+    def stats(self) -> SchedulerStats:
+        now = time.monotonic()
+        return SchedulerStats(
+            queue_depth=len(self._queue),
+            parked_chats=sum(1 for until in self._parked_until.values() if until > now),
+            requests=self._requests,
+            retry_after=self._retry_after,
+            total_wait=self._total_wait,
+            max_wait=self._max_wait,
+        )
+
+    def _park_delay(self, chat_id: Union[int, str, None]) -> float:
+        return self._parked_until.get(chat_id, 0) - time.monotonic()
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate, self._chat_capacity)
+        return bucket
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        self._parked_until = {chat_id: until for chat_id, until in self._parked_until.items() if until > now}
+        self._chat_buckets = {chat_id: bucket for chat_id, bucket in self._chat_buckets.items() if not bucket.is_full}
+
+    async def _wait_for_chat(self, chat_id: Union[int, str, None]) -> None:
+        """Ждет, пока чат не будет запаркован и в его корзине появится токен."""
+        # Личные чаты не ограничиваются поканальной корзиной, но тоже могут быть запаркованы
+        limited = chat_id is not None and not (isinstance(chat_id, int) and chat_id > 0)
+        while True:
+            delay = self._park_delay(chat_id)
+            if limited:
+                delay = max(delay, self._chat_bucket(chat_id).delay())
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        if limited:
+            self._chat_bucket(chat_id).consume()
+
+    async def _wait_for_turn(self, priority: int) -> None:
+        """Ставит запрос в общую очередь и ждет, пока диспетчер не выдаст ему глобальный токен."""
+        turn = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), turn))
+        self._wakeup.set()
+        await turn
+
+    async def _dispatch(self) -> None:
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            delay = max(self._global_bucket.delay(), self._park_delay(None))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, turn = heapq.heappop(self._queue)
+            if not turn.done():
+                self._global_bucket.consume()
+                turn.set_result(None)
+
+    @staticmethod
+    async def _call(callback: Callable[..., Coroutine], args: Any, kwargs: Dict[str, Any], endpoint: str) -> Any:
+        """Выполняет запрос к Bot API и учитывает его длительность и результат в метриках."""
+        started = time.perf_counter()
+        try:
+            with tracing.span(f"bot_api {endpoint}"):
+                response = await callback(*args, **kwargs)
+        except Exception as e:
+            metrics.bot_api_duration.observe(time.perf_counter() - started, method=endpoint)
+            metrics.bot_api_requests.inc(method=endpoint, result=type(e).__name__)
+            raise
+        metrics.bot_api_duration.observe(time.perf_counter() - started, method=endpoint)
+        metrics.bot_api_requests.inc(method=endpoint, result="ok")
+        return response
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        if rate_limit_args is not None:
+            priority = rate_limit_args
+        else:
+            priority = BULK_PRIORITY if endpoint in BULK_ENDPOINTS else INTERACTIVE_PRIORITY
+        chat_id = data.get("chat_id")
+        self._requests += 1
+        if self._requests % PRUNE_EVERY == 0:
+            self._prune()
+
+        retries = 0
+        while True:
+            started = time.monotonic()
+            with tracing.span(f"rate_limit {endpoint}"):
+                await self._wait_for_chat(chat_id)
+                await self._wait_for_turn(priority)
+            waited = time.monotonic() - started
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            metrics.bot_api_wait.observe(waited, method=endpoint)
+            try:
+                return await self._call(callback, args, kwargs, endpoint)
+            except error.RetryAfter as e:
+                self._retry_after += 1
+                if retries >= self._max_retries:
+                    raise
+                retries += 1
+                self._parked_until[chat_id] = time.monotonic() + e.retry_after
+                logger.warning("%s в чат %s: RetryAfter, чат запаркован на %s с", endpoint, chat_id, e.retry_after)
@@ -0,0 +1,60 @@
+import datetime
+
+from src.db.models import Bind
+
+# Больше времени публикаций в сутки не принимается
+MAX_SLOTS = 48
+# Интервал между публикациями больше недели, минуты, не принимается
+MAX_INTERVAL = 10080
+
+
+def parse(text: str) -> tuple[int | None, str | None]:
+    """Разбирает расписание, введенное пользователем, в (post_interval, post_slots) привязки канала.
+
+    Число - интервал между публикациями в минутах, 0 - публиковать сразу. Время через запятую
+    (например "9:00, 18:30") - публиковать по одному вложению в каждое время, UTC. При ошибке - ValueError.
+    """
+    text = text.strip()
+    if text.isdigit():
+        interval = int(text)
+        if interval > MAX_INTERVAL:
+            raise ValueError(f"Интервал больше {MAX_INTERVAL} минут")
+        return interval or None, None
+    slots = sorted({datetime.datetime.strptime(part.strip(), "%H:%M").time() for part in text.split(",")})
+    if len(slots) > MAX_SLOTS:
+        raise ValueError(f"Больше {MAX_SLOTS} публикаций в сутки")
+    return None, ",".join(slot.strftime("%H:%M") for slot in slots)
+
+
+def describe(post_interval: int | None, post_slots: str | None) -> str:
+    if post_slots:
+        return f"в {post_slots.replace(',', ', ')} UTC, по одному вложению"
+    if post_interval:
+        return f"не чаще одного вложения в {post_interval} мин."
+    return "сразу"
+
+
+def next_slot(post_slots: str, after: datetime.datetime) -> datetime.datetime:
+    """Возвращает ближайшее время публикации из post_slots вида "09:00,18:30" не раньше after."""
+    times = [datetime.time.fromisoformat(slot) for slot in post_slots.split(",")]
+    for day in (after.date(), after.date() + datetime.timedelta(days=1)):
+        for time in times:
+            slot = datetime.datetime.combine(day, time)
+            if slot >= after:
+                return slot
+    raise ValueError(f"Пустое расписание: {post_slots!r}")
+
+
+def take_slot(bind: Bind, now: datetime.datetime) -> datetime.datetime:
+    """Возвращает время публикации в канал по расписанию привязки и занимает его.
+
+    Следующая публикация в канал получит время не раньше чем через post_interval минут или следующее время
+    из post_slots. Если канал давно не публиковался, публикация по интервалу отправляется сразу.
+    """
+    slot = max(now, bind.next_post_at or now)
+    if bind.post_slots:
+        slot = next_slot(bind.post_slots, slot)
+        bind.next_post_at = slot + datetime.timedelta(minutes=1)
+    else:
+        bind.next_post_at = slot + datetime.timedelta(minutes=bind.post_interval)
+    return slot
@@ -1,27 +1,76 @@
+import functools
+import hashlib
+from typing import Iterable, NamedTuple
+
 import telegram
-import telegram.ext
 
-from src import exceptions
+from src import cache, channel_admins, exceptions, settings
 from src.constants import constants
 from src.db import base, models
 
+# Типы вложений, которые Telegram позволяет объединять в альбом из поддерживаемых ботом
+ALBUM_MEDIA = {
+    constants.MEDIA_PHOTO: telegram.InputMediaPhoto,
+    constants.MEDIA_VIDEO: telegram.InputMediaVideo,
+    constants.MEDIA_DOCUMENT: telegram.InputMediaDocument,
+    constants.MEDIA_AUDIO: telegram.InputMediaAudio,
+}
+# Поддерживаемые типы вложений - поля сообщения. У анимации заполнено и поле document, поэтому она проверяется раньше
+MEDIA_TYPES = (
+    constants.MEDIA_ANIMATION,
+    constants.MEDIA_PHOTO,
+    constants.MEDIA_VIDEO,
+    constants.MEDIA_DOCUMENT,
+    constants.MEDIA_AUDIO,
+    constants.MEDIA_VIDEO_NOTE,
+)
+# Сколько сообщений Telegram позволяет скопировать одним запросом copyMessages
+MAX_COPY_MESSAGES = 100
+
+
+class BindTarget(NamedTuple):
+    """Канал пользователя в том виде, в котором он нужен для публикации."""
+
+    channel_id: int
+    title: str
+    description: str | None
+    # Публикации в канал отправляются по расписанию, а не сразу
+    has_schedule: bool = False
+
+
+class Media(NamedTuple):
+    """Вложение сообщения."""
+
+    type: str
+    file_id: str
+    # Одинаков у одного и того же файла в любых сообщениях, в отличие от file_id
+    file_unique_id: str
+    # Сообщение пользователя с вложением в чате с ботом: публикация в канал - копия этого сообщения
+    message_id: int
+
+
+@functools.cache
+def get_bind_cache() -> cache.TTLCache[int, tuple[BindTarget, ...]]:
+    """Кэш account_id пользователя -> каналы для публикации."""
+    config = settings.get_settings()
+    return cache.TTLCache(config.BIND_CACHE_SIZE, config.BIND_CACHE_TTL)
+
+
+@functools.cache
+def get_channel_menu_cache() -> cache.TTLCache[int, dict[str, telegram.InlineKeyboardMarkup]]:
+    """Кэш account_id пользователя -> callback_data страницы меню каналов -> клавиатура страницы."""
+    config = settings.get_settings()
+    return cache.TTLCache(config.MENU_CACHE_SIZE, config.MENU_CACHE_TTL)
+
 
 async def create_user(telegram_user: telegram.User) -> None:
-    """Запускает парсер update и создание пользователя из полученных данных."""
-    parse_user = models.User.from_parse(telegram_user.to_dict())
-    try:
-        await base.user_repository.create(parse_user)
-    except exceptions.ObjectAlreadyExistsError:
-        pass
+    """Создает пользователя из данных update или обновляет имя и username уже зарегистрированного пользователя."""
+    await base.user_repository.upsert(models.User.parse_values(telegram_user.to_dict()))
 
 
 async def create_channel(telegram_chat: telegram.Chat) -> None:
-    """Запускает парсер update и создание канала из полученных данных."""
-    parse_channel = models.Channel.from_parse(telegram_chat.to_dict())
-    try:
-        await base.channel_repository.create(parse_channel)
-    except exceptions.ObjectAlreadyExistsError:
-        pass
+    """Создает канал из данных update или обновляет название и username уже известного канала."""
+    await base.channel_repository.upsert(models.Channel.parse_values(telegram_chat.to_dict()))
 
 
 async def user_is_admin_in_channel(update: telegram.Update, telegram_bot: telegram.Bot) -> None:
@@ -29,55 +78,197 @@ async def user_is_admin_in_channel(update: telegram.Update, telegram_bot: telegr
     user_id = update.effective_user.id
     channel_id = update.message.forward_from_chat.id
     try:
-        channel_admins = await telegram_bot.get_chat_administrators(chat_id=channel_id)
+        admin_ids = await channel_admins.get_channel_admins().get(telegram_bot, channel_id)
     except telegram.error.Forbidden as e:
         raise exceptions.BotKickedFromTheChannel(channel_id) from e
 
-    for admin in channel_admins:
-        if admin.user.id == user_id:
-            return
-    raise exceptions.UserIsNotAdminInChannel(user_id, channel_id)
+    if user_id not in admin_ids:
+        raise exceptions.UserIsNotAdminInChannel(user_id, channel_id)
+
+
+async def get_bind_targets(account_id: int) -> tuple[BindTarget, ...]:
+    """Возвращает каналы пользователя для публикации. Пока запись в кэше актуальна, БД не запрашивается."""
+    bind_cache = get_bind_cache()
+    targets = bind_cache.get(account_id)
+    if targets is None:
+        generation = bind_cache.generation
+        targets = tuple(BindTarget(*row) for row in await base.bind_repository.get_targets(account_id))
+        if bind_cache.generation == generation:
+            bind_cache.set(account_id, targets)
+    return targets
+
 
+def invalidate_channel_targets(channel_id: int) -> None:
+    """Сбрасывает кэш каналов у всех пользователей, к которым привязан канал с этим channel_id."""
+    get_bind_cache().invalidate_where(lambda targets: any(target.channel_id == channel_id for target in targets))
 
-async def create_bind(user_id: int, channel_id: int) -> None:
+
+async def invalidate_channel_users(channel_id: int) -> None:
+    """Сбрасывает кэш каналов у всех пользователей, привязанных к каналу, даже если в их кэше этого канала нет.
+
+    Нужно, когда канал снова становится доступен для публикации: в закэшированных каналах его еще нет.
+    """
+    for account_id in await base.bind_repository.get_account_ids(channel_id):
+        get_bind_cache().invalidate(account_id)
+
+
+async def create_bind(user: models.User, channel: models.Channel) -> None:
     """Создает связь аккаунта пользователя и канала."""
-    new_bind = models.Bind.new_bind(user_id, channel_id)
+    new_bind = models.Bind.new_bind(user.id, channel.id)
     await base.bind_repository.create(new_bind)
+    get_bind_cache().invalidate(user.account_id)
+    get_channel_menu_cache().invalidate(user.account_id)
+
 
+async def change_bind_description(new_description: str, account_id: int, channel_id: int) -> None:
+    """Изменяет текст сообщения пользователя в выбранном канале."""
+    await base.bind_repository.update_description(account_id, channel_id, new_description)
+    get_bind_cache().invalidate(account_id)
 
-async def change_bind_description(new_description: str, user_data: telegram.ext.CallbackContext) -> None:
-    """Получает данные из user_data и вызывает функцию изменения текста сообщения в выбранном канале."""
-    user = user_data[constants.CURRENT_USER]
-    channel = user_data[constants.CURRENT_CHANNEL]
-    await base.bind_repository.update_description(user.id, channel.id, new_description)
-
-
-async def remove_bind(user_data: telegram.ext.CallbackContext) -> None:
-    """Получает данные из user_data и вызывает функцию удаления связи пользователя и канала."""
-    user = user_data[constants.CURRENT_USER]
-    channel = user_data[constants.CURRENT_CHANNEL]
-    await base.bind_repository.remove(user.id, channel.id)
-
-
-async def posting_message(bind: models.Bind, message: telegram.Message, telegram_bot: telegram.Bot) -> None:
-    """Публикует вложение из сообщения в канал пользователя с необходимым текстом сообщения."""
-    if message.animation:
-        await telegram_bot.send_animation(
-            chat_id=bind.channel.channel_id,
-            animation=message.animation.file_id,
-            caption=bind.description,
-        )
-    elif message.photo:
-        await telegram_bot.send_photo(
-            chat_id=bind.channel.channel_id,
-            photo=message.photo[0].file_id,
-            caption=bind.description,
-        )
-    elif message.video:
-        await telegram_bot.send_video(
-            chat_id=bind.channel.channel_id,
-            video=message.video.file_id,
-            caption=bind.description,
-        )
+
+async def change_bind_schedule(
+    account_id: int,
+    channel_id: int,
+    post_interval: int | None,
+    post_slots: str | None,
+) -> None:
+    """Изменяет расписание публикаций пользователя в выбранном канале."""
+    await base.bind_repository.update_schedule(account_id, channel_id, post_interval, post_slots)
+    get_bind_cache().invalidate(account_id)
+
+
+async def remove_bind(account_id: int, channel_id: int) -> None:
+    """Удаляет связь пользователя и канала и его неотправленные публикации в этот канал."""
+    await base.bind_repository.remove(account_id, channel_id)
+    get_bind_cache().invalidate(account_id)
+    get_channel_menu_cache().invalidate(account_id)
+
+
+def extract_media(message: telegram.Message) -> Media:
+    """Возвращает вложение из сообщения. Из размеров фотографии берется самый большой."""
+    for media_type in MEDIA_TYPES:
+        attachment = getattr(message, media_type)
+        if attachment:
+            if media_type == constants.MEDIA_PHOTO:
+                attachment = attachment[-1]
+            return Media(media_type, attachment.file_id, attachment.file_unique_id, message.message_id)
+    raise telegram.error.TelegramError("Неподдерживаемый тип данных.")
+
+
+async def enqueue_posts(targets: Iterable[BindTarget], media: Media, account_id: int) -> int:
+    """Ставит вложение в очередь публикации во все каналы пользователя. В каналы с расписанием - на ближайшее
+    свободное время.
+    """
+    targets = list(targets)
+    now = base.utcnow()
+    rows = [
+        {
+            "account_id": account_id,
+            "chat_id": target.channel_id,
+            "channel_title": target.title,
+            "media_type": media.type,
+            "file_id": media.file_id,
+            "message_id": media.message_id,
+            "caption": target.description,
+            "next_attempt_at": now,
+            # Время постановки в очередь, от него считается задержка публикации в статистике
+            "created_at": now,
+            "media_key": media.file_unique_id,
+        }
+        for target in targets
+    ]
+    if rows:
+        await _add_to_outbox(account_id, targets, rows)
+    return len(rows)
+
+
+async def _add_to_outbox(account_id: int, targets: list[BindTarget], rows: list[dict]) -> None:
+    if any(target.has_schedule for target in targets):
+        await base.outbox_repository.add_scheduled(account_id, rows)
     else:
-        raise telegram.error.TelegramError("Неподдерживаемый тип данных.")
+        await base.outbox_repository.add_many(rows)
+
+
+def album_key(media: list[Media]) -> str:
+    """Ключ альбома в индексе опубликованных вложений: хэш file_unique_id его вложений."""
+    return hashlib.sha1("\n".join(item.file_unique_id for item in media).encode()).hexdigest()
+
+
+async def enqueue_album(
+    targets: Iterable[BindTarget],
+    media_group_id: str,
+    media: list[Media],
+    account_id: int,
+) -> int:
+    """Ставит альбом в очередь публикации во все каналы пользователя. В каналы с расписанием - на ближайшее
+    свободное время.
+    """
+    targets = list(targets)
+    now = base.utcnow()
+    album = [{"type": item.type, "file_id": item.file_id, "message_id": item.message_id} for item in media]
+    media_key = album_key(media)
+    rows = [
+        {
+            "account_id": account_id,
+            "chat_id": target.channel_id,
+            "channel_title": target.title,
+            "media_type": constants.MEDIA_GROUP,
+            "file_id": media_group_id,
+            "caption": target.description,
+            "media": album,
+            "next_attempt_at": now,
+            "created_at": now,
+            "media_key": media_key,
+        }
+        for target in targets
+    ]
+    if rows:
+        await _add_to_outbox(account_id, targets, rows)
+    return len(rows)
+
+
+async def copy_media(
+    telegram_bot: telegram.Bot,
+    chat_id: int,
+    from_chat_id: int,
+    message_id: int,
+    caption: str | None,
+) -> None:
+    """Копирует сообщение пользователя с вложением в канал, заменяя текст сообщения на caption."""
+    await telegram_bot.copy_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id, caption=caption)
+
+
+async def copy_media_batch(telegram_bot: telegram.Bot, chat_id: int, from_chat_id: int, message_ids: list[int]) -> None:
+    """Копирует сообщения пользователя с вложениями в канал без текста одним запросом.
+
+    Сообщения одного альбома остаются альбомом. Не больше MAX_COPY_MESSAGES сообщений за раз.
+    """
+    await telegram_bot.copy_messages(
+        chat_id=chat_id,
+        from_chat_id=from_chat_id,
+        message_ids=sorted(message_ids),
+        remove_caption=True,
+    )
+
+
+async def send_media(
+    telegram_bot: telegram.Bot,
+    chat_id: int,
+    media_type: str,
+    file_id: str,
+    caption: str | None,
+) -> None:
+    """Публикует вложение по file_id: для публикаций, поставленных в очередь до перехода на копирование,
+    и если сообщение пользователя, копией которого должна была стать публикация, удалено.
+    """
+    send = getattr(telegram_bot, f"send_{media_type}")
+    await send(chat_id, file_id, caption=caption)
+
+
+async def send_media_group(telegram_bot: telegram.Bot, chat_id: int, media: list[dict], caption: str | None) -> None:
+    """Публикует альбом в канал одним сообщением. Текст сообщения добавляется к первому вложению альбома."""
+    album = [
+        ALBUM_MEDIA[item["type"]](media=item["file_id"], caption=caption if number == 0 else None)
+        for number, item in enumerate(media)
+    ]
+    await telegram_bot.send_media_group(chat_id=chat_id, media=album)
@@ -1,7 +1,173 @@
+import dataclasses
+import functools
+
 from environs import Env
 
-env = Env()
-env.read_env()
 
-BOT_TOKEN = env.str("BOT_TOKEN")
-DATABASE_URL = env.str("DATABASE_URL")
+@dataclasses.dataclass
+class Settings:
+    """Настройки бота из окружения и .env. Названия полей совпадают с названиями переменных окружения."""
+
+    BOT_TOKEN: str
+    DATABASE_URL: str
+    # Адрес Bot API, например локального telegram-bot-api сервера
+    BOT_API_BASE_URL: str
+    # Пул соединений с БД (для SQLite используются только DB_POOL_PRE_PING и DB_POOL_RECYCLE)
+    DB_POOL_SIZE: int
+    DB_MAX_OVERFLOW: int
+    DB_POOL_TIMEOUT: float
+    DB_POOL_PRE_PING: bool
+    DB_POOL_RECYCLE: int
+    # Сколько соединений с БД открыть при запуске, до приема update
+    DB_POOL_WARMUP: int
+    # Сколько update разных пользователей обрабатываются одновременно
+    MAX_CONCURRENT_UPDATES: int
+    # Сколько полученных update может ждать обработки. При заполнении очереди прием update приостанавливается
+    UPDATE_QUEUE_SIZE: int
+    # Сколько update может быть в обработке, включая ждущие обработки предыдущих update своего пользователя.
+    # Пока их столько, update из очереди не забираются
+    MAX_PENDING_UPDATES: int
+    # Сколько update одного пользователя может ждать обработки. Следующие update пропускаются, а пользователь
+    # получает просьбу не торопиться
+    USER_QUEUE_LIMIT: int
+    # Как часто проверять, сколько update ждет бота в Telegram, секунды (0 - не проверять), и при скольких
+    # ожидающих update бот считается догоняющим очередь и пишет в лог ход ее разбора
+    BACKLOG_CHECK_INTERVAL: float
+    CATCH_UP_THRESHOLD: int
+    # Прием update через webhook (run_webhook.py)
+    WEBHOOK_URL: str
+    WEBHOOK_SECRET_TOKEN: str
+    WEBHOOK_LISTEN: str
+    WEBHOOK_PORT: int
+    WEBHOOK_PATH: str
+    # Максимальное количество одновременных отправок вложений одним воркером очереди
+    POSTING_CONCURRENCY: int
+    # Ограничения частоты запросов к Bot API
+    RATE_LIMIT_GLOBAL_PER_SECOND: float
+    RATE_LIMIT_CHANNEL_PER_MINUTE: float
+    RATE_LIMIT_MAX_RETRIES: int
+    # Очередь публикаций в каналы
+    OUTBOX_WORKERS: int
+    OUTBOX_BATCH_SIZE: int
+    OUTBOX_POLL_INTERVAL: float
+    OUTBOX_LOCK_TIMEOUT: float
+    OUTBOX_MAX_ATTEMPTS: int
+    OUTBOX_RETRY_BASE_DELAY: float
+    OUTBOX_RETRY_MAX_DELAY: float
+    # Сколько секунд при остановке бота ждать отправки публикаций, которые воркеры уже забрали из очереди.
+    # Не отправленные за это время публикации возвращаются в очередь
+    OUTBOX_DRAIN_TIMEOUT: float
+    # Как часто записывать в БД состояние пользователей и диалогов меню, секунды
+    PERSISTENCE_FLUSH_INTERVAL: float
+    # Запуск через run_sharded.py: сколько процессов обрабатывают update и сколько update может ждать в очереди
+    # каждого процесса, прежде чем прием update приостановится
+    SHARD_COUNT: int
+    SHARD_QUEUE_SIZE: int
+    # Как часто записывать в БД накопленную статистику публикаций, секунды
+    STATS_FLUSH_INTERVAL: float
+    # Сколько секунд ждать следующее вложение альбома перед его публикацией
+    ALBUM_WINDOW: float
+    # Сколько секунд помнить опубликованные вложения: повторно присланное за это время вложение не публикуется
+    # в тот же канал. При 0 повторы не проверяются
+    DEDUP_RETENTION: float
+    # Кэш каналов пользователей для публикации
+    BIND_CACHE_SIZE: int
+    BIND_CACHE_TTL: float
+    # Кэш страниц меню каналов: для скольких пользователей хранить страницы и сколько секунд
+    MENU_CACHE_SIZE: int
+    MENU_CACHE_TTL: float
+    # Кэш администраторов каналов
+    ADMIN_CACHE_SIZE: int
+    ADMIN_CACHE_TTL: float
+    # Пауза публикаций в канал, в котором у бота не хватает прав: начальная и максимальная, секунды.
+    # Каждая следующая неудача подряд удваивает паузу
+    CHANNEL_SUSPEND_BASE_DELAY: float
+    CHANNEL_SUSPEND_MAX_DELAY: float
+    # Через сколько секунд проверить канал, из которого удален бот
+    CHANNEL_DEAD_PROBE_DELAY: float
+    # Как часто искать каналы, паузу которых пора закончить проверкой, секунды
+    CHANNEL_PROBE_INTERVAL: float
+    # Адрес и порт, на которых отдаются метрики (/metrics). При METRICS_PORT=0 метрики не отдаются
+    METRICS_LISTEN: str
+    METRICS_PORT: int
+    # Трассировки update и пачек публикаций: JSONL-файл (пусто - не писать), его максимальный размер в байтах
+    # и количество старых файлов после ротации
+    TRACE_FILE: str
+    TRACE_FILE_MAX_BYTES: int
+    TRACE_FILE_BACKUPS: int
+    # Профилирование: каждая PROFILE_EVERY-я трассировка и трассировки дольше PROFILE_SLOWER_THAN секунд
+    # (0 - выключено). Профили сохраняются в PROFILE_DIR, стек снимается раз в PROFILE_INTERVAL секунд
+    PROFILE_EVERY: int
+    PROFILE_SLOWER_THAN: float
+    PROFILE_DIR: str
+    PROFILE_INTERVAL: float
+
+
+@functools.cache
+def get_settings() -> Settings:
+    """Возвращает настройки, при первом обращении читает их из окружения и .env.
+
+    Настройки читаются при первом обращении, а не при импорте: модули, которые только импортируют settings
+    (модели, репозитории, миграции), можно использовать без заполненного окружения.
+    """
+    env = Env()
+    env.read_env()
+    return Settings(
+        BOT_TOKEN=env.str("BOT_TOKEN"),
+        DATABASE_URL=env.str("DATABASE_URL"),
+        BOT_API_BASE_URL=env.str("BOT_API_BASE_URL", "https://api.telegram.org/bot"),
+        DB_POOL_SIZE=env.int("DB_POOL_SIZE", 10),
+        DB_MAX_OVERFLOW=env.int("DB_MAX_OVERFLOW", 20),
+        DB_POOL_TIMEOUT=env.float("DB_POOL_TIMEOUT", 30),
+        DB_POOL_PRE_PING=env.bool("DB_POOL_PRE_PING", True),
+        DB_POOL_RECYCLE=env.int("DB_POOL_RECYCLE", 1800),
+        DB_POOL_WARMUP=env.int("DB_POOL_WARMUP", 5),
+        MAX_CONCURRENT_UPDATES=env.int("MAX_CONCURRENT_UPDATES", 64),
+        UPDATE_QUEUE_SIZE=env.int("UPDATE_QUEUE_SIZE", 1000),
+        MAX_PENDING_UPDATES=env.int("MAX_PENDING_UPDATES", 1000),
+        USER_QUEUE_LIMIT=env.int("USER_QUEUE_LIMIT", 50),
+        BACKLOG_CHECK_INTERVAL=env.float("BACKLOG_CHECK_INTERVAL", 10),
+        CATCH_UP_THRESHOLD=env.int("CATCH_UP_THRESHOLD", 1000),
+        WEBHOOK_URL=env.str("WEBHOOK_URL", ""),
+        WEBHOOK_SECRET_TOKEN=env.str("WEBHOOK_SECRET_TOKEN", ""),
+        WEBHOOK_LISTEN=env.str("WEBHOOK_LISTEN", "0.0.0.0"),
+        WEBHOOK_PORT=env.int("WEBHOOK_PORT", 8443),
+        WEBHOOK_PATH=env.str("WEBHOOK_PATH", "webhook"),
+        POSTING_CONCURRENCY=env.int("POSTING_CONCURRENCY", 10),
+        RATE_LIMIT_GLOBAL_PER_SECOND=env.float("RATE_LIMIT_GLOBAL_PER_SECOND", 30),
+        RATE_LIMIT_CHANNEL_PER_MINUTE=env.float("RATE_LIMIT_CHANNEL_PER_MINUTE", 20),
+        RATE_LIMIT_MAX_RETRIES=env.int("RATE_LIMIT_MAX_RETRIES", 3),
+        OUTBOX_WORKERS=env.int("OUTBOX_WORKERS", 4),
+        OUTBOX_BATCH_SIZE=env.int("OUTBOX_BATCH_SIZE", 20),
+        OUTBOX_POLL_INTERVAL=env.float("OUTBOX_POLL_INTERVAL", 1),
+        OUTBOX_LOCK_TIMEOUT=env.float("OUTBOX_LOCK_TIMEOUT", 60),
+        OUTBOX_MAX_ATTEMPTS=env.int("OUTBOX_MAX_ATTEMPTS", 5),
+        OUTBOX_RETRY_BASE_DELAY=env.float("OUTBOX_RETRY_BASE_DELAY", 5),
+        OUTBOX_RETRY_MAX_DELAY=env.float("OUTBOX_RETRY_MAX_DELAY", 600),
+        OUTBOX_DRAIN_TIMEOUT=env.float("OUTBOX_DRAIN_TIMEOUT", 10),
+        PERSISTENCE_FLUSH_INTERVAL=env.float("PERSISTENCE_FLUSH_INTERVAL", 1),
+        SHARD_COUNT=env.int("SHARD_COUNT", 2),
+        SHARD_QUEUE_SIZE=env.int("SHARD_QUEUE_SIZE", 1000),
+        STATS_FLUSH_INTERVAL=env.float("STATS_FLUSH_INTERVAL", 60),
+        ALBUM_WINDOW=env.float("ALBUM_WINDOW", 1),
+        DEDUP_RETENTION=env.float("DEDUP_RETENTION", 604800),
+        BIND_CACHE_SIZE=env.int("BIND_CACHE_SIZE", 10000),
+        BIND_CACHE_TTL=env.float("BIND_CACHE_TTL", 600),
+        MENU_CACHE_SIZE=env.int("MENU_CACHE_SIZE", 1000),
+        MENU_CACHE_TTL=env.float("MENU_CACHE_TTL", 600),
+        ADMIN_CACHE_SIZE=env.int("ADMIN_CACHE_SIZE", 10000),
+        ADMIN_CACHE_TTL=env.float("ADMIN_CACHE_TTL", 3600),
+        CHANNEL_SUSPEND_BASE_DELAY=env.float("CHANNEL_SUSPEND_BASE_DELAY", 60),
+        CHANNEL_SUSPEND_MAX_DELAY=env.float("CHANNEL_SUSPEND_MAX_DELAY", 21600),
+        CHANNEL_DEAD_PROBE_DELAY=env.float("CHANNEL_DEAD_PROBE_DELAY", 86400),
+        CHANNEL_PROBE_INTERVAL=env.float("CHANNEL_PROBE_INTERVAL", 60),
+        METRICS_LISTEN=env.str("METRICS_LISTEN", "127.0.0.1"),
+        METRICS_PORT=env.int("METRICS_PORT", 0),
+        TRACE_FILE=env.str("TRACE_FILE", ""),
+        TRACE_FILE_MAX_BYTES=env.int("TRACE_FILE_MAX_BYTES", 10485760),
+        TRACE_FILE_BACKUPS=env.int("TRACE_FILE_BACKUPS", 5),
+        PROFILE_EVERY=env.int("PROFILE_EVERY", 0),
+        PROFILE_SLOWER_THAN=env.float("PROFILE_SLOWER_THAN", 0),
+        PROFILE_DIR=env.str("PROFILE_DIR", "profiles"),
+        PROFILE_INTERVAL=env.float("PROFILE_INTERVAL", 0.005),
+    )
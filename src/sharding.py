@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import multiprocessing
+import pathlib
+import queue
+import signal
+import time
+from multiprocessing.process import BaseProcess
+
+from telegram import Bot, Update, error
+
+from src import bot, settings
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд Bot API держит запрос getUpdates, если новых update нет
+POLL_TIMEOUT = 10
+# Через сколько секунд ожидания места в очереди шарда напоминать в логе, что шард отстает
+BACKPRESSURE_LOG_INTERVAL = 5
+# Как часто супервизор проверяет, что процессы живы, секунды
+WATCH_INTERVAL = 1
+
+
+def shard_of(update: Update, shards: int) -> int:
+    """Номер шарда для update: все update одного пользователя обрабатывает один и тот же шард.
+
+    Поэтому очередность update пользователя, его user_data и состояние диалогов меню остаются в одном процессе.
+    """
+    if update.effective_user is not None:
+        key = update.effective_user.id
+    elif update.effective_chat is not None:
+        key = update.effective_chat.id
+    else:
+        key = 0
+    return key % shards
+
+
+def _put(shard_queue: multiprocessing.Queue, number: int, data: dict) -> None:
+    while True:
+        try:
+            shard_queue.put(data, timeout=BACKPRESSURE_LOG_INTERVAL)
+            return
+        except queue.Full:
+            logger.warning("Шард %s не успевает обрабатывать update, прием update приостановлен", number)
+
+
+async def _ingress(queues: list[multiprocessing.Queue], stopping) -> None:
+    """Забирает update через getUpdates и раскладывает их по очередям шардов.
+
+    Очереди шардов ограничены: если шард отстает, прием update останавливается, пока в его очереди не освободится
+    место, и update копятся на стороне Telegram. offset сдвигается только после того, как update попал в очередь
+    шарда, поэтому при остановке приема ни один полученный update не теряется.
+    """
+    loop = asyncio.get_running_loop()
+    offset = None
+    config = settings.get_settings()
+    async with Bot(config.BOT_TOKEN, base_url=config.BOT_API_BASE_URL) as telegram_bot:
+        while not stopping.is_set():
+            try:
+                updates = await telegram_bot.get_updates(
+                    offset=offset,
+                    timeout=POLL_TIMEOUT,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            except error.RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except error.TelegramError as e:
+                logger.warning("Не удалось получить update: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                number = shard_of(update, len(queues))
+                await loop.run_in_executor(None, _put, queues[number], number, update.to_dict())
+                offset = update.update_id + 1
+        if offset is not None:
+            # Подтверждает получение последних update, чтобы после перезапуска они не пришли снова
+            await telegram_bot.get_updates(offset=offset, timeout=0, allowed_updates=Update.ALL_TYPES)
+
+
+async def _shard(number: int, shard_queue: multiprocessing.Queue) -> None:
+    """Обрабатывает update из очереди шарда приложением из create_bot(). None в очереди останавливает шард."""
+    application = bot.create_bot()
+    loop = asyncio.get_running_loop()
+    # Хуки вызываются в том же порядке, что и в run_polling: post_stop до закрытия клиента Bot API,
+    # post_shutdown после
+    try:
+        async with application:
+            await application.post_init(application)
+            await application.start()
+            logger.info("Шард %s запущен", number)
+            try:
+                while (data := await loop.run_in_executor(None, shard_queue.get)) is not None:
+                    # Очередь приложения тоже ограничена: пока она заполнена, шард не забирает update из своей очереди
+                    await application.update_queue.put(Update.de_json(data, application.bot))
+            finally:
+                await application.stop()
+                await application.post_stop(application)
+    finally:
+        await application.post_shutdown(application)
+
+
+def run_ingress(queues: list[multiprocessing.Queue], stopping) -> None:
+    # Процессы останавливает супервизор, Ctrl+C в терминале приходит всей группе процессов
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_ingress(queues, stopping))
+
+
+def run_shard(number: int, shards: int, shard_queue: multiprocessing.Queue) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    config = settings.get_settings()
+    # Ограничения Bot API общие для всех процессов бота
+    config.RATE_LIMIT_GLOBAL_PER_SECOND /= shards
+    config.RATE_LIMIT_CHANNEL_PER_MINUTE /= shards
+    if config.METRICS_PORT:
+        # Каждый шард отдает метрики на своем порту
+        config.METRICS_PORT += number
+    if config.TRACE_FILE:
+        # Ротация файла не рассчитана на запись из нескольких процессов
+        path = pathlib.Path(config.TRACE_FILE)
+        config.TRACE_FILE = str(path.with_stem(f"{path.stem}-{number}"))
+    asyncio.run(_shard(number, shard_queue))
+
+
+class Supervisor:
+    """Запускает процесс приема update и shards процессов-шардов и перезапускает упавшие процессы.
+
+    Все шарды работают с одной БД: воркеры очереди публикаций любого шарда разбирают общую очередь.
+    """
+
+    def __init__(self, shards: int, queue_size: int) -> None:
+        self._context = multiprocessing.get_context("spawn")
+        self._shards = shards
+        self._queues = [self._context.Queue(queue_size) for _ in range(shards)]
+        self._stopping = self._context.Event()
+        self._ingress: BaseProcess | None = None
+        self._processes: list[BaseProcess] = []
+
+    def _start_ingress(self) -> BaseProcess:
+        process = self._context.Process(target=run_ingress, args=(self._queues, self._stopping), name="ingress")
+        process.start()
+        return process
+
+    def _start_shard(self, number: int) -> BaseProcess:
+        process = self._context.Process(
+            target=run_shard,
+            args=(number, self._shards, self._queues[number]),
+            name=f"shard-{number}",
+        )
+        process.start()
+        return process
+
+    def start(self) -> None:
+        self._processes = [self._start_shard(number) for number in range(self._shards)]
+        self._ingress = self._start_ingress()
+
+    def watch(self) -> None:
+        """Перезапускает упавшие процессы, пока не запрошена остановка.
+
+        update, которые упавший шард успел забрать из своей очереди, но не обработал, теряются.
+        """
+        while not self._stopping.wait(WATCH_INTERVAL):
+            for number, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error("Шард %s завершился с кодом %s, перезапуск", number, process.exitcode)
+                    self._processes[number] = self._start_shard(number)
+            if not self._ingress.is_alive():
+                logger.error("Прием update завершился с кодом %s, перезапуск", self._ingress.exitcode)
+                self._ingress = self._start_ingress()
+
+    def stop(self, timeout: float = 30) -> None:
+        """Останавливает прием update, дожидается, пока шарды обработают свои очереди, и останавливает шарды."""
+        self._stopping.set()
+        if self._ingress is not None:
+            self._ingress.join(POLL_TIMEOUT + timeout)
+            if self._ingress.is_alive():
+                # Прием update ждет места в очереди шарда, который уже не работает
+                self._ingress.terminate()
+        deadline = time.monotonic() + timeout
+        for number, (shard_queue, process) in enumerate(zip(self._queues, self._processes)):
+            # Место в очереди освобождает только работающий шард
+            wait = max(deadline - time.monotonic(), 0) if process.is_alive() else 0
+            try:
+                shard_queue.put(None, timeout=wait)
+            except queue.Full:
+                logger.error("Не удалось передать шарду %s команду остановки: его очередь заполнена", number)
+        for process in self._processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error("Шард %s не остановился за %s с", process.name, timeout)
+                process.terminate()
+
+    def run(self) -> None:
+        """Запускает процессы и следит за ними до KeyboardInterrupt, после чего останавливает их."""
+        self.start()
+        try:
+            self.watch()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import datetime
+import functools
+import logging
+from typing import Iterable
+
+from sqlalchemy import Row
+
+from src import settings
+from src.db import base
+
+logger = logging.getLogger(__name__)
+
+# За сколько последних дней, включая сегодня, показывается статистика /stats
+STATS_DAYS = 7
+
+
+class PostingStats:
+    """Статистика публикаций по пользователям, каналам и дням.
+
+    Запись строки статистики на каждую отправку удвоила бы количество запросов к БД от воркеров очереди.
+    Поэтому счетчики копятся в памяти и раз в flush_interval секунд прибавляются к дневной статистике в БД
+    одним запросом. /stats читает только дневную статистику и не видит публикации последних flush_interval секунд.
+    """
+
+    def __init__(self, flush_interval: float) -> None:
+        self._flush_interval = flush_interval
+        # (account_id, день, chat_id) -> [публикации, неудачи, сумма задержек]
+        self._counters: dict[tuple[int, datetime.date, int], list] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def record(self, account_id: int, chat_id: int, ok: bool, latency: float = 0) -> None:
+        """Учитывает публикацию или окончательную неудачу публикации. latency - задержка публикации, секунды."""
+        counters = self._counters.setdefault((account_id, base.utcnow().date(), chat_id), [0, 0, 0.0])
+        if ok:
+            counters[0] += 1
+            counters[2] += latency
+        else:
+            counters[1] += 1
+
+    async def flush(self) -> None:
+        """Прибавляет накопленные счетчики к статистике в БД."""
+        async with self._flush_lock:
+            counters, self._counters = self._counters, {}
+            if not counters:
+                return
+            rows = [
+                {
+                    "account_id": account_id,
+                    "day": day,
+                    "chat_id": chat_id,
+                    "posts": posts,
+                    "failures": failures,
+                    "latency_total": latency_total,
+                }
+                for (account_id, day, chat_id), (posts, failures, latency_total) in counters.items()
+            ]
+            try:
+                await base.post_stats_repository.add_many(rows)
+            except BaseException:
+                # Незаписанные счетчики будут записаны вместе со следующими
+                for key, (posts, failures, latency_total) in counters.items():
+                    current = self._counters.setdefault(key, [0, 0, 0.0])
+                    current[0] += posts
+                    current[1] += failures
+                    current[2] += latency_total
+                raise
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось записать статистику публикаций")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает периодическую запись и записывает накопленные счетчики."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+
+def stats_summary(rows: Iterable[Row]) -> str:
+    """Текст /stats по строкам (chat_id, название канала, публикации, неудачи, сумма задержек)."""
+    rows = list(rows)
+    if not rows:
+        return f"За последние {STATS_DAYS} дн. публикаций не было"
+    lines = []
+    for chat_id, title, posts, failures, latency_total in rows:
+        latency = f", средняя задержка {latency_total / posts:.1f} с" if posts else ""
+        lines.append(f"'{title or chat_id}': опубликовано {posts}, не удалось {failures}{latency}")
+    posts = sum(row[2] for row in rows)
+    failures = sum(row[3] for row in rows)
+    lines.append(f"Всего: опубликовано {posts}, не удалось {failures}")
+    return f"Публикации за последние {STATS_DAYS} дн.:\n" + "\n".join(lines)
+
+
+async def get_summary(account_id: int) -> str:
+    since = base.utcnow().date() - datetime.timedelta(days=STATS_DAYS - 1)
+    return stats_summary(await base.post_stats_repository.get_summary(account_id, since))
+
+
+@functools.cache
+def get_posting_stats() -> PostingStats:
+    return PostingStats(settings.get_settings().STATS_FLUSH_INTERVAL)
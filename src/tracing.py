@@ -0,0 +1,275 @@
+import asyncio
+import collections
+import contextvars
+import datetime
+import functools
+import itertools
+import json
+import logging
+import logging.handlers
+import pathlib
+import sys
+import threading
+import time
+import uuid
+from types import FrameType
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Трассировки пишутся отдельным логгером в свой файл и не попадают в общий лог
+_trace_logger = logging.getLogger(f"{__name__}.traces")
+_trace_logger.propagate = False
+
+_current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("current_trace", default=None)
+
+
+def _frame_name(frame: FrameType) -> str:
+    # co_qualname появился в Python 3.11, в 3.10 в имени нет класса
+    name = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+    return f"{frame.f_globals.get('__name__', '?')}.{name}"
+
+
+def _loop_task(stack: list[FrameType]) -> list[FrameType]:
+    """Кадры задачи, которую выполняет цикл событий, без кадров самого цикла. Если цикл ждет событий, весь стек."""
+    for number, frame in enumerate(stack):
+        if frame.f_code is _HANDLE_RUN:
+            return stack[:number]
+    return stack
+
+
+_HANDLE_RUN = asyncio.Handle._run.__code__
+
+
+class SamplingProfiler:
+    """Статистический профилировщик потока цикла событий.
+
+    Пока профилируется хотя бы одна трассировка, отдельный поток каждые interval секунд снимает стек потока цикла
+    событий. Если в стеке есть задача трассировки, отсчет засчитывается ее стеку, иначе - стеку того, чем занят
+    цикл событий (другие задачи или ожидание событий в select). Ожидание ответа БД или Bot API внутри трассировки
+    в профиль не попадает, его показывают span трассировки.
+    """
+
+    def __init__(self) -> None:
+        self.every = 0
+        self.slower_than = 0.0
+        self._directory = pathlib.Path()
+        self._interval = 0.005
+        self._count = itertools.count(1)
+        self._loop_thread_id: int | None = None
+        # Корневой кадр задачи трассировки -> количество отсчетов по стекам
+        self._profiles: dict[FrameType, collections.Counter[str]] = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.every or self.slower_than)
+
+    def start(self, every: int, slower_than: float, directory: str, interval: float) -> None:
+        """Включает профилирование каждой every-й трассировки и трассировок дольше slower_than секунд.
+        Профили сохраняются в directory. При every=0 и slower_than=0 профилирование выключено.
+        """
+        self.every = every
+        self.slower_than = slower_than
+        self._directory = pathlib.Path(directory)
+        self._interval = interval
+        if self.enabled and self._thread is None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            self._loop_thread_id = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def should_profile(self) -> bool:
+        """Профилировать ли следующую трассировку. Трассировки дольше slower_than заранее не известны, поэтому
+        при заданном slower_than профилируется каждая, а сохраняются только медленные.
+        """
+        return bool(self.slower_than) or (bool(self.every) and next(self._count) % self.every == 0)
+
+    def begin(self, root: FrameType) -> None:
+        with self._lock:
+            self._profiles[root] = collections.Counter()
+            self._active.set()
+
+    def end(self, root: FrameType) -> collections.Counter[str]:
+        with self._lock:
+            samples = self._profiles.pop(root)
+            if not self._profiles:
+                self._active.clear()
+        return samples
+
+    def dump(self, trace: "Trace", samples: collections.Counter[str]) -> pathlib.Path:
+        """Сохраняет отсчеты в формате свернутых стеков (flamegraph.pl, speedscope) и возвращает путь к файлу."""
+        path = self._directory / f"{trace.started_at:%Y%m%d-%H%M%S}-{trace.name}-{trace.trace_id}.folded"
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in samples.most_common()))
+        return path
+
+    def _run(self) -> None:
+        while True:
+            self._active.wait()
+            time.sleep(self._interval)
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame)
+                frame = frame.f_back
+            with self._lock:
+                for root, samples in self._profiles.items():
+                    if root in stack:
+                        names = [_frame_name(item) for item in reversed(stack[: stack.index(root) + 1])]
+                    else:
+                        names = ["(цикл событий)", *(_frame_name(item) for item in reversed(_loop_task(stack)))]
+                    samples[";".join(names)] += 1
+
+
+class Trace:
+    """Трассировка обработки одного update или одной пачки публикаций: span вызовов внутри нее."""
+
+    def __init__(self, name: str, profile: bool, attributes: dict[str, Any]) -> None:
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = attributes
+        self.spans: list[dict[str, Any]] = []
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self._profile = profile
+        self._root: FrameType | None = None
+        self._started = 0.0
+        self._token: contextvars.Token | None = None
+
+    def offset(self) -> float:
+        return time.perf_counter() - self._started
+
+    def __enter__(self) -> "Trace":
+        self._started = time.perf_counter()
+        self._token = _current_trace.set(self)
+        task = asyncio.current_task()
+        if self._profile and task is not None:
+            self._root = task.get_coro().cr_frame
+            profiler.begin(self._root)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        duration = self.offset()
+        _current_trace.reset(self._token)
+        record = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 3),
+            **self.attributes,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        if self._root is not None:
+            samples = profiler.end(self._root)
+            if samples and (not profiler.slower_than or duration >= profiler.slower_than):
+                record["profile"] = str(profiler.dump(self, samples))
+                logger.info(
+                    "Профиль %s %s, %.0f мс: %s",
+                    self.name,
+                    self.attributes,
+                    duration * 1000,
+                    record["profile"],
+                )
+        record["spans"] = self.spans
+        if tracer.enabled:
+            _trace_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class Span:
+    def __init__(self, trace: Trace, name: str) -> None:
+        self._trace = trace
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = self._trace.offset()
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        span = {
+            "name": self._name,
+            "start_ms": round(self._start * 1000, 3),
+            "duration_ms": round((self._trace.offset() - self._start) * 1000, 3),
+        }
+        if exc_type is not None:
+            span["error"] = exc_type.__name__
+        self._trace.spans.append(span)
+
+
+class _NoTrace:
+    """Заменяет трассировку и span, когда трассировка выключена."""
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        pass
+
+
+_NO_TRACE = _NoTrace()
+
+
+class Tracer:
+    """Пишет трассировки в JSONL-файл, по одной строке на трассировку, с ротацией по размеру файла."""
+
+    def __init__(self) -> None:
+        self._handler: logging.Handler | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._handler is not None
+
+    def start(self, path: str, max_bytes: int, backups: int) -> None:
+        """Включает запись трассировок в path. При пустом path трассировки не пишутся."""
+        if not path or self._handler is not None:
+            return
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        _trace_logger.addHandler(self._handler)
+        _trace_logger.setLevel(logging.INFO)
+
+    def stop(self) -> None:
+        if self._handler is not None:
+            _trace_logger.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = None
+
+
+tracer = Tracer()
+profiler = SamplingProfiler()
+
+
+def trace(name: str, **attributes: Any) -> Trace | _NoTrace:
+    """Начинает трассировку, если включена запись трассировок или профилирование.
+
+    Вызовы span() внутри трассировки, в том числе из задач, созданных внутри нее, попадают в эту трассировку.
+    """
+    profile = profiler.enabled and profiler.should_profile()
+    if not tracer.enabled and not profile:
+        return _NO_TRACE
+    return Trace(name, profile, attributes)
+
+
+def span(name: str) -> Span | _NoTrace:
+    """Отрезок трассировки текущего update. Вне трассировки ничего не делает."""
+    current = _current_trace.get()
+    return _NO_TRACE if current is None else Span(current, name)
+
+
+def traced(name: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """Оборачивает корутину в span с именем name."""
+
+    def decorator(function: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(function)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            current = _current_trace.get()
+            if current is None:
+                return await function(*args, **kwargs)
+            with Span(current, name):
+                return await function(*args, **kwargs)
+
+        wrapper.span_name = name
+        return wrapper
+
+    return decorator
@@ -0,0 +1,159 @@
+import asyncio
+import contextlib
+import logging
+from typing import Any, Awaitable
+
+from telegram import Update, error
+from telegram.ext import BaseUpdateProcessor
+
+from src import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# Ответ пользователю, у которого накопилось больше update, чем USER_QUEUE_LIMIT
+SLOW_DOWN_TEXT = (
+    "Слишком много сообщений подряд: бот еще не обработал предыдущие. "
+    "Часть сообщений пропущена, отправьте их повторно немного позже."
+)
+
+
+def _user_id(update: object) -> int | None:
+    if isinstance(update, Update) and update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class UpdateQueue(asyncio.Queue):
+    """Очередь update приложения, которая ограничивает количество update в обработке.
+
+    Application забирает update из очереди сразу и создает задачу на каждый, поэтому без ограничения maxsize
+    очереди не тормозит прием update: при разборе накопленных за время простоя update все они становятся задачами.
+    Эта очередь не отдает следующий update, пока max_pending уже отданных не обработаны (task_done). Тогда очередь
+    заполняется, и прием update через getUpdates, webhook или очередь шарда приостанавливается.
+    """
+
+    def __init__(self, maxsize: int, max_pending: int) -> None:
+        super().__init__(maxsize)
+        self._max_pending = max_pending
+        self._released = asyncio.Event()
+
+    @property
+    def pending(self) -> int:
+        """Update в очереди и в обработке."""
+        return self._unfinished_tasks
+
+    def _in_progress(self) -> int:
+        return self._unfinished_tasks - self.qsize()
+
+    async def get(self) -> Any:
+        while self._in_progress() >= self._max_pending:
+            self._released.clear()
+            await self._released.wait()
+        return await super().get()
+
+    def task_done(self) -> None:
+        super().task_done()
+        self._released.set()
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает update разных пользователей параллельно, а update одного пользователя - строго по очереди.
+
+    Для каждого пользователя хранится только событие завершения его последнего update. Следующий update того же
+    пользователя ждет это событие, не занимая место в общем лимите max_concurrent_updates. Когда у пользователя
+    не остается необработанных update, запись о нем удаляется.
+
+    У одного пользователя может ждать обработки не больше user_queue_limit update. Следующие update пропускаются,
+    а пользователь один раз получает просьбу не торопиться, пока его очередь не разберется. Из нескольких нажатий
+    кнопок меню, ждущих обработки, обрабатывается только последнее: пока нажатие ждет, бот не показал меню,
+    на которое рассчитаны следующие нажатия, поэтому все они относятся к одному устаревшему меню.
+    """
+
+    __slots__ = ("_tails", "_pending", "_throttled", "_last_callback", "_user_queue_limit")
+
+    def __init__(self, max_concurrent_updates: int, user_queue_limit: int) -> None:
+        super().__init__(max_concurrent_updates)
+        self._tails: dict[int, asyncio.Event] = {}
+        # user_id -> количество update пользователя в обработке и в очереди
+        self._pending: dict[int, int] = {}
+        # Пользователи, которым уже отправлена просьба не торопиться
+        self._throttled: set[int] = set()
+        # user_id -> update_id последнего нажатия кнопки, ждущего обработки
+        self._last_callback: dict[int, int] = {}
+        self._user_queue_limit = user_queue_limit
+
+    @property
+    def active_users(self) -> int:
+        """Количество пользователей, у которых есть update в обработке или в очереди."""
+        return len(self._tails)
+
+    # Очередность нужно зафиксировать до ожидания общего семафора: Application создает задачи в порядке получения
+    # update, и синхронная часть этого метода выполняется в том же порядке
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:  # type: ignore[misc]
+        user_id = _user_id(update)
+        with tracing.trace("update", update_id=getattr(update, "update_id", None), user_id=user_id):
+            try:
+                await self._process_update(update, user_id, coroutine)
+            finally:
+                metrics.updates_processed.inc()
+
+    async def _process_update(self, update: object, user_id: int | None, coroutine: Awaitable[Any]) -> None:
+        if user_id is None:
+            await super().process_update(update, coroutine)
+            return
+        if self._pending.get(user_id, 0) >= self._user_queue_limit:
+            coroutine.close()
+            metrics.updates_shed.inc(reason="user_queue_full")
+            await self._slow_down(update, user_id)
+            return
+        self._pending[user_id] = self._pending.get(user_id, 0) + 1
+        if update.callback_query is not None:
+            self._last_callback[user_id] = update.update_id
+        previous = self._tails.get(user_id)
+        done = self._tails[user_id] = asyncio.Event()
+        try:
+            if previous is not None:
+                await previous.wait()
+            if update.callback_query is not None and self._last_callback[user_id] != update.update_id:
+                coroutine.close()
+                metrics.updates_shed.inc(reason="stale_callback")
+                # Без ответа клиент пользователя показывает загрузку на кнопке, пока не истечет ожидание
+                with contextlib.suppress(error.TelegramError):
+                    await update.callback_query.answer()
+            else:
+                await super().process_update(update, coroutine)
+        finally:
+            done.set()
+            if self._tails.get(user_id) is done:
+                del self._tails[user_id]
+            self._pending[user_id] -= 1
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+                self._throttled.discard(user_id)
+                self._last_callback.pop(user_id, None)
+
+    async def _slow_down(self, update: Update, user_id: int) -> None:
+        if user_id in self._throttled:
+            return
+        self._throttled.add(user_id)
+        logger.warning(
+            "У пользователя %s больше %s update в очереди, update пропускаются",
+            user_id,
+            self._user_queue_limit,
+        )
+        chat_id = update.effective_chat.id if update.effective_chat else user_id
+        try:
+            await update.get_bot().send_message(chat_id=chat_id, text=SLOW_DOWN_TEXT)
+        except error.TelegramError as e:
+            logger.warning("Не удалось попросить пользователя %s не торопиться: %s", user_id, e)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Начало span показывает, сколько update ждал предыдущие update пользователя и место в общем лимите
+        with tracing.span("dispatch"):
+            await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass